@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Post, Comment, Tag, Subscriber, Analytics
+from .models import User, Post, Comment, Tag, Subscriber, Analytics, NewsletterCampaign, NewsletterDelivery
 
 
 @admin.register(User)
@@ -48,4 +48,20 @@ class SubscriberAdmin(admin.ModelAdmin):
 class AnalyticsAdmin(admin.ModelAdmin):
     list_display = ['date', 'total_posts', 'total_comments', 'total_views', 'new_subscribers']
     list_filter = ['date']
-    ordering = ['-date']
\ No newline at end of file
+    ordering = ['-date']
+
+
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject']
+    ordering = ['-created_at']
+
+
+@admin.register(NewsletterDelivery)
+class NewsletterDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['email', 'campaign', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['email']
+    raw_id_fields = ['campaign']
@@ -0,0 +1,238 @@
+"""
+Daily rollups of blog totals into ``Analytics``.
+
+Each row describes the end of one day in the site's time zone:
+``total_posts``, ``total_comments`` and ``total_views`` are running totals
+as of that day and ``new_subscribers`` counts the sign-ups of that day.
+
+``rollup()`` computes a range of days from the source tables and upserts
+them, so it can be re-run at any time; ``backfill()`` walks history in
+chunks of days, carrying the running totals from one chunk to the next.
+Between runs, hooks in ``blog.signals`` keep today's row current with
+``F()`` increments (see ``record()``), which lets the dashboard read one row
+instead of aggregating over every post, comment and subscriber.
+
+``Post.views`` is a lifetime total, so ``total_views`` can only be
+snapshotted going forward: rolling up today stores the live sum of
+``Post.views`` and past days keep whatever was recorded on them. Views per
+post and day are kept in ``PostViewDaily`` by the view counter's flushes;
+``top_posts()`` and ``post_series()`` query those rows, and ``trend()`` takes
+its daily views from them.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Analytics, Comment, Post, PostViewDaily, Subscriber
+
+# Running totals: field -> (model, timestamp field)
+TOTALS = {
+    'total_posts': (Post, 'created_at'),
+    'total_comments': (Comment, 'created_at'),
+}
+NEW_SUBSCRIBERS = (Subscriber, 'subscribed_at')
+
+BACKFILL_CHUNK_DAYS = 90
+
+
+def start_of(day):
+    """Aware midnight at the beginning of ``day`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def daily_counts(model, field, start, end):
+    """{date: rows created that day} for ``start <= date <= end``"""
+    rows = (
+        model._default_manager
+        .filter(**{f'{field}__gte': start_of(start), f'{field}__lt': start_of(end + timedelta(days=1))})
+        .annotate(day=TruncDate(field))
+        .values('day')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    return {row['day']: row['count'] for row in rows}
+
+
+def count_before(model, field, day):
+    return model._default_manager.filter(**{f'{field}__lt': start_of(day)}).count()
+
+
+def compute(start, end, carried=None):
+    """
+    Rows for ``start`` through ``end`` as unsaved ``Analytics`` instances.
+    ``carried`` holds the running totals as of the day before ``start``;
+    they are counted when not given. Returns (rows, running totals at ``end``).
+    """
+    running = dict(carried) if carried else {
+        name: count_before(model, field, start) for name, (model, field) in TOTALS.items()
+    }
+    created = {name: daily_counts(model, field, start, end) for name, (model, field) in TOTALS.items()}
+    subscribers = daily_counts(*NEW_SUBSCRIBERS, start, end)
+
+    rows = []
+    day = start
+    while day <= end:
+        for name in TOTALS:
+            running[name] += created[name].get(day, 0)
+        rows.append(Analytics(date=day, new_subscribers=subscribers.get(day, 0), **running))
+        day += timedelta(days=1)
+    return rows, running
+
+
+def save_rows(rows):
+    """Upsert ``rows``; only today's row gets a fresh view total"""
+    current_day = timezone.localdate()
+    fields = [*TOTALS, 'new_subscribers']
+    past = [row for row in rows if row.date != current_day]
+    current = [row for row in rows if row.date == current_day]
+    if past:
+        Analytics.objects.bulk_create(past, update_conflicts=True, unique_fields=['date'], update_fields=fields)
+    if current:
+        current[0].total_views = Post.objects.aggregate(total=Sum('views'))['total'] or 0
+        Analytics.objects.bulk_create(
+            current, update_conflicts=True, unique_fields=['date'], update_fields=[*fields, 'total_views'],
+        )
+
+
+def rollup(start, end=None, carried=None):
+    """Recompute the rows of ``start`` through ``end`` (default: just ``start``)"""
+    rows, running = compute(start, end or start, carried)
+    with transaction.atomic():
+        save_rows(rows)
+    return running
+
+
+def first_day():
+    """Earliest day anything was created, or None on an empty blog"""
+    days = [
+        model._default_manager.aggregate(first=Min(field))['first']
+        for model, field in [*TOTALS.values(), NEW_SUBSCRIBERS]
+    ]
+    days = [timezone.localdate(value) for value in days if value]
+    return min(days) if days else None
+
+
+def backfill(start=None, end=None, chunk_days=None, progress=None):
+    """
+    Roll up every day from ``start`` (default: the first activity) to ``end``
+    (default: today), ``chunk_days`` at a time. Returns the number of days.
+    """
+    start = start or first_day()
+    end = end or timezone.localdate()
+    if start is None or start > end:
+        return 0
+    chunk = timedelta(days=(chunk_days or BACKFILL_CHUNK_DAYS) - 1)
+
+    carried = None
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + chunk, end)
+        carried = rollup(chunk_start, chunk_end, carried)
+        if progress:
+            progress(chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+    return (end - start).days + 1
+
+
+def today_row():
+    """Today's row, rolled up on first use"""
+    row = Analytics.objects.filter(date=timezone.localdate()).first()
+    if row is None:
+        rollup(timezone.localdate())
+        row = Analytics.objects.get(date=timezone.localdate())
+    return row
+
+
+def record(**increments):
+    """
+    Apply ``increments`` (e.g. ``total_comments=1``) to today's row once the
+    current transaction commits. The first change of a day rolls the row up
+    from scratch instead; that count already includes the change.
+    """
+    increments = {name: value for name, value in increments.items() if value}
+    if not increments:
+        return
+
+    def apply():
+        updated = Analytics.objects.filter(date=timezone.localdate()).update(
+            **{name: F(name) + value for name, value in increments.items()}
+        )
+        if not updated:
+            rollup(timezone.localdate())
+
+    transaction.on_commit(apply)
+
+
+def daily_views(start, end):
+    """{date: views of all posts} for ``start <= date <= end``"""
+    rows = (
+        PostViewDaily.objects.filter(date__gte=start, date__lte=end)
+        .values('date').annotate(total=Sum('views')).order_by()
+    )
+    return {row['date']: row['total'] for row in rows}
+
+
+def top_posts(days=7, limit=5):
+    """
+    The most viewed posts of the last ``days`` days (today included), as
+    ``Post`` instances with ``recent_views`` set, best first.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    ranking = list(
+        PostViewDaily.objects.filter(date__gte=since)
+        .values('post_id').annotate(total=Sum('views'))
+        .order_by('-total', 'post_id')[:limit]
+    )
+    posts = Post.objects.select_related('author').defer('content').in_bulk([row['post_id'] for row in ranking])
+    result = []
+    for row in ranking:
+        post = posts.get(row['post_id'])
+        if post is not None:
+            post.recent_views = row['total']
+            result.append(post)
+    return result
+
+
+def post_series(post, days=30):
+    """``[(date, views)]`` of one post for each of the last ``days`` days, oldest first"""
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    views = dict(
+        PostViewDaily.objects.filter(post=post, date__gte=start, date__lte=end).values_list('date', 'views')
+    )
+    return [(start + timedelta(days=offset), views.get(start + timedelta(days=offset), 0)) for offset in range(days)]
+
+
+def trend(days=30):
+    """
+    One entry per day for the last ``days`` days, oldest first, with the day's
+    new posts, comments, subscribers and views. Days without a row had no
+    activity and carry the previous totals forward.
+    """
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    rows = {row.date: row for row in Analytics.objects.filter(date__gte=start - timedelta(days=1), date__lte=end)}
+    previous = rows.get(start - timedelta(days=1)) or Analytics.objects.filter(date__lt=start).first()
+    views = daily_views(start, end)
+
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = rows.get(day) or previous or Analytics(date=day)
+
+        def change(field):
+            # Unknown without an earlier total to compare with
+            return max(getattr(row, field) - getattr(previous, field), 0) if previous else 0
+
+        series.append({
+            'date': day,
+            'posts': change('total_posts'),
+            'comments': change('total_comments'),
+            'subscribers': row.new_subscribers if day in rows else 0,
+            'views': views.get(day, 0),
+        })
+        previous = row
+    return series
@@ -0,0 +1,178 @@
+"""
+Dashboard statistics, computed in as few queries as possible and cached as a
+snapshot with stale-while-revalidate.
+
+``compute_snapshot()`` gathers everything the dashboard shows: the counts
+that don't live in the ``Analytics`` rollup come back from a single
+statement of scalar subqueries, the lists from one query each. The result is
+plain JSON-serializable data, served to the page by ``DashboardStatsView``.
+
+``get_snapshot()`` returns the cached snapshot. Once it is older than
+``DASHBOARD_STATS_TTL`` seconds it is still returned, and one background
+thread per cluster (guarded by a lock key in the shared cache) recomputes
+it; only after a further ``DASHBOARD_STATS_STALE_TTL`` seconds does a
+request wait for fresh numbers.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import Count
+
+from . import analytics
+from .models import Comment, Post, Subscriber, User
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'dashboard:stats'
+LOCK_KEY = 'dashboard:stats:refreshing'
+
+TREND_SERIES = [
+    ('posts', 'New Posts'),
+    ('comments', 'New Comments'),
+    ('subscribers', 'New Subscribers'),
+    ('views', 'Views'),
+]
+
+
+def get_ttl():
+    return getattr(settings, 'DASHBOARD_STATS_TTL', 60)
+
+
+def get_stale_ttl():
+    return getattr(settings, 'DASHBOARD_STATS_STALE_TTL', 600)
+
+
+def snapshot_cache():
+    # Shared so one refresh serves every worker
+    return caches['shared']
+
+
+def scalar_counts(**querysets):
+    """``{name: queryset.count()}`` for every queryset, in one round trip"""
+    selects, params = [], []
+    for name, queryset in querysets.items():
+        sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+        selects.append(f'(SELECT COUNT(*) FROM ({sql}) counted_{name})')
+        params.extend(query_params)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(selects), params)
+        return dict(zip(querysets, cursor.fetchone()))
+
+
+def compute_snapshot():
+    totals = analytics.today_row()
+    counts = scalar_counts(
+        published_posts=Post.objects.filter(status='published'),
+        pending_comments=Comment.objects.filter(approved=False),
+        total_subscribers=Subscriber.objects.filter(is_active=True),
+    )
+
+    posts_by_author = list(
+        User.objects
+        .annotate(post_count=Count('posts'))
+        .filter(post_count__gt=0)
+        .order_by('-post_count')
+        .values('username', 'post_count')[:5]
+    )
+    most_commented = [
+        {'title': title, 'author': author, 'comments': comments}
+        for title, author, comments in
+        Post.objects.filter(approved_comment_count__gt=0)
+        .order_by('-approved_comment_count')
+        .values_list('title', 'author__username', 'approved_comment_count')[:5]
+    ]
+    recent_posts = [
+        {'title': post.title, 'author': post.author.username, 'created_at': post.created_at,
+         'status': post.status, 'status_display': post.get_status_display()}
+        for post in Post.objects.select_related('author').only(
+            'title', 'status', 'created_at', 'author__username',
+        ).order_by('-created_at')[:5]
+    ]
+    recent_comments = [
+        {'name': name, 'post_title': post_title, 'created_at': created_at, 'approved': approved}
+        for name, post_title, created_at, approved in
+        Comment.objects.order_by('-created_at').values_list('name', 'post__title', 'created_at', 'approved')[:5]
+    ]
+    trending_posts = [
+        {'title': post.title, 'author': post.author.username, 'views': post.recent_views}
+        for post in analytics.top_posts(days=7, limit=5)
+    ]
+
+    trend = analytics.trend()
+    trend_series = [
+        {
+            'label': label,
+            'total': sum(day[key] for day in trend),
+            'peak': max(day[key] for day in trend) or 1,
+            'days': [{'date': day['date'], 'value': day[key]} for day in trend],
+        }
+        for key, label in TREND_SERIES
+    ]
+
+    return {
+        'total_posts': totals.total_posts,
+        'total_comments': totals.total_comments,
+        'total_views': totals.total_views,
+        'approved_comments': totals.total_comments - counts['pending_comments'],
+        **counts,
+        'posts_by_author': posts_by_author,
+        'most_commented': most_commented,
+        'recent_posts': recent_posts,
+        'recent_comments': recent_comments,
+        'trending_posts': trending_posts,
+        'trend_series': trend_series,
+    }
+
+
+def refresh_snapshot():
+    snapshot = compute_snapshot()
+    snapshot_cache().set(
+        SNAPSHOT_KEY, {'computed_at': time.time(), 'stats': snapshot}, get_ttl() + get_stale_ttl(),
+    )
+    return snapshot
+
+
+def _refresh_in_background():
+    try:
+        refresh_snapshot()
+    except Exception:
+        logger.exception('Dashboard statistics refresh failed')
+    finally:
+        snapshot_cache().delete(LOCK_KEY)
+        # This thread owns its own database connection; don't leak it
+        connections.close_all()
+
+
+def schedule_refresh():
+    # Lock outlives a crashed refresh by a bounded time only
+    if snapshot_cache().add(LOCK_KEY, True, max(get_ttl(), 30)):
+        threading.Thread(target=_refresh_in_background, name='dashboard-stats', daemon=True).start()
+
+
+def get_snapshot(allow_stale=True):
+    """
+    The cached statistics, recomputing them on the spot only when there are
+    none (or, without ``allow_stale``, when they are past their TTL).
+    """
+    entry = snapshot_cache().get(SNAPSHOT_KEY)
+    if entry is None:
+        return refresh_snapshot()
+    if time.time() - entry['computed_at'] > get_ttl():
+        if not allow_stale:
+            return refresh_snapshot()
+        schedule_refresh()
+    return entry['stats']
+
+
+def cached_snapshot():
+    """The cached statistics if there are any, without ever computing them here"""
+    entry = snapshot_cache().get(SNAPSHOT_KEY)
+    if entry is None:
+        return None
+    if time.time() - entry['computed_at'] > get_ttl():
+        schedule_refresh()
+    return entry['stats']
@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from admin_panel.models import Post
+from admin_panel.newsletter import CampaignRenderer, newsletter_context
+from blog.benchmarks import format_summary, summarize
+
+
+def render_per_recipient(context, recipients):
+    """The previous approach: both templates rendered again for every recipient"""
+    for recipient_email in recipients:
+        email_context = dict(context, recipient_email=recipient_email)
+        message = EmailMultiAlternatives(
+            subject=context['subject'],
+            body=render_to_string('emails/newsletter.txt', email_context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[recipient_email],
+        )
+        message.attach_alternative(render_to_string('emails/newsletter.html', email_context), 'text/html')
+        yield message
+
+
+class Command(BaseCommand):
+    help = 'Compare per-recipient template rendering with render-once newsletters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=5, help='Latest published posts to include')
+        parser.add_argument('--mime', action='store_true', help='Also serialize each message to MIME bytes')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(pk__in=list(
+            Post.objects.filter(status='published').order_by('-published_at').values_list('pk', flat=True)[:options['posts']]
+        ))
+        if not posts:
+            raise CommandError('No published posts to include; seed some data first.')
+
+        recipients = [f'reader{i}@example.com' for i in range(options['recipients'])]
+        context = newsletter_context('Benchmark issue', 'Hello readers', posts, 'https://example.com')
+
+        def measure(label, messages):
+            timings = []
+            started = time.perf_counter()
+            while True:
+                tick = time.perf_counter()
+                message = next(messages, None)
+                if message is None:
+                    break
+                if options['mime']:
+                    message.message().as_bytes()
+                timings.append(time.perf_counter() - tick)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(format_summary(label, summarize(timings)))
+            self.stdout.write(f'{label}: {elapsed:.2f}s total for {len(timings)} message(s)')
+            return elapsed
+
+        legacy = measure('per_recipient', render_per_recipient(context, recipients))
+        started = time.perf_counter()
+        renderer = CampaignRenderer(context)
+        setup = time.perf_counter() - started
+        render_once = measure('render_once', renderer.messages(recipients)) + setup
+
+        sample = recipients[0]
+        expected = next(render_per_recipient(context, [sample]))
+        actual = renderer.message(sample)
+        if (expected.body, expected.alternatives) != (actual.body, actual.alternatives):
+            raise CommandError('Render-once output differs from per-recipient rendering')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'render_once is {legacy / render_once:.1f}x faster ({setup * 1000:.1f}ms one-off render)'
+        ))
@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from admin_panel import analytics
+
+
+class Command(BaseCommand):
+    help = 'Compute the daily Analytics rows; by default yesterday and today, or every day with --backfill'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Recompute history, oldest first')
+        parser.add_argument('--since', type=date.fromisoformat, default=None,
+                            help='First day to compute (YYYY-MM-DD); default: the first activity')
+        parser.add_argument('--until', type=date.fromisoformat, default=None,
+                            help='Last day to compute (YYYY-MM-DD); default: today')
+        parser.add_argument('--chunk-days', type=int, default=analytics.BACKFILL_CHUNK_DAYS,
+                            help='Days computed per batch of queries during a backfill')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1.')
+
+        if not options['backfill']:
+            today = timezone.localdate()
+            # Yesterday too, so late changes around midnight are settled
+            analytics.rollup(today - timedelta(days=1), today)
+            self.stdout.write(self.style.SUCCESS('Rolled up yesterday and today.'))
+            return
+
+        def progress(start, end):
+            self.stdout.write(f'{start} .. {end}')
+
+        days = analytics.backfill(
+            start=options['since'], end=options['until'], chunk_days=options['chunk_days'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {days} day(s).'))
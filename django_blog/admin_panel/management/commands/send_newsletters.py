@@ -0,0 +1,33 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from admin_panel.newsletter import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued newsletters; runs until stopped unless --drain is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'NEWSLETTER_WORKERS', 2),
+            help='Number of concurrent senders, each with its own SMTP connection',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Deliveries claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--drain', action='store_true', help='Exit once nothing is due instead of polling')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        # Finish the batch in hand, then exit; leases cover anything harsher
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            run_workers(
+                concurrency=options['workers'], stop=stop, drain=options['drain'],
+                poll_interval=options['poll_interval'], batch_size=options['batch_size'],
+            )
+        except KeyboardInterrupt:
+            stop.set()
+        self.stdout.write(self.style.SUCCESS('Newsletter worker stopped.'))
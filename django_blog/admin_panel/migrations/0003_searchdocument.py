@@ -0,0 +1,115 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:22
+
+import html
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.html import strip_tags
+
+
+FTS_TABLE = 'admin_panel_searchdocument_fts'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, tags,
+        content='admin_panel_searchdocument', content_rowid='post_id',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER admin_panel_searchdocument_ai AFTER INSERT ON admin_panel_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body, tags) VALUES (new.post_id, new.title, new.body, new.tags);
+    END""",
+    f"""CREATE TRIGGER admin_panel_searchdocument_ad AFTER DELETE ON admin_panel_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, tags) VALUES ('delete', old.post_id, old.title, old.body, old.tags);
+    END""",
+    f"""CREATE TRIGGER admin_panel_searchdocument_au AFTER UPDATE ON admin_panel_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, tags) VALUES ('delete', old.post_id, old.title, old.body, old.tags);
+        INSERT INTO {FTS_TABLE}(rowid, title, body, tags) VALUES (new.post_id, new.title, new.body, new.tags);
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS admin_panel_searchdocument_ai',
+    'DROP TRIGGER IF EXISTS admin_panel_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS admin_panel_searchdocument_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_FORWARD = [
+    'CREATE INDEX admin_panel_searchdocument_vector_gin ON admin_panel_searchdocument USING gin (search_vector)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS admin_panel_searchdocument_vector_gin',
+]
+
+POSTGRES_VECTOR = (
+    "UPDATE admin_panel_searchdocument SET search_vector = "
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', tags), 'B') || "
+    "setweight(to_tsvector('english', body), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Create the vendor-specific full-text index (FTS5 or GIN)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for statement in SQLITE_FORWARD:
+                schema_editor.execute(statement)
+        except Exception:
+            # SQLite built without FTS5: blog.search falls back to a plain scan
+            for statement in SQLITE_BACKWARD:
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def index_published_posts(apps, schema_editor):
+    """Populate the index for posts that existed before search was added"""
+    Post = apps.get_model('admin_panel', 'Post')
+    SearchDocument = apps.get_model('admin_panel', 'SearchDocument')
+    documents = []
+    for post in Post.objects.filter(status='published').prefetch_related('tags').iterator(chunk_size=500):
+        text = ' '.join(html.unescape(strip_tags(post.content or '')).split())
+        documents.append(SearchDocument(
+            post_id=post.pk,
+            title=post.title,
+            body=f'{post.excerpt}\n{text}',
+            tags=' '.join(tag.name for tag in post.tags.all()),
+        ))
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0002_alter_post_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='admin_panel.post')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(help_text='Excerpt and HTML-stripped content')),
+                ('tags', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_published_posts, migrations.RunPython.noop),
+    ]
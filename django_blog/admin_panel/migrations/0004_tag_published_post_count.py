@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:27
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_published_posts(apps, schema_editor):
+    Tag = apps.get_model('admin_panel', 'Tag')
+    tags = Tag.objects.annotate(actual=Count('posts', filter=Q(posts__status='published')))
+    for tag in tags.filter(actual__gt=0):
+        Tag.objects.filter(pk=tag.pk).update(published_post_count=tag.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0003_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-published_post_count'], name='admin_panel_publish_06961c_idx'),
+        ),
+        migrations.RunPython(count_published_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:28
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_approved_comments(apps, schema_editor):
+    Post = apps.get_model('admin_panel', 'Post')
+    posts = Post.objects.annotate(actual=Count('comments', filter=Q(comments__approved=True)))
+    for post in posts.filter(actual__gt=0):
+        Post.objects.filter(pk=post.pk).update(approved_comment_count=post.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0004_tag_published_post_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-approved_comment_count'], name='admin_panel_approve_e7701b_idx'),
+        ),
+        migrations.RunPython(count_approved_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='admin_panel.post')),
+            ],
+            options={
+                'ordering': ['post', 'date'],
+                'indexes': [models.Index(fields=['date', 'post', 'views'], name='admin_panel_date_3a6b77_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postviewdaily',
+            constraint=models.UniqueConstraint(fields=('post', 'date'), name='unique_post_view_day'),
+        ),
+    ]
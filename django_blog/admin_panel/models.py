@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import DatabaseError, models, router, transaction
 from django.urls import reverse
 from django.utils.text import slugify
 from django.utils import timezone
@@ -10,6 +11,8 @@ class User(AbstractUser):
     """Custom user model"""
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Resized copies of profile_picture, written by blog.images
+    profile_picture_variants = models.JSONField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -19,11 +22,53 @@ class User(AbstractUser):
         return reverse('blog:author_posts', kwargs={'author_id': self.id})
 
 
-class Tag(models.Model):
+class CounterFieldsMixin:
+    """
+    Saves of a loaded row leave out ``COUNTER_FIELDS`` and ``DERIVED_FIELDS``:
+    counters only ever change through F() updates and derivatives through
+    queryset updates, so writing back the values loaded with the instance
+    would undo whatever happened since
+    """
+    COUNTER_FIELDS = ()
+    DERIVED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        explicit = args or any(kwargs.get(name) for name in ('force_insert', 'force_update'))
+        if self._state.adding or explicit or kwargs.get('update_fields') is not None:
+            return super().save(*args, **kwargs)
+        excluded = self.COUNTER_FIELDS + self.DERIVED_FIELDS
+        kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in excluded
+        ]
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        try:
+            # A savepoint, so the transaction survives an update of no rows
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+        except DatabaseError:
+            # Deleted since it was loaded: there's nothing left to preserve,
+            # and a plain save inserts the row again
+            if type(self)._base_manager.using(using).filter(pk=self.pk).exists():
+                raise
+            del kwargs['update_fields']
+            super().save(*args, **kwargs)
+
+
+class Tag(CounterFieldsMixin, models.Model):
     """Tag model for categorizing posts"""
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by blog.signals; repair drift with `manage.py reconcile_counters`
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-published_post_count']),
+        ]
+    
+    COUNTER_FIELDS = ('published_post_count',)
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -37,7 +82,7 @@ class Tag(models.Model):
         return reverse('blog:tag_posts', kwargs={'slug': self.slug})
 
 
-class Post(models.Model):
+class Post(CounterFieldsMixin, models.Model):
     """Blog post model"""
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -50,27 +95,53 @@ class Post(models.Model):
     content = RichTextUploadingField()
     excerpt = models.TextField(max_length=300, help_text="Brief description of the post")
     featured_image = models.ImageField(upload_to='post_images/', blank=True, null=True)
+    # Resized copies of featured_image, written by blog.images
+    featured_image_variants = models.JSONField(null=True, blank=True, editable=False)
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(blank=True, null=True)
     views = models.PositiveIntegerField(default=0)
+    # Maintained by blog.signals; repair drift with `manage.py reconcile_counters`
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
+            # Keyset pages of the public listings: status filter, then sort key
+            models.Index(fields=['status', '-created_at', '-id']),
             models.Index(fields=['status']),
             models.Index(fields=['slug']),
+            models.Index(fields=['-approved_comment_count']),
         ]
     
+    COUNTER_FIELDS = ('views', 'approved_comment_count')
+    # Written in the background by queryset updates, never through save()
+    DERIVED_FIELDS = ('featured_image_variants',)
+    
+    # Status and slug as last read from / written to the database; lets signal
+    # handlers tell a publish or unpublish apart from an ordinary edit, and
+    # find the old URL of a renamed post
+    _loaded_status = None
+    _loaded_slug = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_slug = instance.__dict__.get('slug')
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
         super().save(*args, **kwargs)
+        self._loaded_status = self.status
+        self._loaded_slug = self.slug
     
     def __str__(self):
         return self.title
@@ -78,8 +149,66 @@ class Post(models.Model):
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'slug': self.slug})
     
+    def status_changed(self):
+        """Whether the post was published or unpublished since it was loaded"""
+        return (self._loaded_status == 'published') != (self.status == 'published')
+    
     def get_comment_count(self):
-        return self.comments.filter(approved=True).count()
+        return self.approved_comment_count
+
+
+class SearchDocument(models.Model):
+    """Plain-text copy of a published post, indexed for full-text search"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=200)
+    body = models.TextField(help_text="Excerpt and HTML-stripped content")
+    tags = models.TextField(blank=True)
+    # Only populated (and GIN-indexed) on PostgreSQL; SQLite uses an FTS5 table
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f'Search document for {self.title}'
+
+
+class RelatedPost(models.Model):
+    """Precomputed nearest neighbours of a post by weighted tag overlap"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [
+            models.Index(fields=['post', 'rank']),
+        ]
+    
+    def __str__(self):
+        return f'{self.related} related to {self.post}'
+
+
+class PostViewDaily(models.Model):
+    """Views of one post on one day, added to by blog.view_counter on every flush"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_views')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['post', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'date'], name='unique_post_view_day'),
+        ]
+        indexes = [
+            # Covers "top posts since <date>" without touching the table
+            models.Index(fields=['date', 'post', 'views']),
+        ]
+    
+    def __str__(self):
+        return f'{self.views} views of {self.post} on {self.date}'
 
 
 class Comment(models.Model):
@@ -91,6 +220,12 @@ class Comment(models.Model):
     approved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Approval state as last read from / written to the database, and whether
+    # the last save changed it there, so signal handlers know whether a save
+    # approved or unapproved the comment
+    _loaded_approved = False
+    _approval_changed = False
+    
     class Meta:
         ordering = ['created_at']
         indexes = [
@@ -98,6 +233,29 @@ class Comment(models.Model):
             models.Index(fields=['-created_at']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_approved = instance.__dict__.get('approved', False)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        plain = not args and not any(kwargs.get(name) for name in ('force_insert', 'force_update', 'update_fields'))
+        if self._state.adding or self.approved == self._loaded_approved or not plain:
+            self._approval_changed = self.approved != self._loaded_approved
+            super().save(*args, **kwargs)
+        else:
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            with transaction.atomic(using=using):
+                # Only the save that flips the stored value counts: two admins
+                # approving the same comment at once must add one, not two
+                flipped = type(self)._base_manager.using(using).filter(
+                    pk=self.pk, approved=self._loaded_approved,
+                ).update(approved=self.approved)
+                self._approval_changed = bool(flipped)
+                super().save(*args, **kwargs)
+        self._loaded_approved = self.approved
+    
     def __str__(self):
         return f'Comment by {self.name} on {self.post.title}'
 
@@ -108,6 +266,11 @@ class Subscriber(models.Model):
     subscribed_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['-subscribed_at', '-id']),
+        ]
+    
     def __str__(self):
         return self.email
 
@@ -125,4 +288,63 @@ class Analytics(models.Model):
         verbose_name_plural = 'Analytics'
     
     def __str__(self):
-        return f'Analytics for {self.date}'
\ No newline at end of file
+        return f'Analytics for {self.date}'
+
+
+class NewsletterCampaign(models.Model):
+    """A newsletter queued for delivery to a set of subscribers"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('completed', 'Completed'),
+    ]
+
+    subject = models.CharField(max_length=200)
+    message = models.TextField(blank=True)
+    posts = models.ManyToManyField(Post, blank=True, related_name='newsletter_campaigns')
+    site_url = models.CharField(max_length=200)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.subject
+
+
+class NewsletterDelivery(models.Model):
+    """One recipient of a campaign; the unit of work of the delivery queue"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(NewsletterCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the row; an expired lease means the worker died
+    claim_token = models.CharField(max_length=32, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Newsletter deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'email'], name='unique_campaign_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f'{self.email} ({self.status})'
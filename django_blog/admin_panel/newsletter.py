@@ -0,0 +1,317 @@
+"""
+Database-backed newsletter delivery queue.
+
+Sending a newsletter only queues it: ``queue_campaign()`` stores a
+``NewsletterCampaign`` and one ``NewsletterDelivery`` row per recipient, and
+``python manage.py send_newsletters`` delivers them in the background.
+
+Each worker claims a batch of due deliveries by stamping them with a claim
+token and a lease, sends the batch over one reused SMTP connection and
+records the outcome. Failed addresses are retried with exponential backoff
+(``NEWSLETTER_RETRY_DELAY`` seconds, doubling) until ``NEWSLETTER_MAX_ATTEMPTS``
+is reached. A worker that dies mid-batch leaves its lease to expire after
+``NEWSLETTER_LEASE_SECONDS``, at which point any worker picks the batch up
+again, so delivery is at-least-once: a crash can resend part of one batch.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import escape
+
+from django_blog import metrics
+
+from .models import NewsletterCampaign, NewsletterDelivery
+
+logger = logging.getLogger(__name__)
+
+# Statuses that still have work to do
+OPEN_STATUSES = ('pending', 'sending')
+
+# Stands in for the recipient's address while a campaign's bodies are rendered
+RECIPIENT_PLACEHOLDER = 'NEWSLETTER-RECIPIENT-f3a9c1'
+
+
+def get_batch_size():
+    return getattr(settings, 'NEWSLETTER_BATCH_SIZE', 50)
+
+
+def get_max_attempts():
+    return getattr(settings, 'NEWSLETTER_MAX_ATTEMPTS', 5)
+
+
+def get_retry_delay():
+    return getattr(settings, 'NEWSLETTER_RETRY_DELAY', 60)
+
+
+def get_lease_seconds():
+    return getattr(settings, 'NEWSLETTER_LEASE_SECONDS', 300)
+
+
+def retry_backoff(attempts):
+    """Delay before the next try of an address that has failed ``attempts`` times"""
+    return timedelta(seconds=get_retry_delay() * 2 ** (attempts - 1))
+
+
+def queue_campaign(subject, message, posts, site_url, recipients, created_by=None):
+    """Store a campaign and its deliveries; nothing is sent here"""
+    with transaction.atomic():
+        campaign = NewsletterCampaign.objects.create(
+            subject=subject, message=message, site_url=site_url, created_by=created_by,
+        )
+        campaign.posts.set(posts)
+        NewsletterDelivery.objects.bulk_create(
+            [NewsletterDelivery(campaign=campaign, email=email) for email in dict.fromkeys(recipients)],
+            batch_size=500,
+        )
+    metrics.NEWSLETTER_RECIPIENTS_QUEUED.inc(len(dict.fromkeys(recipients)))
+    return campaign
+
+
+def claimable(now):
+    """Due deliveries, plus those held by a worker whose lease ran out"""
+    return Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', lease_expires_at__lt=now)
+
+
+def claim_batch(batch_size=None):
+    """
+    Take ownership of up to ``batch_size`` due deliveries. The UPDATE re-checks
+    the claimable condition, so two workers racing for the same rows can't
+    both win them.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        NewsletterDelivery.objects.filter(claimable(now))
+        .order_by('next_attempt_at', 'pk')
+        .values_list('pk', flat=True)[:batch_size or get_batch_size()]
+    )
+    ids = list(due)
+    if not ids:
+        return token, []
+    NewsletterDelivery.objects.filter(claimable(now), pk__in=ids).update(
+        status='sending', claim_token=token, lease_expires_at=now + timedelta(seconds=get_lease_seconds()),
+    )
+    deliveries = list(NewsletterDelivery.objects.filter(claim_token=token).order_by('pk'))
+    return token, deliveries
+
+
+def newsletter_context(subject, message, posts, site_url):
+    """Template context shared by every recipient of a newsletter"""
+    posts = list(posts.select_related('author').prefetch_related('tags').order_by('-published_at'))
+    for post in posts:
+        post.featured_image_url = urljoin(site_url + '/', post.featured_image.url) if post.featured_image else ''
+    return {
+        'subject': subject,
+        'message': message,
+        'posts': posts,
+        'site_url': site_url,
+        'blog_name': getattr(settings, 'BLOG_NAME', 'Django Blog'),
+    }
+
+
+def campaign_context(campaign):
+    return newsletter_context(campaign.subject, campaign.message, campaign.posts.all(), campaign.site_url)
+
+
+class CampaignRenderer:
+    """
+    Renders a campaign's HTML and text bodies once, with a placeholder where
+    the recipient's address goes; each message is then a few string joins
+    instead of two template renders.
+    """
+
+    def __init__(self, context):
+        self.subject = context['subject']
+        email_context = dict(context, recipient_email=RECIPIENT_PLACEHOLDER)
+        self._text = render_to_string('emails/newsletter.txt', email_context).split(RECIPIENT_PLACEHOLDER)
+        self._html = render_to_string('emails/newsletter.html', email_context).split(RECIPIENT_PLACEHOLDER)
+
+    @classmethod
+    def for_campaign(cls, campaign):
+        return cls(campaign_context(campaign))
+
+    def render(self, recipient_email):
+        """``(text, html)`` bodies for one recipient"""
+        # Same escaping the templates would have applied to the real address
+        value = escape(recipient_email)
+        return value.join(self._text), value.join(self._html)
+
+    def message(self, recipient_email, connection=None):
+        text, html = self.render(recipient_email)
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=text,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[recipient_email],
+            connection=connection,
+        )
+        message.attach_alternative(html, 'text/html')
+        return message
+
+    def messages(self, recipients, connection=None):
+        """Lazily yield one message per recipient"""
+        for recipient_email in recipients:
+            yield self.message(recipient_email, connection)
+
+
+def record_failure(delivery, token, error):
+    attempts = delivery.attempts + 1
+    if attempts >= get_max_attempts():
+        status, next_attempt_at = 'failed', delivery.next_attempt_at
+        metrics.NEWSLETTER_FAILURES.inc(outcome='failed')
+    else:
+        status, next_attempt_at = 'pending', timezone.now() + retry_backoff(attempts)
+        metrics.NEWSLETTER_FAILURES.inc(outcome='retry')
+    NewsletterDelivery.objects.filter(pk=delivery.pk, claim_token=token).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at,
+        last_error=str(error)[:1000], claim_token='', lease_expires_at=None,
+    )
+
+
+def release(token, delivery_ids, error):
+    """Hand deliveries back without charging an attempt, e.g. when the mail server is down"""
+    NewsletterDelivery.objects.filter(pk__in=delivery_ids, claim_token=token).update(
+        status='pending', next_attempt_at=timezone.now() + timedelta(seconds=get_retry_delay()),
+        last_error=str(error)[:1000], claim_token='', lease_expires_at=None,
+    )
+
+
+def send_batch(token, deliveries, connection, renderers=None):
+    """
+    Send claimed deliveries over ``connection``; returns how many were sent.
+    ``renderers`` caches one ``CampaignRenderer`` per campaign across batches.
+    """
+    renderers = {} if renderers is None else renderers
+    sent = []
+    for index, delivery in enumerate(deliveries):
+        try:
+            # No-op while the session is up; reconnects after a failure closed it
+            connection.open()
+        except Exception as exc:
+            logger.warning('Mail server unavailable: %s', exc)
+            release(token, [d.pk for d in deliveries[index:]], exc)
+            break
+
+        try:
+            if delivery.campaign_id not in renderers:
+                renderers[delivery.campaign_id] = CampaignRenderer.for_campaign(delivery.campaign)
+            message = renderers[delivery.campaign_id].message(delivery.email, connection)
+            connection.send_messages([message])
+        except Exception as exc:
+            logger.info('Newsletter to %s failed: %s', delivery.email, exc)
+            record_failure(delivery, token, exc)
+            connection.close()
+        else:
+            sent.append(delivery.pk)
+
+    NewsletterDelivery.objects.filter(pk__in=sent, claim_token=token).update(
+        status='sent', sent_at=timezone.now(), last_error='', claim_token='', lease_expires_at=None,
+    )
+    metrics.NEWSLETTER_SENT.inc(len(sent))
+    return len(sent)
+
+
+def update_campaign_status(campaign_ids):
+    """Mark campaigns with nothing left to deliver as completed"""
+    now = timezone.now()
+    open_campaigns = set(
+        NewsletterDelivery.objects.filter(campaign_id__in=campaign_ids, status__in=OPEN_STATUSES)
+        .values_list('campaign_id', flat=True).distinct()
+    )
+    NewsletterCampaign.objects.filter(pk__in=set(campaign_ids) - open_campaigns).exclude(
+        status='completed',
+    ).update(status='completed', finished_at=now)
+
+
+def process_batch(connection, batch_size=None, renderers=None):
+    """Claim and send one batch; returns the number of deliveries claimed"""
+    token, deliveries = claim_batch(batch_size)
+    if not deliveries:
+        return 0
+    campaigns = NewsletterCampaign.objects.in_bulk({d.campaign_id for d in deliveries})
+    for delivery in deliveries:
+        delivery.campaign = campaigns[delivery.campaign_id]
+    NewsletterCampaign.objects.filter(pk__in=campaigns, status='queued').update(
+        status='sending', started_at=timezone.now(),
+    )
+    send_batch(token, deliveries, connection, renderers)
+    update_campaign_status(list(campaigns))
+    return len(deliveries)
+
+
+def run_worker(stop=None, drain=False, poll_interval=5, batch_size=None):
+    """
+    Deliver batches until ``stop`` is set, or with ``drain`` until nothing is
+    due. The SMTP connection is opened once and reused across batches.
+    """
+    stop = stop or threading.Event()
+    connection = get_connection(fail_silently=False)
+    # Campaign content never changes once queued, so render each one once per worker
+    renderers = {}
+    try:
+        while not stop.is_set():
+            try:
+                claimed = process_batch(connection, batch_size, renderers)
+            except Exception:
+                logger.exception('Newsletter batch failed')
+                claimed = 0
+            if not claimed:
+                if drain:
+                    return
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def _run_worker_thread(**kwargs):
+    try:
+        run_worker(**kwargs)
+    finally:
+        # This thread owns its own database connection; don't leak it
+        connections.close_all()
+
+
+def run_workers(concurrency=1, **kwargs):
+    """Run ``concurrency`` workers, each with its own SMTP connection"""
+    if concurrency <= 1:
+        run_worker(**kwargs)
+        return
+    threads = [
+        threading.Thread(target=_run_worker_thread, kwargs=kwargs, name=f'newsletter-worker-{i}')
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def campaign_progress(campaign):
+    """Delivery counts and status of ``campaign``, as served to the admin panel"""
+    counts = dict(
+        campaign.deliveries.values_list('status').annotate(total=Count('pk')).order_by()
+    )
+    total = sum(counts.values())
+    done = counts.get('sent', 0) + counts.get('failed', 0)
+    return {
+        'id': campaign.pk,
+        'subject': campaign.subject,
+        'status': campaign.status,
+        'total': total,
+        'pending': counts.get('pending', 0),
+        'sending': counts.get('sending', 0),
+        'sent': counts.get('sent', 0),
+        'failed': counts.get('failed', 0),
+        'percent': round(100 * done / total) if total else 100,
+        'started_at': campaign.started_at.isoformat() if campaign.started_at else None,
+        'finished_at': campaign.finished_at.isoformat() if campaign.finished_at else None,
+    }
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.view_counter import apply_counts
+
+from . import analytics, dashboard_stats
+from .models import (
+    Analytics, Comment, NewsletterCampaign, NewsletterDelivery, Post, PostViewDaily, Subscriber, User,
+)
+from .newsletter import (
+    CampaignRenderer, campaign_progress, claim_batch, newsletter_context, queue_campaign, run_worker,
+)
+
+
+class FlakyEmailBackend(EmailBackend):
+    """locmem backend that refuses each address in ``refusals`` that many times"""
+    refusals = {}
+
+    def send_messages(self, messages):
+        for message in messages:
+            for address in message.to:
+                if self.refusals.get(address, 0) > 0:
+                    self.refusals[address] -= 1
+                    raise smtplib.SMTPRecipientsRefused({address: (550, b'Mailbox unavailable')})
+        return super().send_messages(messages)
+
+
+@override_settings(NEWSLETTER_RETRY_DELAY=60, NEWSLETTER_MAX_ATTEMPTS=3)
+class NewsletterQueueTests(TestCase):
+    """Queueing, delivery, retries and crash recovery of newsletters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='editor', password='x')
+        cls.post = Post.objects.create(
+            title='Issue post', author=cls.admin, content='<p>Body</p>', excerpt='Excerpt', status='published',
+        )
+        cls.emails = ['a@example.com', 'b@example.com', 'c@example.com']
+        Subscriber.objects.bulk_create([Subscriber(email=email) for email in cls.emails])
+
+    def setUp(self):
+        FlakyEmailBackend.refusals = {}
+
+    def queue(self):
+        return queue_campaign('Weekly', 'Hello', [self.post], 'http://testserver', self.emails)
+
+    def test_sending_only_queues(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin_panel:subscriber_email_all'), {
+            'posts': [self.post.pk], 'send_to_all': 'on', 'subject': 'Weekly', 'message': 'Hello',
+        })
+        campaign = NewsletterCampaign.objects.get()
+        self.assertRedirects(response, reverse('admin_panel:newsletter_campaign', kwargs={'pk': campaign.pk}))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(campaign.deliveries.filter(status='pending').count(), 3)
+
+    def test_worker_delivers_each_recipient_once(self):
+        campaign = self.queue()
+        run_worker(drain=True, batch_size=2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), self.emails)
+        self.assertIn('a@example.com', mail.outbox[0].alternatives[0][0] + mail.outbox[0].body)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign_progress(campaign)['percent'], 100)
+
+    @override_settings(EMAIL_BACKEND='admin_panel.tests.FlakyEmailBackend')
+    def test_failed_address_retried_with_backoff(self):
+        FlakyEmailBackend.refusals = {'b@example.com': 1}
+        campaign = self.queue()
+        run_worker(drain=True)
+        self.assertEqual(len(mail.outbox), 2)
+
+        delivery = campaign.deliveries.get(email='b@example.com')
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 1))
+        self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn('Mailbox unavailable', delivery.last_error)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'sending')
+
+        campaign.deliveries.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+        run_worker(drain=True)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(campaign_progress(campaign)['sent'], 3)
+
+    @override_settings(EMAIL_BACKEND='admin_panel.tests.FlakyEmailBackend', NEWSLETTER_RETRY_DELAY=0)
+    def test_gives_up_after_max_attempts(self):
+        FlakyEmailBackend.refusals = {'c@example.com': 10}
+        campaign = self.queue()
+        run_worker(drain=True)
+        delivery = campaign.deliveries.get(email='c@example.com')
+        self.assertEqual((delivery.status, delivery.attempts), ('failed', 3))
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign_progress(campaign)['failed'], 1)
+
+    def test_resumes_after_worker_crash(self):
+        campaign = self.queue()
+        # A worker claims a batch and dies before sending it
+        token, claimed = claim_batch(batch_size=2)
+        run_worker(drain=True)
+        self.assertEqual(len(mail.outbox), 1)
+
+        NewsletterDelivery.objects.filter(claim_token=token).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        run_worker(drain=True)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), self.emails)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+
+    def test_render_once_matches_per_recipient_render(self):
+        context = newsletter_context('Weekly', 'Hello', Post.objects.all(), 'http://testserver')
+        renderer = CampaignRenderer(context)
+        for email in ['a@example.com', "o'neil+news@example.com"]:
+            email_context = dict(context, recipient_email=email)
+            self.assertEqual(renderer.render(email), (
+                render_to_string('emails/newsletter.txt', email_context),
+                render_to_string('emails/newsletter.html', email_context),
+            ))
+
+    def test_links_point_at_post_pages(self):
+        context = newsletter_context('Weekly', 'Hello', Post.objects.all(), 'http://testserver')
+        url = 'http://testserver' + self.post.get_absolute_url()
+        for body in CampaignRenderer(context).render('a@example.com'):
+            self.assertIn(url, body)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_status_endpoint(self):
+        campaign = self.queue()
+        url = reverse('admin_panel:newsletter_campaign_status', kwargs={'pk': campaign.pk})
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(url).json()['pending'], 3)
+        run_worker(drain=True)
+        progress = self.client.get(url).json()
+        self.assertEqual((progress['status'], progress['sent'], progress['percent']), ('completed', 3, 100))
+
+
+class AnalyticsRollupTests(TestCase):
+    """Daily rollups, backfills and the increments that keep today current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        author = User.objects.create_user(username='author', password='x')
+        cls.posts = []
+        for number, days_ago in enumerate([5, 5, 2, 0]):
+            post = Post.objects.create(
+                title=f'Post {number}', author=author, content='<p>Body</p>', excerpt='', status='published',
+            )
+            cls.backdate(Post, post.pk, days_ago)
+            cls.posts.append(post)
+        comment = Comment.objects.create(post=cls.posts[0], name='Reader', email='r@example.com', content='Hi')
+        cls.backdate(Comment, comment.pk, 2)
+        subscriber = Subscriber.objects.create(email='early@example.com')
+        cls.backdate(Subscriber, subscriber.pk, 2, field='subscribed_at')
+        Post.objects.filter(pk=cls.posts[0].pk).update(views=7)
+
+    @classmethod
+    def backdate(cls, model, pk, days_ago, field='created_at'):
+        moment = analytics.start_of(cls.today - timedelta(days=days_ago)) + timedelta(hours=12)
+        model.objects.filter(pk=pk).update(**{field: moment})
+
+    def rows(self):
+        return {
+            (self.today - row.date).days: (row.total_posts, row.total_comments, row.new_subscribers)
+            for row in Analytics.objects.all()
+        }
+
+    def test_backfill(self):
+        self.assertEqual(analytics.backfill(chunk_days=2), 6)
+        self.assertEqual(self.rows(), {
+            5: (2, 0, 0), 4: (2, 0, 0), 3: (2, 0, 0), 2: (3, 1, 1), 1: (3, 1, 0), 0: (4, 1, 0),
+        })
+        # Running totals carried across chunks match a single pass
+        chunked = self.rows()
+        Analytics.objects.all().delete()
+        analytics.backfill(chunk_days=90)
+        self.assertEqual(self.rows(), chunked)
+
+    def test_rollup_is_idempotent_and_snapshots_views_today(self):
+        analytics.rollup(self.today - timedelta(days=1), self.today)
+        Analytics.objects.filter(date=self.today - timedelta(days=1)).update(total_views=3)
+        analytics.rollup(self.today - timedelta(days=1), self.today)
+        self.assertEqual(Analytics.objects.count(), 2)
+        self.assertEqual(Analytics.objects.get(date=self.today).total_views, 7)
+        # Past days keep the views recorded on them
+        self.assertEqual(Analytics.objects.get(date=self.today - timedelta(days=1)).total_views, 3)
+
+    def test_record_increments_today(self):
+        row = analytics.today_row()
+        self.assertEqual((row.total_posts, row.total_comments), (4, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=self.posts[1], name='Reader', email='r@example.com', content='Hi')
+            Subscriber.objects.create(email='late@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+            Subscriber.objects.get(email='early@example.com').delete()
+        row.refresh_from_db()
+        # The early subscriber counted on their own day, not today's
+        self.assertEqual((row.total_posts, row.total_comments, row.new_subscribers), (4, 1, 1))
+
+    def test_first_change_of_the_day_rolls_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscriber.objects.create(email='late@example.com')
+        # The rollup already counts the new row; no increment on top
+        self.assertEqual(self.rows(), {0: (4, 1, 1)})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rollup_analytics', stdout=out)
+        self.assertEqual(set(self.rows()), {0, 1})
+        since = (self.today - timedelta(days=3)).isoformat()
+        call_command('rollup_analytics', '--backfill', f'--since={since}', '--chunk-days=1', stdout=out)
+        self.assertIn('Rolled up 4 day(s).', out.getvalue())
+        self.assertEqual(self.rows()[3], (2, 0, 0))
+        with self.assertRaises(CommandError):
+            call_command('rollup_analytics', '--backfill', '--chunk-days=0', stdout=out)
+
+
+class PostViewDailyTests(TestCase):
+    """Views per post and day, and the rankings read from them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        author = User.objects.create_user(username='author', password='x')
+        cls.posts = [
+            Post.objects.create(
+                title=f'Post {number}', author=author, content='<p>Body</p>', excerpt='', status='published',
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        # Flushes can reorder the sidebar; its refresh thread isn't under test
+        patcher = mock.patch('blog.sidebar._start_refresh')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def views_on(self, post, days_ago, views):
+        PostViewDaily.objects.create(post=post, date=self.today - timedelta(days=days_ago), views=views)
+
+    def test_flushes_add_to_todays_row(self):
+        first, second, _ = self.posts
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_counts({first.pk: 2, second.pk: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_counts({first.pk: 3, 999999: 4})
+        self.assertEqual(
+            dict(PostViewDaily.objects.filter(date=self.today).values_list('post_id', 'views')),
+            {first.pk: 5, second.pk: 1},
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.views, 5)
+        # views_flushed feeds today's rollup
+        self.assertEqual(Analytics.objects.get(date=self.today).total_views, 6)
+
+    def test_top_posts(self):
+        first, second, third = self.posts
+        self.views_on(first, 0, 3)
+        self.views_on(first, 6, 4)
+        self.views_on(second, 1, 7)
+        self.views_on(third, 7, 50)
+        # The third post's views are from before the 7-day window
+        ranking = [(post, post.recent_views) for post in analytics.top_posts(days=7)]
+        self.assertEqual(ranking, [(first, 7), (second, 7)])
+        self.assertEqual(analytics.top_posts(days=1), [first])
+        self.assertEqual(analytics.top_posts(days=30, limit=1), [third])
+
+    def test_post_series_and_trend(self):
+        first, second, _ = self.posts
+        self.views_on(first, 0, 3)
+        self.views_on(first, 2, 4)
+        self.views_on(second, 2, 1)
+        self.assertEqual(analytics.post_series(first, days=3), [
+            (self.today - timedelta(days=2), 4), (self.today - timedelta(days=1), 0), (self.today, 3),
+        ])
+        self.assertEqual([day['views'] for day in analytics.trend(days=3)], [5, 0, 3])
+
+
+class DashboardSnapshotTests(TestCase):
+    """Dashboard statistics served from a stale-while-revalidate snapshot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='editor', password='x')
+        post = Post.objects.create(
+            title='Counted', author=cls.admin, content='<p>Body</p>', excerpt='', status='published',
+        )
+        Post.objects.create(title='Draft', author=cls.admin, content='<p>Body</p>', excerpt='', status='draft')
+        Comment.objects.create(post=post, name='Reader', email='r@example.com', content='Hi', approved=True)
+        Comment.objects.create(post=post, name='Reader', email='r@example.com', content='Hi')
+        Subscriber.objects.create(email='active@example.com')
+        Subscriber.objects.create(email='gone@example.com', is_active=False)
+
+    def setUp(self):
+        caches['shared'].delete_many([dashboard_stats.SNAPSHOT_KEY, dashboard_stats.LOCK_KEY])
+        patcher = mock.patch('admin_panel.dashboard_stats.threading.Thread')
+        self.thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def age_snapshot(self, seconds):
+        entry = caches['shared'].get(dashboard_stats.SNAPSHOT_KEY)
+        entry['computed_at'] -= seconds
+        caches['shared'].set(dashboard_stats.SNAPSHOT_KEY, entry)
+
+    def test_snapshot(self):
+        with self.assertNumQueries(1):
+            counts = dashboard_stats.scalar_counts(
+                posts=Post.objects.all(), pending=Comment.objects.filter(approved=False),
+            )
+        self.assertEqual(counts, {'posts': 2, 'pending': 1})
+
+        stats = dashboard_stats.compute_snapshot()
+        self.assertEqual(
+            {key: stats[key] for key in ['total_posts', 'published_posts', 'total_comments', 'pending_comments',
+                                         'approved_comments', 'total_subscribers']},
+            {'total_posts': 2, 'published_posts': 1, 'total_comments': 2, 'pending_comments': 1,
+             'approved_comments': 1, 'total_subscribers': 1},
+        )
+        self.assertEqual(stats['posts_by_author'], [{'username': 'editor', 'post_count': 2}])
+        self.assertEqual(stats['most_commented'], [{'title': 'Counted', 'author': 'editor', 'comments': 1}])
+
+    def test_fresh_snapshot_served_from_cache(self):
+        stats = dashboard_stats.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_stats.get_snapshot(), stats)
+        self.thread.assert_not_called()
+
+    @override_settings(DASHBOARD_STATS_TTL=60)
+    def test_stale_snapshot_served_while_one_refresh_runs(self):
+        stats = dashboard_stats.get_snapshot()
+        self.age_snapshot(120)
+        Subscriber.objects.create(email='new@example.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_stats.get_snapshot(), stats)
+            self.assertEqual(dashboard_stats.cached_snapshot(), stats)
+        # The lock lets only one refresh start
+        self.thread.assert_called_once()
+        self.thread.return_value.start.assert_called_once()
+
+        dashboard_stats._refresh_in_background()
+        self.assertEqual(dashboard_stats.get_snapshot()['total_subscribers'], 2)
+        self.assertIsNone(caches['shared'].get(dashboard_stats.LOCK_KEY))
+
+        self.age_snapshot(120)
+        self.assertEqual(dashboard_stats.get_snapshot(allow_stale=False)['total_subscribers'], 2)
+        self.thread.assert_called_once()
+
+    def test_failed_refresh_releases_lock(self):
+        dashboard_stats.schedule_refresh()
+        with mock.patch('admin_panel.dashboard_stats.compute_snapshot', side_effect=RuntimeError):
+            with self.assertLogs('admin_panel.dashboard_stats', 'ERROR'):
+                dashboard_stats._refresh_in_background()
+        self.assertIsNone(caches['shared'].get(dashboard_stats.LOCK_KEY))
+
+    def test_views(self):
+        url = reverse('admin_panel:dashboard_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.admin)
+        # The page itself never computes the statistics
+        with mock.patch('admin_panel.dashboard_stats.compute_snapshot') as compute:
+            response = self.client.get(reverse('admin_panel:dashboard'))
+        compute.assert_not_called()
+        self.assertIsNone(response.context['stats'])
+        self.assertEqual(self.client.get(url).json()['published_posts'], 1)
+        self.assertEqual(self.client.get(url, {'fresh': '1'}).json()['published_posts'], 1)
@@ -10,6 +10,7 @@ urlpatterns = [
     
     # Dashboard
     path('', views.DashboardView.as_view(), name='dashboard'),
+    path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard_stats'),
     
     # Posts management
     path('posts/', views.PostListView.as_view(), name='post_list'),
@@ -39,4 +40,6 @@ urlpatterns = [
     path('subscribers/<int:pk>/delete/', views.SubscriberDeleteView.as_view(), name='subscriber_delete'),
     path('subscribers/email/', views.SubscriberEmailView.as_view(), name='subscriber_email_all'),
     path('subscribers/<int:pk>/email/', views.SubscriberEmailView.as_view(), name='subscriber_email'),
+    path('subscribers/campaigns/<int:pk>/', views.NewsletterCampaignView.as_view(), name='newsletter_campaign'),
+    path('subscribers/campaigns/<int:pk>/status/', views.NewsletterCampaignStatusView.as_view(), name='newsletter_campaign_status'),
 ]
\ No newline at end of file
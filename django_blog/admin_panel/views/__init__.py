@@ -1,7 +1,7 @@
 from .login import LoginView, LogoutView
-from .dashboard import DashboardView
+from .dashboard import DashboardView, DashboardStatsView
 from .posts import PostListView, PostCreateView, PostUpdateView, PostDeleteView
 from .comments import CommentListView, CommentApproveView, CommentDeleteView
 from .tags import TagListView, TagCreateView, TagUpdateView, TagDeleteView
 from .users import UserListView, UserCreateView, UserUpdateView, UserDeleteView
-from .subscribers import SubscriberListView, SubscriberDeleteView, SubscriberEmailView
\ No newline at end of file
+from .subscribers import SubscriberListView, SubscriberDeleteView, SubscriberEmailView, NewsletterCampaignView, NewsletterCampaignStatusView
@@ -2,7 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.views import View
-from django.core.paginator import Paginator
+from django_blog.pagination import KeysetPaginator
 from ..models import Comment
 
 
@@ -13,9 +13,7 @@ class CommentListView(LoginRequiredMixin, View):
     
     def get(self, request):
         comments = Comment.objects.select_related('post').order_by('-created_at')
-        paginator = Paginator(comments, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        page_obj = KeysetPaginator(comments, 20, ordering=('-created_at', '-pk')).get_page(request.GET)
         
         context = {
             'comments': page_obj,
@@ -1,14 +1,12 @@
-from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMultiAlternatives
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.views import View
-from django.core.paginator import Paginator
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from ..models import Subscriber
+from django_blog.pagination import KeysetPaginator
+from django.http import JsonResponse
+from ..models import NewsletterCampaign, Subscriber
+from ..newsletter import campaign_progress, queue_campaign
 from ..forms import EmailPostsForm
 
 
@@ -19,9 +17,7 @@ class SubscriberListView(LoginRequiredMixin, View):
     
     def get(self, request):
         subscribers = Subscriber.objects.all().order_by('-subscribed_at')
-        paginator = Paginator(subscribers, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        page_obj = KeysetPaginator(subscribers, 20, ordering=('-subscribed_at', '-pk')).get_page(request.GET)
         
         context = {
             'subscribers': page_obj,
@@ -86,63 +82,33 @@ class SubscriberEmailView(LoginRequiredMixin, View):
                 messages.error(request, 'No subscribers found to send email to!')
                 return render(request, self.template_name, {'subscriber': subscriber, 'form': form})
 
-            # Send emails to each recipient individually for personalization
-            success_count = 0
-            failed_emails = []
-            
-            for recipient_email in recipients:
-                try:
-                    # Prepare context for email template
-                    email_context = {
-                        'subject': subject,
-                        'message': message,
-                        'posts': posts,
-                        'site_url': site_url,
-                        'blog_name': getattr(settings, 'BLOG_NAME', 'Django Blog'),
-                        'recipient_email': recipient_email,
-                    }
-                    
-                    # Render HTML email
-                    html_content = render_to_string('emails/newsletter.html', email_context)
-                    
-                    # Render plain text email
-                    text_content = render_to_string('emails/newsletter.txt', email_context)
-                    
-                    # Create email message
-                    email = EmailMultiAlternatives(
-                        subject=subject,
-                        body=text_content,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        to=[recipient_email]
-                    )
-                    
-                    # Attach HTML version
-                    email.attach_alternative(html_content, "text/html")
-                    
-                    # Send email
-                    email.send(fail_silently=False)
-                    success_count += 1
-                    
-                except Exception as e:
-                    failed_emails.append(f"{recipient_email}: {str(e)}")
-                    continue
-            
-            # Provide feedback to user
-            if success_count > 0:
-                messages.success(request, f'Newsletter sent successfully to {success_count} subscriber(s)!')
-            
-            if failed_emails:
-                failed_count = len(failed_emails)
-                messages.warning(request, f'Failed to send to {failed_count} subscriber(s). Check email configuration.')
-                # Optionally log the failed emails for debugging
-                print("Failed emails:", failed_emails)
-            
-            if success_count == 0:
-                messages.error(request, 'Failed to send newsletter to any subscribers!')
-                return render(request, self.template_name, {'subscriber': subscriber, 'form': form})
-            
-            return redirect('admin_panel:subscriber_list')
-            
+            # Delivery happens in the send_newsletters worker, not in this request
+            campaign = queue_campaign(subject, message, posts, site_url, recipients, created_by=request.user)
+            messages.success(request, f'Newsletter queued for {recipient_count} subscriber(s)!')
+            return redirect('admin_panel:newsletter_campaign', pk=campaign.pk)
+
         else:
             # Form has errors
-            return render(request, self.template_name, {'subscriber': subscriber, 'form': form})
\ No newline at end of file
+            return render(request, self.template_name, {'subscriber': subscriber, 'form': form})
+
+
+class NewsletterCampaignView(LoginRequiredMixin, View):
+    """Delivery progress of a queued newsletter"""
+    template_name = 'admin_panel/subscribers/campaign.html'
+    login_url = '/admin-panel/login/'
+
+    def get(self, request, pk):
+        campaign = get_object_or_404(NewsletterCampaign, pk=pk)
+        return render(request, self.template_name, {
+            'campaign': campaign,
+            'progress': campaign_progress(campaign),
+        })
+
+
+class NewsletterCampaignStatusView(LoginRequiredMixin, View):
+    """JSON delivery progress, polled by the campaign page"""
+    login_url = '/admin-panel/login/'
+
+    def get(self, request, pk):
+        campaign = get_object_or_404(NewsletterCampaign, pk=pk)
+        return JsonResponse(campaign_progress(campaign))
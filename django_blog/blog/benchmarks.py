@@ -0,0 +1,32 @@
+"""Helpers shared by the benchmark management commands"""
+import math
+import statistics
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p90_ms': round(percentile(samples, 90) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean_ms']}ms "
+        f"p50={summary['p50_ms']}ms p90={summary['p90_ms']}ms "
+        f"p99={summary['p99_ms']}ms max={summary['max_ms']}ms"
+    )
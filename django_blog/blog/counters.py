@@ -0,0 +1,44 @@
+"""
+Denormalized counters kept on the models so listings can sort and display
+them without aggregating over join tables.
+
+The signal handlers in ``blog.signals`` apply increments with ``F()``
+expressions inside the caller's transaction; ``reconcile_*`` recomputes
+the counters from scratch and is what ``manage.py reconcile_counters`` runs.
+Each is a single ``UPDATE`` counting rows in a subquery, so a counter
+changed while it runs is never overwritten with a value read before.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from admin_panel.models import Comment, Post, Tag
+
+
+def adjust_tag_counts(tag_ids, delta):
+    """Add ``delta`` to the published post count of each tag"""
+    if tag_ids and delta:
+        Tag.objects.filter(pk__in=tag_ids).update(published_post_count=F('published_post_count') + delta)
+
+
+def adjust_comment_count(post_id, delta):
+    """Add ``delta`` to a post's approved comment count"""
+    if delta:
+        Post.objects.filter(pk=post_id).update(approved_comment_count=F('approved_comment_count') + delta)
+
+
+def published_count(post_ids):
+    return Post.objects.filter(pk__in=post_ids, status='published').count() if post_ids else 0
+
+
+def reconcile_tag_counts():
+    """Recompute every tag's published post count; returns the tags that had drifted"""
+    links = Post.tags.through.objects.filter(tag_id=OuterRef('pk'), post__status='published')
+    actual = Coalesce(Subquery(links.values('tag_id').annotate(count=Count('*')).values('count')), 0)
+    return Tag.objects.exclude(published_post_count=actual).update(published_post_count=actual)
+
+
+def reconcile_comment_counts():
+    """Recompute every post's approved comment count; returns the posts that had drifted"""
+    comments = Comment.objects.filter(post_id=OuterRef('pk'), approved=True)
+    actual = Coalesce(Subquery(comments.values('post_id').annotate(count=Count('*')).values('count')), 0)
+    return Post.objects.exclude(approved_comment_count=actual).update(approved_comment_count=actual)
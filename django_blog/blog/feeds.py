@@ -0,0 +1,107 @@
+"""
+RSS and Atom feeds of the latest posts: the whole blog, one tag, or one
+author. Each feed is wired through the page cache (``blog.urls``) with the
+same dependency as the matching listing page, so it's rebuilt only after a
+change that would show on that page.
+"""
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from admin_panel.models import Post, Tag, User
+
+
+def get_feed_size():
+    return getattr(settings, 'FEED_ITEM_COUNT', 20)
+
+
+class LatestPostsFeed(Feed):
+    """Latest published posts of the whole blog"""
+
+    def title(self, obj):
+        return settings.BLOG_NAME
+
+    def description(self, obj):
+        return settings.BLOG_DESCRIPTION
+
+    def link(self, obj):
+        return reverse('blog:home')
+
+    def get_posts(self, obj):
+        return Post.objects.filter(status='published')
+
+    def items(self, obj):
+        return self.get_posts(obj).select_related('author').prefetch_related('tags')[:get_feed_size()]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_pubdate(self, item):
+        return item.published_at or item.created_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class TagFeed(LatestPostsFeed):
+    """Latest published posts with one tag"""
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Tag, slug=slug)
+
+    def title(self, obj):
+        return f'{settings.BLOG_NAME}: {obj.name}'
+
+    def description(self, obj):
+        return f'Latest posts tagged {obj.name}'
+
+    def link(self, obj):
+        return obj.get_absolute_url()
+
+    def get_posts(self, obj):
+        return obj.posts.filter(status='published')
+
+
+class TagAtomFeed(TagFeed):
+    feed_type = Atom1Feed
+    subtitle = TagFeed.description
+
+
+class AuthorFeed(LatestPostsFeed):
+    """Latest published posts of one author"""
+
+    def get_object(self, request, author_id):
+        return get_object_or_404(User, id=author_id)
+
+    def title(self, obj):
+        return f'{settings.BLOG_NAME}: {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Latest posts by {obj.get_full_name() or obj.username}'
+
+    def link(self, obj):
+        return obj.get_absolute_url()
+
+    def get_posts(self, obj):
+        return obj.posts.filter(status='published')
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+    subtitle = AuthorFeed.description
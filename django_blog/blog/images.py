@@ -0,0 +1,339 @@
+"""
+Responsive derivatives of uploaded images.
+
+Featured images and profile pictures are served at the size they were
+uploaded. This module resizes them to a few widths in WebP and JPEG, stores
+the results under ``MEDIA_ROOT/derivatives/`` with content-hashed names (so
+re-uploads of the same picture share files and URLs can be cached forever),
+and records what it made in a JSON manifest next to the image field
+(``<field>_variants``). Templates read the manifest through the
+``{% picture %}`` tag in ``responsive_images``, so listing pages don't
+cost an extra query.
+
+Derivatives are generated off the request path: after an upload commits, or
+the first time a page shows an image that has none yet. Existing images can
+be processed in bulk with ``python manage.py generate_image_derivatives``.
+
+Images pasted into post bodies through CKEditor (``CKEDITOR_UPLOAD_PATH``)
+get the same treatment when the post is saved: ``optimize_content()``
+points their ``<img>`` tags at a derivative and adds ``srcset``, ``sizes``,
+``width``/``height`` and ``loading="lazy"``. The ``srcset`` lists WebP
+files and ``src`` a JPEG, so browsers without ``srcset`` still get an
+image they can decode. ``python manage.py optimize_content_images``
+processes posts written before this existed.
+"""
+import hashlib
+import html
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# (model label, image field) -> widths to generate, in pixels
+DERIVATIVE_FIELDS = {
+    ('admin_panel.post', 'featured_image'): (320, 640, 960, 1280, 1920),
+    ('admin_panel.user', 'profile_picture'): (64, 128, 256),
+}
+
+# Widths for images embedded in post bodies; the column is at most 896px wide
+CONTENT_WIDTHS = (480, 960, 1440)
+CONTENT_SIZES = '(min-width: 896px) 896px, 100vw'
+
+# Format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Sent with ``instance`` and ``field_name`` once new derivatives are recorded
+variants_generated = Signal()
+
+
+def manifest_field(field_name):
+    return f'{field_name}_variants'
+
+
+def current_variants(field_file):
+    """The manifest of ``field_file`` if it describes the file currently stored"""
+    if not field_file:
+        return None
+    manifest = getattr(field_file.instance, manifest_field(field_file.field.name), None)
+    if manifest and manifest.get('source') == field_file.name:
+        return manifest
+    return None
+
+
+def derivative_name(digest, width, extension):
+    return f'derivatives/{digest[:2]}/{digest}/{width}w.{extension}'
+
+
+def prepare(image):
+    """Upright RGB(A) copy of ``image`` ready for resizing"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def encode(image, format_name):
+    extension, options = FORMATS[format_name]
+    if format_name == 'jpeg' and image.mode == 'RGBA':
+        # JPEG has no alpha channel; flatten onto white like a browser would
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def build_variants(data, widths, storage=default_storage):
+    """Write derivatives of the image bytes ``data``; returns the manifest without its source"""
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    with Image.open(io.BytesIO(data)) as original:
+        image = prepare(original)
+        width, height = image.size
+        # Never upscale; an image narrower than every target keeps its own width
+        targets = sorted({min(target, width) for target in widths})
+
+        variants = {format_name: [] for format_name in FORMATS}
+        for target in targets:
+            resized = image if target == width else image.resize(
+                (target, max(round(height * target / width), 1)), Image.LANCZOS,
+            )
+            for format_name, (extension, _options) in FORMATS.items():
+                name = derivative_name(digest, target, extension)
+                if not storage.exists(name):
+                    # Another process may win the race; use whatever name storage picked
+                    name = storage.save(name, ContentFile(encode(resized, format_name)))
+                variants[format_name].append([target, name])
+    return {'hash': digest, 'width': width, 'height': height, 'variants': variants}
+
+
+def generate(label, pk, field_name, force=False):
+    """
+    Create the derivatives of one image field and record them on the row.
+    Returns True when a new manifest was written.
+    """
+    model = apps.get_model(label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return False
+    field_file = getattr(instance, field_name)
+    if not field_file or (current_variants(field_file) and not force):
+        return False
+
+    with field_file.open('rb') as source:
+        data = source.read()
+    manifest = build_variants(data, DERIVATIVE_FIELDS[(label, field_name)], field_file.storage)
+    manifest['source'] = field_file.name
+
+    # Only record the manifest if the image wasn't replaced meanwhile
+    updated = model._default_manager.filter(pk=pk, **{field_name: field_file.name}).update(
+        **{manifest_field(field_name): manifest}
+    )
+    if updated:
+        setattr(instance, manifest_field(field_name), manifest)
+        variants_generated.send(sender=model, instance=instance, field_name=field_name)
+    return bool(updated)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Keys of jobs queued or running, oldest first. A job whose transaction rolled
+# back never runs to discard its key, so only the newest are kept
+_scheduled = {}
+MAX_SCHEDULED = 1000
+
+
+def _run_in_background(key, function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Background image processing %s%r failed', function.__name__, args)
+    finally:
+        # Done or failed: the next save with this key schedules it again
+        with _executor_lock:
+            _scheduled.pop(key, None)
+        # This thread owns its own database connection; don't leak it
+        connections.close_all()
+
+
+def _submit_once(key, function, *args):
+    """Run ``function(*args)`` on the image thread after commit, unless ``key`` is already queued"""
+    global _executor
+    with _executor_lock:
+        if key in _scheduled:
+            return
+        _scheduled[key] = None
+        while len(_scheduled) > MAX_SCHEDULED:
+            del _scheduled[next(iter(_scheduled))]
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-derivatives')
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, key, function, *args))
+
+
+def schedule(field_file):
+    """Generate derivatives for ``field_file`` on a background thread"""
+    instance = field_file.instance
+    key = (instance._meta.label_lower, instance.pk, field_file.field.name, field_file.name)
+    _submit_once(key, generate, *key[:3])
+
+
+def process_pool(processes):
+    """Process pool for bulk jobs; every worker opens its own database connections"""
+    connections.close_all()
+    # Forked workers inherit a configured Django; spawned ones start from scratch
+    return ProcessPoolExecutor(max_workers=processes, initializer=django.setup)
+
+
+def field_files(instance):
+    """The image fields of ``instance`` that get derivatives"""
+    label = instance._meta.label_lower
+    return [getattr(instance, name) for (model, name) in DERIVATIVE_FIELDS if model == label]
+
+
+IMG_TAG = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTRIBUTE = re.compile(r'([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?')
+DERIVATIVE_PATH = re.compile(r'^derivatives/[0-9a-f]{2}/(?P<digest>[0-9a-f]+)/\d+w\.\w+$')
+
+
+def parse_img(tag):
+    """Attributes of an ``<img>`` tag, in order, with entities decoded"""
+    attributes = {}
+    for match in ATTRIBUTE.finditer(tag[4:].rstrip('/>')):
+        name, *values = match.groups()
+        value = next((value for value in values if value is not None), '')
+        attributes[name.lower()] = html.unescape(value)
+    return attributes
+
+
+def format_img(attributes):
+    return '<img ' + ' '.join(f'{name}="{html.escape(value)}"' for name, value in attributes.items()) + '>'
+
+
+def media_name(src):
+    """Storage name for a ``src`` under MEDIA_URL, or None for anything else"""
+    path = urlsplit(src or '').path
+    media_path = urlsplit(settings.MEDIA_URL).path
+    if not path.startswith(media_path):
+        return None
+    return unquote(path[len(media_path):])
+
+
+def is_content_upload(name):
+    return name.startswith(getattr(settings, 'CKEDITOR_UPLOAD_PATH', 'uploads/'))
+
+
+def needs_optimizing(attributes):
+    name = media_name(attributes.get('src'))
+    if name is None:
+        return False
+    if is_content_upload(name):
+        return True
+    # Our own rewrite, unless an editor round trip stripped the extra attributes
+    return bool(DERIVATIVE_PATH.match(name)) and not {'srcset', 'width', 'loading'} <= attributes.keys()
+
+
+def content_needs_optimizing(content):
+    return any(needs_optimizing(parse_img(tag)) for tag in IMG_TAG.findall(content or ''))
+
+
+def content_variants(name, storage=default_storage):
+    """Variants for an embedded image, given its upload or one of its derivatives"""
+    match = DERIVATIVE_PATH.match(name)
+    if match is None:
+        with storage.open(name, 'rb') as source:
+            return build_variants(source.read(), CONTENT_WIDTHS, storage)
+
+    # Rebuild the list from the files already made for this digest
+    directory = name.rsplit('/', 1)[0]
+    variants = {format_name: [] for format_name in FORMATS}
+    extensions = {extension: format_name for format_name, (extension, _options) in FORMATS.items()}
+    for filename in storage.listdir(directory)[1]:
+        width, _, extension = filename.partition('w.')
+        if width.isdigit() and extension in extensions:
+            variants[extensions[extension]].append([int(width), f'{directory}/{filename}'])
+    for entries in variants.values():
+        entries.sort()
+    if not all(variants.values()):
+        return None
+    with storage.open(variants['jpeg'][-1][1], 'rb') as largest, Image.open(largest) as image:
+        width, height = image.size
+    return {'hash': match['digest'], 'width': width, 'height': height, 'variants': variants}
+
+
+def optimize_img(attributes, storage=default_storage):
+    """Attributes of an optimized copy of an embedded ``<img>``, or None to leave it alone"""
+    if not needs_optimizing(attributes):
+        return None
+    manifest = content_variants(media_name(attributes['src']), storage)
+    if manifest is None:
+        return None
+    jpeg, webp = manifest['variants']['jpeg'], manifest['variants']['webp']
+    # Intrinsic size of the largest derivative; the aspect ratio is what matters
+    width, height = jpeg[-1][0], round(manifest['height'] * jpeg[-1][0] / manifest['width'])
+    optimized = dict(attributes)
+    optimized.update({
+        'src': storage.url(jpeg[-1][1]),
+        'srcset': ', '.join(f'{storage.url(name)} {size}w' for size, name in webp),
+        'sizes': attributes.get('sizes') or CONTENT_SIZES,
+        'width': str(width),
+        'height': str(height),
+        'loading': 'lazy',
+        'decoding': 'async',
+    })
+    return optimized
+
+
+def optimize_content(content, storage=default_storage):
+    """``content`` with its embedded uploads rewritten; returns (html, images rewritten)"""
+    rewritten = 0
+
+    def replace(match):
+        nonlocal rewritten
+        try:
+            optimized = optimize_img(parse_img(match.group(0)), storage)
+        except (OSError, ValueError) as exc:
+            # Missing or unreadable file: keep the tag as the author wrote it
+            logger.warning('Could not optimize %s: %s', match.group(0), exc)
+            return match.group(0)
+        if optimized is None:
+            return match.group(0)
+        rewritten += 1
+        return format_img(optimized)
+
+    return IMG_TAG.sub(replace, content or ''), rewritten
+
+
+def optimize_post_content(pk):
+    """Rewrite a post's embedded images; returns the number of tags rewritten"""
+    from admin_panel.models import Post
+
+    post = Post.objects.filter(pk=pk).first()
+    if post is None or not post.content:
+        return 0
+    optimized, rewritten = optimize_content(post.content)
+    # Skip the write if the post was edited meanwhile; its own save re-schedules
+    if not rewritten or not Post.objects.filter(pk=pk, content=post.content).update(content=optimized):
+        return 0
+    post.content = optimized
+    variants_generated.send(sender=Post, instance=post, field_name='content')
+    return rewritten
+
+
+def schedule_content(post):
+    _submit_once(('content', post.pk, hash(post.content)), optimize_post_content, post.pk)
@@ -0,0 +1,131 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from admin_panel.models import Comment, Post, Subscriber
+from blog.benchmarks import format_summary, summarize
+from django_blog.cache import TieredCache
+
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+BENCHMARK_EMAIL = 'benchmark@example.com'
+
+
+def cases(writes=False):
+    """
+    ``(label, build environ)`` for the homepage and the AJAX endpoints; the
+    comment form, which saves a comment per request, only with ``writes``
+    """
+    factory = RequestFactory()
+    post = Post.objects.filter(status='published').order_by('-created_at', '-pk').first()
+    subscriber = Subscriber.objects.order_by('-subscribed_at', '-pk').first()
+    yield 'blog:home', lambda: factory.get(reverse('blog:home')).environ
+    if post:
+        query = ' '.join(post.title.split()[:2])[:4]
+        yield 'blog:search_suggest', lambda: factory.get(reverse('blog:search_suggest'), {'q': query}, **AJAX).environ
+    if subscriber:
+        # Already subscribed: one lookup, nothing inserted
+        yield 'blog:subscribe', lambda: factory.post(
+            reverse('blog:subscribe'), {'email': subscriber.email}, **AJAX,
+        ).environ
+    if post and writes:
+        # Saved like any other comment; handle() deletes them again
+        yield 'blog:add_comment', lambda: factory.post(reverse('blog:add_comment'), {
+            'post_id': post.pk, 'name': 'Benchmark', 'email': BENCHMARK_EMAIL, 'content': 'Benchmark.',
+        }, **AJAX).environ
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request latency with connections closed after every request '
+            'and with persistent connections, through the WSGI handler')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per URL and setting')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per URL and setting first')
+        parser.add_argument('--conn-max-age', type=int, nargs='+', default=[0, 60],
+                            help='CONN_MAX_AGE values to compare, in seconds')
+        parser.add_argument('--cold', action='store_true',
+                            help='Give every request cache keys nothing was stored under, so cached pages '
+                                 'reach the database too. Entries already cached are left alone.')
+        parser.add_argument('--write', action='store_true',
+                            help='Also time the comment form. This saves comments (deleted again at the end) '
+                                 'and runs their signals, so only use it on a throwaway database.')
+
+    def handle(self, *args, **options):
+        # Adds testserver to ALLOWED_HOSTS, as for the test client
+        setup_test_environment()
+        self.handler = WSGIHandler()
+        self.opened = 0
+        connection_created.connect(self.count_connection)
+        saved = {alias: connections.settings[alias]['CONN_MAX_AGE'] for alias in connections}
+        self.key_prefixes = {alias: caches[alias].key_prefix for alias in settings.CACHES}
+        last_comment = Comment.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        try:
+            for label, environ in cases(writes=options['write']):
+                baseline = None
+                for max_age in options['conn_max_age']:
+                    summary, opened = self.run_case(environ, max_age, options)
+                    change = ''
+                    if baseline is None:
+                        baseline = summary['p50_ms']
+                    elif baseline:
+                        change = f' ({(summary["p50_ms"] - baseline) / baseline * 100:+.0f}% p50)'
+                    self.stdout.write(
+                        format_summary(f'{label} CONN_MAX_AGE={max_age}', summary) +
+                        f' connections/request={opened / summary["count"]:.2f}{change}'
+                    )
+        finally:
+            connection_created.disconnect(self.count_connection)
+            self.set_max_age(saved)
+            for alias, prefix in self.key_prefixes.items():
+                caches[alias].key_prefix = prefix
+            if options['write']:
+                Comment.objects.filter(pk__gt=last_comment, email=BENCHMARK_EMAIL).delete()
+
+    def count_connection(self, sender, connection, **kwargs):
+        self.opened += 1
+
+    def set_max_age(self, values):
+        for alias, max_age in values.items():
+            connections[alias].close()
+            # The wrapper shares this dict and reads it on every connect
+            connections.settings[alias]['CONN_MAX_AGE'] = max_age
+
+    def use_fresh_keys(self):
+        """Point the caches at keys no entry was stored under, instead of clearing them"""
+        run = uuid.uuid4().hex
+        for alias, prefix in self.key_prefixes.items():
+            cache = caches[alias]
+            if isinstance(cache, TieredCache):
+                # Keys pass through to the shared alias, which gets the prefix
+                cache.clear_local()
+            else:
+                cache.key_prefix = f'{prefix}benchmark-cold-{run}'
+
+    def run_case(self, environ, max_age, options):
+        self.set_max_age({alias: max_age for alias in connections})
+        latencies, opened = [], 0
+        for number in range(options['warmup'] + options['requests']):
+            if options['cold']:
+                self.use_fresh_keys()
+            request_environ = environ()
+            self.opened = 0
+            started = time.perf_counter()
+            response = self.handler(request_environ, lambda status, headers: None)
+            b''.join(response)
+            # What the WSGI server does at the end of a response: this sends
+            # request_finished, which closes connections older than CONN_MAX_AGE
+            response.close()
+            elapsed = time.perf_counter() - started
+            if number >= options['warmup']:
+                latencies.append(elapsed)
+                opened += self.opened
+        return summarize(latencies), opened
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+
+from admin_panel.models import Comment, Post, Subscriber
+from blog.benchmarks import format_summary, summarize
+from django_blog.pagination import CURSOR_PARAM, KeysetPaginator, encode_cursor
+
+LISTINGS = {
+    'posts': (lambda: Post.objects.filter(status='published'), ('-created_at', '-pk'), 6),
+    'comments': (lambda: Comment.objects.all(), ('-created_at', '-pk'), 20),
+    'subscribers': (lambda: Subscriber.objects.all(), ('-subscribed_at', '-pk'), 20),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare OFFSET pagination with keyset (cursor) pagination on shallow and deep pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing', choices=sorted(LISTINGS), default='posts')
+        parser.add_argument('--page', type=int, default=5000, help='Deep page to compare with page 1')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        queryset_for, ordering, per_page = LISTINGS[options['listing']]
+        queryset = queryset_for()
+        deep = options['page']
+        total = queryset.count()
+        if total <= (deep - 1) * per_page:
+            raise CommandError(
+                f'Page {deep} needs more than {(deep - 1) * per_page} rows, found {total}; seed more data first.'
+            )
+
+        # The cursor a reader holds after clicking "Next" deep - 1 times
+        keyset = KeysetPaginator(queryset, per_page, ordering)
+        previous_row = queryset.order_by(*ordering)[(deep - 1) * per_page - 1]
+        cursor = encode_cursor(keyset.key_values(previous_row), deep, False)
+
+        cases = {
+            'offset page 1': lambda: self.offset_page(queryset, ordering, per_page, 1),
+            f'offset page {deep}': lambda: self.offset_page(queryset, ordering, per_page, deep),
+            'keyset page 1': lambda: list(KeysetPaginator(queryset, per_page, ordering).get_page({})),
+            f'keyset page {deep}': lambda: list(
+                KeysetPaginator(queryset, per_page, ordering).get_page({CURSOR_PARAM: cursor})
+            ),
+        }
+        for label, fetch in cases.items():
+            fetch()  # Warm the count cache and the database's page cache
+            samples = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                fetch()
+                samples.append(time.perf_counter() - started)
+            self.stdout.write(format_summary(label, summarize(samples)))
+
+    @staticmethod
+    def offset_page(queryset, ordering, per_page, number):
+        """What the views did before: COUNT(*) plus an OFFSET query"""
+        page = Paginator(queryset.order_by(*ordering), per_page).page(number)
+        return list(page)
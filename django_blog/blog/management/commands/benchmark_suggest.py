@@ -0,0 +1,62 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from admin_panel.models import Post
+from blog import suggest
+from blog.benchmarks import format_summary, summarize
+
+
+class Command(BaseCommand):
+    help = 'Measure search-suggestion latency under concurrent keystroke traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent typists')
+        parser.add_argument('--sessions', type=int, default=200, help='Titles typed out in total')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cold', action='store_true', help='Start from an empty response cache')
+
+    def handle(self, *args, **options):
+        titles = list(Post.objects.filter(status='published').values_list('title', flat=True)[:5000])
+        if not titles:
+            raise CommandError('No published posts to type; seed some data first.')
+
+        rng = random.Random(options['seed'])
+        sessions = [self.keystrokes(rng.choice(titles)) for _ in range(options['sessions'])]
+        if options['cold']:
+            # A fresh version means an index rebuild and no cached responses
+            cache.delete(suggest.VERSION_KEY)
+
+        setup_test_environment()
+        url = reverse('blog:search_suggest')
+
+        def type_out(prefixes):
+            client = Client()
+            timings = []
+            for prefix in prefixes:
+                started = time.perf_counter()
+                response = client.get(url, {'q': prefix})
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}?q={prefix} returned {response.status_code}')
+            return timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            samples = [timing for timings in pool.map(type_out, sessions) for timing in timings]
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(format_summary('search_suggest', summarize(samples)))
+        self.stdout.write(f'{len(samples) / elapsed:.0f} requests/s across {options["threads"]} thread(s)')
+
+    @staticmethod
+    def keystrokes(title):
+        """Every prefix a reader produces while typing the first words of a title"""
+        typed = ' '.join(title.split()[:3])
+        return [typed[:length] for length in range(2, len(typed) + 1)]
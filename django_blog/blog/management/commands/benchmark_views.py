@@ -0,0 +1,271 @@
+import json
+import platform
+import subprocess
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+import django
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from admin_panel.models import Comment, NewsletterCampaign, Post, Subscriber, Tag, User
+from blog import sitemaps
+from blog.benchmarks import format_summary, summarize
+
+# URL namespaces whose every route must have a case below
+NAMESPACES = ('blog', 'admin_panel')
+
+
+@dataclass
+class Case:
+    """How to request one URL name; callables get the sample ``objects`` dict"""
+    kwargs: object = None
+    method: str = 'get'
+    data: object = None
+    admin: bool = False
+    # Changes data: each request runs in a transaction that is rolled back
+    writes: bool = False
+    # Ends the session: each request gets a freshly logged-in client
+    fresh_session: bool = False
+    needs: tuple = field(default_factory=tuple)
+
+
+def admin(**options):
+    return Case(admin=True, **options)
+
+
+CASES = {
+    'blog:home': Case(),
+    'blog:post_detail': Case(kwargs=lambda o: {'slug': o['post'].slug}, needs=('post',)),
+    'blog:author_posts': Case(kwargs=lambda o: {'author_id': o['post'].author_id}, needs=('post',)),
+    'blog:tag_posts': Case(kwargs=lambda o: {'slug': o['tag'].slug}, needs=('tag',)),
+    'blog:search': Case(data=lambda o: {'q': o['query']}, needs=('post',)),
+    'blog:search_suggest': Case(data=lambda o: {'q': o['query'][:4]}, needs=('post',)),
+    'blog:feed': Case(),
+    'blog:feed_atom': Case(),
+    'blog:tag_feed': Case(kwargs=lambda o: {'slug': o['tag'].slug}, needs=('tag',)),
+    'blog:tag_feed_atom': Case(kwargs=lambda o: {'slug': o['tag'].slug}, needs=('tag',)),
+    'blog:author_feed': Case(kwargs=lambda o: {'author_id': o['post'].author_id}, needs=('post',)),
+    'blog:author_feed_atom': Case(kwargs=lambda o: {'author_id': o['post'].author_id}, needs=('post',)),
+    'blog:sitemap': Case(),
+    'blog:sitemap_section': Case(kwargs=lambda o: {'section': 'posts', 'chunk': o['sitemap_chunk']}, needs=('post',)),
+    'blog:subscribe': Case(method='post', writes=True, data=lambda o: {'email': 'benchmark@example.com'}),
+    'blog:add_comment': Case(method='post', writes=True, needs=('post',), data=lambda o: {
+        'post_id': o['post'].pk, 'name': 'Benchmark', 'email': 'benchmark@example.com', 'content': 'Benchmark.',
+    }),
+
+    'admin_panel:login': Case(),
+    'admin_panel:logout': admin(method='post', writes=True, fresh_session=True),
+    'admin_panel:dashboard': admin(),
+    'admin_panel:dashboard_stats': admin(),
+    'admin_panel:post_list': admin(),
+    'admin_panel:post_create': admin(),
+    'admin_panel:post_edit': admin(kwargs=lambda o: {'pk': o['post'].pk}, needs=('post',)),
+    'admin_panel:post_delete': admin(kwargs=lambda o: {'pk': o['post'].pk}, needs=('post',)),
+    'admin_panel:comment_list': admin(),
+    'admin_panel:comment_approve': admin(
+        method='post', writes=True, kwargs=lambda o: {'pk': o['comment'].pk}, needs=('comment',),
+    ),
+    'admin_panel:comment_delete': admin(kwargs=lambda o: {'pk': o['comment'].pk}, needs=('comment',)),
+    'admin_panel:tag_list': admin(),
+    'admin_panel:tag_create': admin(),
+    'admin_panel:tag_edit': admin(kwargs=lambda o: {'pk': o['tag'].pk}, needs=('tag',)),
+    'admin_panel:tag_delete': admin(kwargs=lambda o: {'pk': o['tag'].pk}, needs=('tag',)),
+    'admin_panel:user_list': admin(),
+    'admin_panel:user_create': admin(),
+    'admin_panel:user_edit': admin(kwargs=lambda o: {'pk': o['post'].author_id}, needs=('post',)),
+    'admin_panel:user_delete': admin(kwargs=lambda o: {'pk': o['post'].author_id}, needs=('post',)),
+    'admin_panel:subscriber_list': admin(),
+    'admin_panel:subscriber_delete': admin(kwargs=lambda o: {'pk': o['subscriber'].pk}, needs=('subscriber',)),
+    'admin_panel:subscriber_email_all': admin(),
+    'admin_panel:subscriber_email': admin(kwargs=lambda o: {'pk': o['subscriber'].pk}, needs=('subscriber',)),
+    'admin_panel:newsletter_campaign': admin(kwargs=lambda o: {'pk': o['campaign'].pk}, needs=('campaign',)),
+    'admin_panel:newsletter_campaign_status': admin(
+        kwargs=lambda o: {'pk': o['campaign'].pk}, needs=('campaign',),
+    ),
+}
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that counts and times queries, with no limit on their number"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def url_names():
+    """Every named route of the benchmarked namespaces"""
+    names = []
+    for namespace in NAMESPACES:
+        resolver = next(
+            entry for entry in get_resolver().url_patterns
+            if isinstance(entry, URLResolver) and entry.namespace == namespace
+        )
+        names.extend(f'{namespace}:{pattern.name}' for pattern in resolver.url_patterns if pattern.name)
+    return names
+
+
+def sample_objects():
+    """The rows the cases request: the newest of each kind, so runs pick the same ones"""
+    post = Post.objects.filter(status='published').order_by('-created_at', '-pk').first()
+    return {
+        'post': post,
+        'query': ' '.join(post.title.split()[:2]) if post else '',
+        'sitemap_chunk': sitemaps.chunk_of(post.pk) if post else 0,
+        'tag': Tag.objects.filter(published_post_count__gt=0).order_by('-published_post_count', 'pk').first(),
+        'comment': Comment.objects.order_by('-created_at', '-pk').first(),
+        'subscriber': Subscriber.objects.order_by('-subscribed_at', '-pk').first(),
+        'campaign': NewsletterCampaign.objects.order_by('-created_at', '-pk').first(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Request every blog and admin panel URL through the test client and report latency and queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per URL')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per URL first')
+        parser.add_argument('--cold', action='store_true', help='Clear the caches before every request')
+        parser.add_argument('--only', nargs='+', default=None, help='URL names to run, e.g. blog:home')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file')
+        parser.add_argument('--compare', default=None, help='Earlier JSON report to print differences against')
+
+    def handle(self, *args, **options):
+        names = url_names()
+        missing = [name for name in names if name not in CASES]
+        if missing:
+            raise CommandError(f'No benchmark case for: {", ".join(missing)}')
+        if options['only']:
+            unknown = set(options['only']) - set(names)
+            if unknown:
+                raise CommandError(f'Unknown URL name(s): {", ".join(sorted(unknown))}')
+            names = [name for name in names if name in options['only']]
+
+        self.admin_user = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if self.admin_user is None:
+            raise CommandError('The admin pages need an active superuser; create one with createsuperuser.')
+
+        setup_test_environment()
+        objects = sample_objects()
+        results = {}
+        for name in names:
+            case = CASES[name]
+            absent = [need for need in case.needs if objects[need] is None]
+            if absent:
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, no {", ".join(absent)} to request'))
+                continue
+            results[name] = self.run_case(name, case, objects, options)
+            self.stdout.write(format_summary(name, results[name]['latency']) +
+                              f" queries={results[name]['queries']['mean']}")
+
+        report = {
+            'revision': git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                model.__name__: model.objects.count()
+                for model in (User, Post, Tag, Comment, Subscriber)
+            },
+            'options': {key: options[key] for key in ('requests', 'warmup', 'cold')},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.compare(json.load(baseline), report)
+
+    def client(self, case):
+        client = Client()
+        if case.admin:
+            client.force_login(self.admin_user)
+        return client
+
+    def run_case(self, name, case, objects, options):
+        url = reverse(name, kwargs=case.kwargs(objects) if case.kwargs else None)
+        data = case.data(objects) if case.data else None
+        client = self.client(case)
+        latencies, query_counts, query_times, statuses = [], [], [], {}
+
+        for number in range(options['warmup'] + options['requests']):
+            if case.fresh_session:
+                client = self.client(case)
+            if options['cold']:
+                for alias in ('default', 'shared'):
+                    caches[alias].clear()
+            queries = QueryCounter()
+            with ExitStack() as stack:
+                # Every alias, so reads served by a replica count too
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(queries))
+                started = time.perf_counter()
+                if case.writes:
+                    with transaction.atomic():
+                        response = getattr(client, case.method)(url, data)
+                        transaction.set_rollback(True)
+                else:
+                    response = getattr(client, case.method)(url, data)
+                elapsed = time.perf_counter() - started
+            if number < options['warmup']:
+                continue
+            latencies.append(elapsed)
+            query_counts.append(queries.count)
+            query_times.append(queries.duration)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        return {
+            'method': case.method.upper(),
+            'url': url,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'latency': summarize(latencies),
+            'queries': {
+                'min': min(query_counts),
+                'max': max(query_counts),
+                'mean': round(sum(query_counts) / len(query_counts), 2),
+                'time_ms': summarize(query_times),
+            },
+        }
+
+    def compare(self, baseline, report):
+        self.stdout.write(f'\nAgainst {baseline.get("revision") or "baseline"}:')
+        for name, result in report['results'].items():
+            before = baseline.get('results', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name}: new')
+                continue
+            p50, old_p50 = result['latency']['p50_ms'], before['latency']['p50_ms']
+            change = f'{(p50 - old_p50) / old_p50 * 100:+.0f}%' if old_p50 else 'n/a'
+            self.stdout.write(
+                f'{name}: p50 {old_p50}ms -> {p50}ms ({change}), '
+                f'queries {before["queries"]["mean"]} -> {result["queries"]["mean"]}'
+            )
@@ -0,0 +1,82 @@
+import os
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from blog.sitemaps import SECTIONS, chunks, listed_authors, listed_tags
+
+EXTENSIONS = ('.xml', '.rss', '.atom')
+
+
+def document_paths():
+    """URL path of every feed and sitemap the site serves"""
+    yield reverse('blog:sitemap')
+    for section in SECTIONS:
+        for chunk, _lastmod in chunks(section):
+            yield reverse('blog:sitemap_section', kwargs={'section': section, 'chunk': chunk})
+    yield reverse('blog:feed')
+    yield reverse('blog:feed_atom')
+    for slug in listed_tags().values_list('slug', flat=True):
+        yield reverse('blog:tag_feed', kwargs={'slug': slug})
+        yield reverse('blog:tag_feed_atom', kwargs={'slug': slug})
+    for author_id in listed_authors().values_list('pk', flat=True):
+        yield reverse('blog:author_feed', kwargs={'author_id': author_id})
+        yield reverse('blog:author_feed_atom', kwargs={'author_id': author_id})
+
+
+class Command(BaseCommand):
+    help = (
+        'Write feeds and sitemaps as static files under SYNDICATION_ROOT, which WhiteNoise serves '
+        'at the site root. WhiteNoise indexes files at startup, so run this before the web processes start.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site-url', required=True, help='Public URL of the site, e.g. https://blog.example.com')
+        parser.add_argument('--output', default=None, help='Directory to write to (default: SYNDICATION_ROOT)')
+
+    def handle(self, *args, **options):
+        output = options['output'] or getattr(settings, 'SYNDICATION_ROOT', '')
+        if not output:
+            raise CommandError('Set SYNDICATION_ROOT or pass --output.')
+        output = Path(output)
+        site = urlsplit(options['site_url'])
+        factory = RequestFactory()
+
+        written = unchanged = 0
+        produced = set()
+        for path in document_paths():
+            # Goes through the page cache, so documents that haven't changed aren't rebuilt
+            request = factory.get(path, HTTP_HOST=site.netloc, secure=site.scheme == 'https')
+            match = resolve(path)
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.status_code != 200:
+                self.stderr.write(f'{path}: HTTP {response.status_code}, skipped')
+                continue
+
+            target = output / path.lstrip('/')
+            produced.add(target)
+            if target.exists() and target.read_bytes() == response.content:
+                unchanged += 1
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temporary = target.with_name(target.name + '.tmp')
+            temporary.write_bytes(response.content)
+            os.replace(temporary, target)
+            written += 1
+
+        # Chunks, tags and authors that no longer have anything to list
+        removed = 0
+        for existing in output.rglob('*'):
+            if existing.suffix in EXTENSIONS and existing not in produced:
+                existing.unlink()
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} file(s), {unchanged} unchanged, removed {removed} under {output}.'
+        ))
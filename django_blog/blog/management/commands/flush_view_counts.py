@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog.view_counter import recover_journals, view_counter
+
+
+class Command(BaseCommand):
+    help = 'Apply buffered post view counts, including journals left behind by stopped workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--include-claimed',
+            action='store_true',
+            help='Also retry journals a flusher claimed but never finished (e.g. it was killed mid-flush)',
+        )
+
+    def handle(self, *args, **options):
+        applied = view_counter.flush()
+        applied += recover_journals(include_claimed=options['include_claimed'])
+        self.stdout.write(self.style.SUCCESS(f'Applied {applied} buffered view(s).'))
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from blog import images
+
+
+def _generate(task):
+    try:
+        return task, images.generate(*task), None
+    except Exception as exc:
+        return task, False, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = 'Create responsive derivatives for existing featured images and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help='Regenerate images that already have derivatives')
+
+    def handle(self, *args, **options):
+        tasks = []
+        for label, field_name in images.DERIVATIVE_FIELDS:
+            model = apps.get_model(label)
+            rows = model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name, manifest in rows.values_list('pk', field_name, images.manifest_field(field_name)):
+                if options['force'] or not manifest or manifest.get('source') != name:
+                    tasks.append((label, pk, field_name, options['force']))
+
+        if not tasks:
+            self.stdout.write(self.style.SUCCESS('All images already have derivatives.'))
+            return
+
+        generated = failed = 0
+        with images.process_pool(options['processes']) as pool:
+            for future in as_completed([pool.submit(_generate, task) for task in tasks]):
+                (label, pk, field_name, _force), created, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{label} #{pk} {field_name}: {error}')
+                elif created:
+                    generated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {generated} of {len(tasks)} image(s); {failed} failed.'
+        ))
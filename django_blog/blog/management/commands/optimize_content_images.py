@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from admin_panel.models import Post
+from blog import images
+
+
+def _optimize(pk):
+    try:
+        return pk, images.optimize_post_content(pk), None
+    except Exception as exc:
+        return pk, 0, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = 'Downscale images embedded in post bodies and add responsive attributes to their <img> tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        post_ids = [
+            pk for pk, content in Post.objects.filter(content__icontains='<img').values_list('pk', 'content').iterator()
+            if images.content_needs_optimizing(content)
+        ]
+        if not post_ids:
+            self.stdout.write(self.style.SUCCESS('No post bodies need optimizing.'))
+            return
+
+        rewritten = failed = 0
+        with images.process_pool(options['processes']) as pool:
+            for future in as_completed([pool.submit(_optimize, pk) for pk in post_ids]):
+                pk, count, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Post #{pk}: {error}')
+                rewritten += count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rewrote {rewritten} image(s) across {len(post_ids)} post(s); {failed} post(s) failed.'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.related import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored related posts of every published post'
+
+    def handle(self, *args, **options):
+        count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Stored related posts for {count} post(s).'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import reconcile_comment_counts, reconcile_tag_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters and repair any drift'
+
+    def handle(self, *args, **options):
+        drifted_tags = reconcile_tag_counts()
+        self.stdout.write(self.style.SUCCESS(f'Repaired {drifted_tags} tag post count(s).'))
+
+        drifted_posts = reconcile_comment_counts()
+        self.stdout.write(self.style.SUCCESS(f'Repaired {drifted_posts} post comment count(s).'))
@@ -0,0 +1,244 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from admin_panel.models import Comment, Post, PostViewDaily, Subscriber, Tag, User
+from blog import page_cache, sidebar, suggest
+
+WORDS = (
+    'django python query index cache latency database template request server worker thread '
+    'migration model view form signal middleware deploy release benchmark profile memory '
+    'design pattern testing review refactor feature bug patch commit branch merge pipeline '
+    'static media image upload search feed sitemap reader writer author editor newsletter '
+    'subscriber comment tag post draft publish schedule archive backup replica primary '
+    'connection pool timeout retry queue batch stream cursor page offset keyset count '
+    'simple fast robust clean modern practical complete gentle careful quick deep small large '
+    'guide tutorial notes lessons story journey tips tricks checklist overview primer'
+).split()
+FIRST_NAMES = 'Ada Alan Grace Linus Guido Barbara Ken Dennis Margaret Edsger Donald Frances'.split()
+LAST_NAMES = 'Lovelace Turing Hopper Torvalds Rossum Liskov Thompson Ritchie Hamilton Dijkstra Knuth Allen'.split()
+LANGUAGES = ['python', 'bash', 'sql', 'javascript']
+
+
+@contextmanager
+def backdated(*fields):
+    """Let ``bulk_create`` keep the timestamps set on the instances"""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def field(model, name):
+    return model._meta.get_field(name)
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate users, posts, tags, comments and subscribers for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--subscribers', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365, help='Spread creation dates over this many days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same data')
+        parser.add_argument('--prefix', default='seed', help='Prefix of generated usernames, slugs and emails')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Don't rebuild counters, search index, related posts and analytics afterwards")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 and options['posts']:
+            raise CommandError('Posts need at least one user.')
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('The database must return primary keys from bulk inserts (PostgreSQL, SQLite 3.35+).')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.now = timezone.now()
+        self.days = max(options['days'], 1)
+
+        with transaction.atomic():
+            authors = self.create_users(options['users'])
+            tags = self.create_tags(options['tags'])
+            posts = self.create_posts(options['posts'], authors)
+            self.link_tags(posts, tags)
+            self.create_comments(options['comments'], posts)
+            self.create_views(posts)
+            self.create_subscribers(options['subscribers'])
+
+        if not options['skip_derived']:
+            self.stdout.write('Rebuilding derived data...')
+            for command, kwargs in [
+                ('reconcile_counters', {}),
+                ('rebuild_search_index', {}),
+                ('rebuild_related_posts', {}),
+                ('rollup_analytics', {'backfill': True}),
+            ]:
+                call_command(command, stdout=self.stdout, **kwargs)
+        # bulk_create sends no signals; drop every cached view of the old data
+        suggest.invalidate()
+        sidebar.refresh_sidebar()
+        page_cache.bump(['site'])
+        self.stdout.write(self.style.SUCCESS('Seeding complete.'))
+
+    def timestamp(self, after=None):
+        start = after or self.now - timedelta(days=self.days)
+        return start + (self.now - start) * self.rng.random()
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def sentence(self):
+        return self.words(self.rng.randint(8, 20)).capitalize() + '.'
+
+    def paragraph(self):
+        text = ' '.join(self.sentence() for _ in range(self.rng.randint(3, 6)))
+        # A little inline markup, as editors add it
+        first, _, rest = text.partition(' ')
+        return f'<p><strong>{first}</strong> {rest} <a href="https://example.com/{self.rng.choice(WORDS)}">' \
+               f'{self.rng.choice(WORDS)}</a> <em>{self.words(2)}</em>.</p>'
+
+    def content(self):
+        """HTML shaped like CKEditor 4 output: blocks separated by blank CRLF lines"""
+        blocks = [self.paragraph()]
+        for _ in range(self.rng.randint(2, 5)):
+            blocks.append(f'<h2>{self.words(self.rng.randint(2, 5)).title()}</h2>')
+            blocks.extend(self.paragraph() for _ in range(self.rng.randint(1, 3)))
+            extra = self.rng.random()
+            if extra < 0.3:
+                items = ''.join(f'\r\n\t<li>{self.words(self.rng.randint(3, 8))}</li>' for _ in range(self.rng.randint(3, 6)))
+                blocks.append(f'<ul>{items}\r\n</ul>')
+            elif extra < 0.45:
+                blocks.append(f'<blockquote>\r\n<p>{self.sentence()}</p>\r\n</blockquote>')
+            elif extra < 0.6:
+                code = '\r\n'.join(f'{self.rng.choice(WORDS)} = {self.rng.choice(WORDS)}()' for _ in range(4))
+                blocks.append(f'<pre>\r\n<code class="language-{self.rng.choice(LANGUAGES)}">{code}</code></pre>')
+        return '\r\n\r\n'.join(blocks)
+
+    def offset(self, model, lookup, value):
+        """How many rows earlier runs generated, so names stay unique"""
+        return model.objects.filter(**{lookup: value}).count()
+
+    def create_users(self, count):
+        start = self.offset(User, 'username__startswith', f'{self.prefix}-user-')
+        # Hashing is slow by design; every generated user shares one password
+        password = make_password('password')
+        users = []
+        for number in range(start, start + count):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            users.append(User(
+                username=f'{self.prefix}-user-{number}', email=f'{self.prefix}-user-{number}@example.com',
+                first_name=first, last_name=last, password=password, bio=self.sentence(),
+                is_staff=True, date_joined=self.timestamp(), created_at=self.timestamp(),
+                # The first one can sign in to every admin page, e.g. for benchmark_views
+                is_superuser=number == 0,
+            ))
+        with backdated(field(User, 'created_at')):
+            users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(users)} user(s).')
+        return users
+
+    def create_tags(self, count):
+        start = self.offset(Tag, 'slug__startswith', f'{self.prefix}-')
+        tags = []
+        for number in range(start, start + count):
+            name = f'{self.prefix} {self.rng.choice(WORDS)} {number}'
+            tags.append(Tag(name=name, slug=slugify(name), created_at=self.timestamp()))
+        with backdated(field(Tag, 'created_at')):
+            tags = Tag.objects.bulk_create(tags, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(tags)} tag(s).')
+        return tags
+
+    def create_posts(self, count, authors):
+        start = self.offset(Post, 'slug__startswith', f'{self.prefix}-')
+        posts = []
+        for number in range(start, start + count):
+            title = self.words(self.rng.randint(3, 8)).title()
+            created_at = self.timestamp()
+            published = self.rng.random() < 0.9
+            posts.append(Post(
+                title=title, slug=f'{self.prefix}-{slugify(title)[:150]}-{number}',
+                author=self.rng.choice(authors), content=self.content(), excerpt=self.sentence()[:300],
+                status='published' if published else 'draft', created_at=created_at,
+                published_at=created_at if published else None,
+            ))
+        with backdated(field(Post, 'created_at')):
+            posts = Post.objects.bulk_create(posts, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(posts)} post(s).')
+        return posts
+
+    def link_tags(self, posts, tags):
+        if not tags:
+            return
+        # Skewed, so a few tags are popular and most are not
+        weights = [1 / (rank + 1) for rank in range(len(tags))]
+        links = []
+        for post in posts:
+            for tag in set(self.rng.choices(tags, weights, k=self.rng.randint(1, min(4, len(tags))))):
+                links.append(Post.tags.through(post_id=post.pk, tag_id=tag.pk))
+        Post.tags.through.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+        self.stdout.write(f'Linked {len(links)} post tag(s).')
+
+    def create_comments(self, count, posts):
+        published = [post for post in posts if post.status == 'published']
+        if not published:
+            return
+        comments = []
+        for _ in range(count):
+            post = self.rng.choice(published)
+            first = self.rng.choice(FIRST_NAMES)
+            comments.append(Comment(
+                post=post, name=f'{first} {self.rng.choice(LAST_NAMES)}',
+                email=f'{first.lower()}@example.com', content=' '.join(self.sentence() for _ in range(2)),
+                approved=self.rng.random() < 0.8, created_at=self.timestamp(after=post.created_at),
+            ))
+            if len(comments) >= self.batch_size:
+                self.save_comments(comments)
+                comments = []
+        self.save_comments(comments)
+        self.stdout.write(f'Created {count} comment(s).')
+
+    def save_comments(self, comments):
+        with backdated(field(Comment, 'created_at')):
+            Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+
+    def create_views(self, posts):
+        """A week of daily view counts per published post, and the matching totals"""
+        today = timezone.localdate()
+        rows, totals = [], {}
+        for post in posts:
+            if post.status != 'published':
+                continue
+            for age in range(7):
+                views = int(self.rng.paretovariate(1.5) * 3)
+                rows.append(PostViewDaily(post_id=post.pk, date=today - timedelta(days=age), views=views))
+                totals[post.pk] = totals.get(post.pk, 0) + views
+        PostViewDaily.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+        updates = [Post(pk=pk, views=views * self.rng.randint(2, 20)) for pk, views in totals.items()]
+        Post.objects.bulk_update(updates, ['views'], batch_size=self.batch_size)
+
+    def create_subscribers(self, count):
+        start = self.offset(Subscriber, 'email__startswith', f'{self.prefix}-reader-')
+        subscribers = [
+            Subscriber(
+                email=f'{self.prefix}-reader-{number}@example.com', subscribed_at=self.timestamp(),
+                is_active=self.rng.random() < 0.95,
+            )
+            for number in range(start, start + count)
+        ]
+        with backdated(field(Subscriber, 'subscribed_at')):
+            Subscriber.objects.bulk_create(subscribers, batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(subscribers)} subscriber(s).')
@@ -0,0 +1,211 @@
+"""
+Full-page cache for anonymous readers.
+
+Public pages are cached whole, keyed on the URL plus the current *version*
+of every dependency the page declares, for example ``post:<slug>``,
+``author:<id>``, ``tag:<slug>`` or ``home``. Every page also depends on
+``site`` for the rare changes that show up everywhere (a tag or an author
+renamed). Of the query string only the ``KEY_PARAMS`` the views read count,
+so tracking parameters, their order or an empty ``?page=`` don't store
+another copy of a page. Changing content bumps the versions of exactly the dependencies it
+touches (see ``post_dependencies()``), which retires the affected pages at
+once; nothing has to be deleted.
+
+Versions live in the ``shared`` cache alias so an invalidation is seen by
+every worker immediately, provided ``CACHE_URL`` names a cache the workers
+actually share (settings refuse a per-process one outside ``DEBUG``). Page
+bodies go through the tiered ``default`` alias because a versioned key
+never changes meaning. Bodies are stored with the CSRF token replaced by a
+placeholder and each hit gets the visitor's own token.
+
+Only GET/HEAD requests without a session, pending messages or the read
+replica ``STICKY_COOKIE`` are served from or stored in the cache, and only
+200 responses are stored. View counts printed on cached pages may lag by up
+to ``PAGE_CACHE_TIMEOUT`` seconds; the counting itself happens on every hit.
+
+The same key doubles as the page's ``ETag``, so a reader revalidating a page
+whose dependencies haven't changed gets a 304 without the view running or
+the body being read from the cache.
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+
+from admin_panel.models import Post
+from django_blog import db_router
+from .sitemaps import chunk_of
+
+VERSION_PREFIX = 'page:version:'
+CSRF_PLACEHOLDER = 'PAGE-CACHE-CSRF-TOKEN'
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+HEADERS = ('Content-Type', 'Content-Language')
+# Query parameters a cached view's output depends on
+KEY_PARAMS = ('page', 'cursor', 'q')
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def versions_cache():
+    return caches['shared']
+
+
+def dependency_versions(dependencies):
+    """Current version of each dependency, creating missing ones"""
+    keys = [VERSION_PREFIX + name for name in dependencies]
+    found = versions_cache().get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Time-seeded so an evicted version never comes back as an old value
+            versions_cache().add(key, int(time.time() * 1000), None)
+            found[key] = versions_cache().get(key)
+    return [found[key] for key in keys]
+
+
+def bump(dependencies):
+    # Pages re-rendered now must not come from a replica that hasn't caught up
+    db_router.record_write()
+    for name in set(dependencies):
+        try:
+            versions_cache().incr(VERSION_PREFIX + name)
+        except ValueError:
+            # Never read, so no page was cached against it
+            pass
+
+
+def invalidate(dependencies):
+    """Retire the pages of ``dependencies`` once the current transaction commits"""
+    dependencies = list(dependencies)
+    if dependencies:
+        transaction.on_commit(lambda: bump(dependencies))
+
+
+def post_dependencies(post, tag_slugs=None):
+    """Everything that shows ``post``: home, its page, its author's and tags' pages, the sitemap"""
+    dependencies = [
+        'home', f'post:{post.slug}', f'author:{post.author_id}', 'sitemap', f'sitemap:posts:{chunk_of(post.pk)}',
+    ]
+    if post._loaded_slug and post._loaded_slug != post.slug:
+        dependencies.append(f'post:{post._loaded_slug}')
+    if tag_slugs is None:
+        tag_slugs = post.tags.values_list('slug', flat=True)
+    dependencies += [f'tag:{slug}' for slug in tag_slugs]
+    # Pages listing it under "Related Posts"
+    dependencies += [
+        f'post:{slug}' for slug in
+        Post.objects.filter(related_entries__related_id=post.pk).values_list('slug', flat=True)
+    ]
+    return dependencies
+
+
+def post_pages(post_ids):
+    return [f'post:{slug}' for slug in Post.objects.filter(pk__in=post_ids).values_list('slug', flat=True)]
+
+
+def is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # A session may mean a signed-in user or per-visitor content; stay out of the way
+    if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+        return False
+    # Readers who just wrote something get pages fresh from the primary
+    return db_router.STICKY_COOKIE not in request.COOKIES
+
+
+def page_url(request):
+    """The request's URL with only its ``KEY_PARAMS``, in a fixed order"""
+    # The value a view reads with GET.get() is the last one
+    query = urlencode([(name, request.GET[name]) for name in KEY_PARAMS if request.GET.get(name)])
+    # Host and scheme too: feeds and sitemaps carry absolute URLs
+    url = f'{request.scheme}://{request.get_host()}{request.path}'
+    return f'{url}?{query}' if query else url
+
+
+def page_key(request, dependencies):
+    versions = ':'.join(str(version) for version in dependency_versions(dependencies))
+    digest = hashlib.md5(f'{page_url(request)}|{versions}'.encode()).hexdigest()
+    return f'page:{digest}'
+
+
+def page_etag(key):
+    return '"%s"' % key.split(':', 1)[1]
+
+
+def cached_response(request, entry):
+    content = entry['content']
+    if CSRF_PLACEHOLDER.encode() in content:
+        content = content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    response = HttpResponse(content, status=entry['status'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def store(key, response):
+    content = response.content
+    # Tokens are per visitor; every hit fills in its own
+    for token in set(CSRF_INPUT.findall(content.decode(response.charset))):
+        content = content.replace(token.encode(), CSRF_PLACEHOLDER.encode())
+    cache.set(key, {
+        'content': content,
+        'status': response.status_code,
+        'headers': {header: response[header] for header in HEADERS if response.has_header(header)},
+        'extra': getattr(response, 'page_cache_extra', None),
+    }, get_timeout())
+
+
+def cache_anonymous_page(dependencies, on_hit=None):
+    """
+    Serve the view from the page cache for anonymous readers.
+    ``dependencies(**view_kwargs)`` names what the page shows; ``on_hit(extra)``
+    runs for every cached hit with the ``page_cache_extra`` the view attached
+    to its response (e.g. to count a post view).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, ['site', *dependencies(**kwargs)])
+            etag = page_etag(key)
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                if response.status_code == 304:
+                    response['ETag'] = etag
+                    # Still a read of the page; count it if the view wants that
+                    entry = cache.get(key) if on_hit is not None else None
+                    if entry is not None:
+                        on_hit(entry['extra'])
+                return response
+
+            entry = cache.get(key)
+            if entry is not None:
+                if on_hit is not None:
+                    on_hit(entry['extra'])
+                response = cached_response(request, entry)
+                response['ETag'] = etag
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.add_post_render_callback(lambda rendered: store(key, rendered))
+                else:
+                    store(key, response)
+                response['ETag'] = etag
+            response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,196 @@
+"""
+Related-posts engine.
+
+Posts are compared as tag vectors weighted by inverse document frequency, so
+sharing a rare tag counts for more than sharing a tag that is on half the
+blog. The similarity of two posts is the cosine of their vectors:
+
+    score(p, q) = sum(idf(t) ** 2 for t in shared tags) / (|p| * |q|)
+
+The top ``RELATED_POSTS_STORED`` neighbours of every published post are kept
+in ``RelatedPost`` so the detail page reads them with one indexed lookup.
+When one post changes, ``update_post()`` recomputes its own list and, since
+the score is symmetric, moves, inserts or drops the post's entry in the
+lists it can enter or leave; only a full list the post drops out of is
+recomputed, as a post outside it may take the freed place. Signal handlers
+queue this with ``schedule_update()``, which runs it once per post after
+the transaction commits, however many saves and tag changes it made.
+``python manage.py rebuild_related_posts`` recomputes everything (and picks
+up tag frequency drift).
+"""
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from admin_panel.models import Post, RelatedPost, Tag
+
+PostTag = Post.tags.through
+
+# How many candidates sharing the most tag weight get an exact score
+CANDIDATE_LIMIT = 200
+
+
+def stored_count():
+    return getattr(settings, 'RELATED_POSTS_STORED', 6)
+
+
+def tag_weights(tag_ids=None):
+    """Inverse document frequency of each tag among published posts"""
+    total = Post.objects.filter(status='published').count()
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(pk__in=tag_ids)
+    return {
+        pk: math.log((total + 1) / (count + 1)) + 1
+        for pk, count in tags.values_list('pk', 'published_post_count')
+    }
+
+
+def score_candidates(post_id):
+    """``{other_post_id: score}`` for the published posts most similar to ``post_id``"""
+    tag_ids = list(PostTag.objects.filter(post_id=post_id).values_list('tag_id', flat=True))
+    if not tag_ids:
+        return {}
+
+    # Cheap pre-filter in SQL: posts sharing the most tags
+    candidates = list(
+        PostTag.objects
+        .filter(tag_id__in=tag_ids, post__status='published')
+        .exclude(post_id=post_id)
+        .values('post_id')
+        .annotate(shared=Count('tag_id'))
+        .order_by('-shared', '-post_id')
+        .values_list('post_id', flat=True)[:CANDIDATE_LIMIT]
+    )
+    if not candidates:
+        return {}
+
+    candidate_tags = defaultdict(set)
+    for other_id, tag_id in PostTag.objects.filter(post_id__in=candidates).values_list('post_id', 'tag_id'):
+        candidate_tags[other_id].add(tag_id)
+
+    own_tags = set(tag_ids)
+    weights = tag_weights(own_tags.union(*candidate_tags.values()))
+    own_norm = math.sqrt(sum(weights.get(tag, 1) ** 2 for tag in own_tags))
+
+    scores = {}
+    for other_id, other_tags in candidate_tags.items():
+        shared = sum(weights.get(tag, 1) ** 2 for tag in own_tags & other_tags)
+        other_norm = math.sqrt(sum(weights.get(tag, 1) ** 2 for tag in other_tags))
+        if shared:
+            scores[other_id] = shared / (own_norm * other_norm)
+    return scores
+
+
+def store_neighbours(post_id, scores):
+    """Replace the stored neighbour list of ``post_id`` with the best of ``scores``"""
+    best = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:stored_count()]
+    RelatedPost.objects.filter(post_id=post_id).delete()
+    RelatedPost.objects.bulk_create([
+        RelatedPost(post_id=post_id, related_id=other_id, score=score, rank=rank)
+        for rank, (other_id, score) in enumerate(best)
+    ])
+
+
+def recompute(post_id):
+    store_neighbours(post_id, score_candidates(post_id))
+
+
+def rank_key(item):
+    """Sort key of a ``(post_id, score)`` neighbour: best score first, ties to the newer post"""
+    post_id, score = item
+    return -score, -post_id
+
+
+@transaction.atomic
+def update_post(post):
+    """Bring the stored neighbours up to date after ``post``'s tags or status changed"""
+    if post.status != 'published':
+        RelatedPost.objects.filter(post_id=post.pk).delete()
+        scores = {}
+    else:
+        scores = score_candidates(post.pk)
+        store_neighbours(post.pk, scores)
+
+    # The score is symmetric, so the lists of other posts only change by
+    # this post's own entry: moved, inserted, or dropped
+    limit = stored_count()
+    lists = {other_id: {} for other_id in [*scores, *listing_posts(post.pk)]}
+    for other_id, related_id, score in (
+        RelatedPost.objects.filter(post_id__in=lists).order_by().values_list('post_id', 'related_id', 'score')
+    ):
+        lists[other_id][related_id] = score
+
+    changed, stale = {}, []
+    for other_id, entries in lists.items():
+        listed = post.pk in entries
+        score = scores.get(other_id)
+        others = {related_id: value for related_id, value in entries.items() if related_id != post.pk}
+        lowest = max(others.items(), key=rank_key, default=None)
+        full = len(entries) >= limit
+        if listed and full and (score is None or lowest is None or rank_key((post.pk, score)) > rank_key(lowest)):
+            # Dropped or now last of a full list: a post outside it may take its place
+            stale.append(other_id)
+        elif listed:
+            changed[other_id] = {**others, post.pk: score} if score else others
+        elif score and (not full or rank_key((post.pk, score)) < rank_key(lowest)):
+            changed[other_id] = {**others, post.pk: score}
+
+    if changed:
+        RelatedPost.objects.filter(post_id__in=changed).delete()
+        RelatedPost.objects.bulk_create([
+            RelatedPost(post_id=other_id, related_id=related_id, score=score, rank=rank)
+            for other_id, entries in changed.items()
+            for rank, (related_id, score) in enumerate(sorted(entries.items(), key=rank_key)[:limit])
+        ])
+    for other_id in stale:
+        recompute(other_id)
+
+
+_pending = threading.local()
+
+
+def schedule_update(post_id):
+    """``update_post()`` once the current transaction commits, once however often it is asked for"""
+    pending = getattr(_pending, 'post_ids', None)
+    if pending is None:
+        pending = _pending.post_ids = set()
+    pending.add(post_id)
+    transaction.on_commit(lambda: _run_update(post_id))
+
+
+def _run_update(post_id):
+    # Saves and retags of one transaction each queue a callback; the first does the work
+    if post_id not in _pending.post_ids:
+        return
+    _pending.post_ids.discard(post_id)
+    post = Post.objects.filter(pk=post_id).only('pk', 'status').first()
+    if post is not None:
+        update_post(post)
+
+
+def listing_posts(post_id):
+    """Ids of the posts whose stored neighbours include ``post_id``"""
+    return list(RelatedPost.objects.filter(related_id=post_id).order_by().values_list('post_id', flat=True))
+
+
+def rebuild_all():
+    """Recompute the neighbours of every published post"""
+    RelatedPost.objects.exclude(post__status='published').delete()
+    post_ids = list(Post.objects.filter(status='published').order_by('pk').values_list('pk', flat=True))
+    for post_id in post_ids:
+        with transaction.atomic():
+            recompute(post_id)
+    return len(post_ids)
+
+
+def related_posts(post, limit=3):
+    """Stored neighbours of ``post``: a single indexed query"""
+    return [
+        entry.related for entry in
+        RelatedPost.objects.filter(post=post, related__status='published')
+        .select_related('related')
+        .order_by('rank')[:limit]
+    ]
@@ -0,0 +1,234 @@
+"""
+Full-text search over published posts.
+
+Each published post has a ``SearchDocument`` holding its title, excerpt,
+HTML-stripped content and tag names. The document is kept up to date by the
+signal handlers in ``blog.signals`` and can be rebuilt from scratch with
+``python manage.py rebuild_search_index``.
+
+The backend is picked from the database in use:
+
+* PostgreSQL - a weighted ``tsvector`` column with a GIN index
+* SQLite     - an FTS5 table kept in sync by triggers, ranked with bm25
+* otherwise  - a portable ``icontains`` scan over the stripped documents,
+  ranked by weighted term counts computed in the query
+"""
+import html
+import operator
+import re
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections, router
+from django.db.models import ExpressionWrapper, F, IntegerField, Q, Value
+from django.db.models.functions import Length, Lower, Replace
+from django.utils.html import strip_tags
+
+from admin_panel.models import Post, SearchDocument
+
+FTS_TABLE = 'admin_panel_searchdocument_fts'
+SEARCH_CONFIG = 'english'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def html_to_text(value):
+    """Strip markup and entities from CKEditor HTML"""
+    text = html.unescape(strip_tags(value or ''))
+    return ' '.join(text.split())
+
+
+def build_document(post, tag_names=None):
+    """Build (but don't save) the search document for a post"""
+    if tag_names is None:
+        tag_names = post.tags.values_list('name', flat=True)
+    return SearchDocument(
+        post_id=post.pk,
+        title=post.title,
+        body=f'{post.excerpt}\n{html_to_text(post.content)}',
+        tags=' '.join(tag_names),
+    )
+
+
+class PostgresBackend:
+    """Weighted tsvector ranked with ts_rank; title > tags > body"""
+
+    vector = (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('tags', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('body', weight='C', config=SEARCH_CONFIG)
+    )
+
+    def documents_saved(self, post_ids=None):
+        documents = SearchDocument.objects.all()
+        if post_ids is not None:
+            documents = documents.filter(post_id__in=post_ids)
+        documents.update(search_vector=self.vector)
+
+    def matching_ids(self, query, limit):
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        return list(
+            SearchDocument.objects
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-post__published_at')
+            .values_list('post_id', flat=True)[:limit]
+        )
+
+
+class SQLiteFTSBackend:
+    """FTS5 table maintained by triggers on admin_panel_searchdocument"""
+
+    def documents_saved(self, post_ids=None):
+        pass
+
+    def matching_ids(self, query, limit):
+        terms = WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        # Quote every term so user input can't inject FTS5 syntax; the last
+        # one is a prefix match so partially typed words still hit.
+        match = ' '.join('"%s"' % term for term in terms) + '*'
+        # Raw SQL skips the router; ask it, so search reads from a replica too
+        with connections[router.db_for_read(SearchDocument)].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 4.0) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SimpleBackend:
+    """Fallback for databases without a native full-text index"""
+
+    weights = {'title': 10, 'tags': 4, 'body': 1}
+
+    def documents_saved(self, post_ids=None):
+        pass
+
+    def matching_ids(self, query, limit):
+        terms = WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(tags__icontains=term) | Q(body__icontains=term)
+        # Every match is ranked before the limit applies
+        return list(
+            SearchDocument.objects.filter(condition)
+            .annotate(score=self.score(terms))
+            .order_by('-score', 'post_id')
+            .values_list('post_id', flat=True)[:limit]
+        )
+
+    def score(self, terms):
+        """Weighted number of times the terms occur, counted by what removing them takes off the length"""
+        counts = [
+            Value(weight) * (Length(Lower(name)) - Length(Replace(Lower(name), Value(term), Value('')))) / len(term)
+            for term in terms
+            for name, weight in self.weights.items()
+        ]
+        return ExpressionWrapper(reduce(operator.add, counts), output_field=IntegerField())
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'postgresql':
+            _backend = PostgresBackend()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = SimpleBackend()
+    return _backend
+
+
+def index_post(post):
+    """Create, refresh or drop the search document for a single post"""
+    if post.status != 'published':
+        remove_post(post.pk)
+        return
+    document = build_document(post)
+    SearchDocument.objects.update_or_create(
+        post_id=post.pk,
+        defaults={'title': document.title, 'body': document.body, 'tags': document.tags},
+    )
+    get_backend().documents_saved([post.pk])
+
+
+def remove_post(post_id):
+    SearchDocument.objects.filter(post_id=post_id).delete()
+
+
+def rebuild_index(batch_size=500):
+    """Drop every search document and re-index all published posts"""
+    SearchDocument.objects.all().delete()
+    posts = (
+        Post.objects.filter(status='published')
+        .only('id', 'title', 'excerpt', 'content')
+        .prefetch_related('tags')
+        .order_by('pk')
+    )
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        SearchDocument.objects.bulk_create([
+            build_document(post, [tag.name for tag in post.tags.all()]) for post in batch
+        ])
+        last_pk = batch[-1].pk
+        indexed += len(batch)
+    get_backend().documents_saved()
+    return indexed
+
+
+class SearchResults:
+    """
+    Lazily loaded, ranked search hits. Only the post ids are held in memory;
+    the paginator's slice is fetched as full posts on demand.
+    """
+
+    def __init__(self, post_ids):
+        self.ranked_ids = post_ids
+        self._post_ids = None
+
+    @property
+    def post_ids(self):
+        """The ranked ids of posts still published; the index may trail a delete or unpublish"""
+        if self._post_ids is None:
+            published = set(
+                Post.objects.filter(pk__in=self.ranked_ids, status='published').values_list('pk', flat=True)
+            )
+            self._post_ids = [post_id for post_id in self.ranked_ids if post_id in published]
+        return self._post_ids
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def count(self):
+        return len(self.post_ids)
+
+    def __getitem__(self, index):
+        post_ids = self.post_ids[index]
+        if not isinstance(index, slice):
+            post_ids = [post_ids]
+        posts = (
+            Post.objects.filter(pk__in=post_ids, status='published')
+            .select_related('author')
+            .prefetch_related('tags')
+            .in_bulk()
+        )
+        found = [posts[post_id] for post_id in post_ids if post_id in posts]
+        return found if isinstance(index, slice) else found[0]
+
+
+def search_posts(query):
+    """Rank published posts against ``query``"""
+    limit = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+    return SearchResults(get_backend().matching_ids(query, limit))
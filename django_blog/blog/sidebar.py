@@ -0,0 +1,145 @@
+"""
+Precomputed homepage sidebar blocks: featured posts (by views), recent posts
+and popular tags.
+
+The blocks live in the cache under a single key, so a homepage hit costs
+one cache read. When something they depend on changes, ``schedule_refresh()``
+recomputes them on a background thread once the current transaction
+commits; readers keep getting the previous blocks until the new ones are
+stored. The entry also expires after ``SIDEBAR_TIMEOUT`` seconds, which
+bounds how long a missed refresh can show. Only a cold or expired entry is
+filled on the request path, and that fill retires no cached pages: it
+replaced nothing they showed.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.dispatch import Signal
+
+from admin_panel.models import Post, Tag
+
+logger = logging.getLogger(__name__)
+
+SIDEBAR_KEY = 'blog:sidebar'
+FEATURED_COUNT = 3
+RECENT_COUNT = 5
+POPULAR_TAG_COUNT = 10
+
+# Sent after freshly computed blocks replace the stored ones
+sidebar_refreshed = Signal()
+
+
+def get_timeout():
+    return getattr(settings, 'SIDEBAR_TIMEOUT', 300)
+
+
+def compute_sidebar():
+    published = Post.objects.filter(status='published')
+    featured = list(
+        published.select_related('author').prefetch_related('tags').order_by('-views', '-published_at')[:FEATURED_COUNT]
+    )
+    recent = list(published.order_by('-published_at')[:RECENT_COUNT])
+    popular_tags = list(
+        Tag.objects.filter(published_post_count__gt=0).order_by('-published_post_count')[:POPULAR_TAG_COUNT]
+    )
+    return {
+        'featured_posts': featured,
+        'recent_posts': recent,
+        'popular_tags': popular_tags,
+        # Needed to decide cheaply whether a view count flush reorders the
+        # blocks: each featured post's sort key, as the query above orders by
+        'featured_ranking': [(post.pk, post.views, post.published_at) for post in featured],
+        'post_ids': {post.pk for post in featured + recent},
+    }
+
+
+def refresh_sidebar(notify=True):
+    blocks = compute_sidebar()
+    cache.set(SIDEBAR_KEY, blocks, get_timeout())
+    if notify:
+        sidebar_refreshed.send(sender=None, blocks=blocks)
+    return blocks
+
+
+def get_sidebar():
+    """The cached blocks; computed on the request path only when the entry is missing"""
+    blocks = cache.get(SIDEBAR_KEY)
+    if blocks is None:
+        # Pages rendered from here on show these blocks; nothing to retire
+        blocks = refresh_sidebar(notify=False)
+    return blocks
+
+
+_refresh_lock = threading.Lock()
+_refresh_running = False
+_refresh_again = False
+
+
+def _refresh_in_background():
+    global _refresh_running, _refresh_again
+    try:
+        while True:
+            try:
+                refresh_sidebar()
+            except Exception:
+                logger.exception('Sidebar refresh failed')
+            with _refresh_lock:
+                if not _refresh_again:
+                    _refresh_running = False
+                    return
+                _refresh_again = False
+    finally:
+        connections.close_all()
+
+
+def _start_refresh():
+    global _refresh_running, _refresh_again
+    with _refresh_lock:
+        if _refresh_running:
+            # Coalesce bursts of changes into one more pass
+            _refresh_again = True
+            return
+        _refresh_running = True
+    threading.Thread(target=_refresh_in_background, name='sidebar-refresh', daemon=True).start()
+
+
+def schedule_refresh():
+    """Recompute the blocks off the request path after the current transaction commits"""
+    transaction.on_commit(_start_refresh)
+
+
+def post_affects_sidebar(post, status_changed):
+    """Whether saving ``post`` can change what the sidebar shows"""
+    if status_changed:
+        return True
+    blocks = cache.get(SIDEBAR_KEY)
+    return blocks is None or post.pk in blocks['post_ids']
+
+
+def views_reorder_featured(post_ids):
+    """
+    Whether freshly flushed view counts for ``post_ids`` change the featured
+    ranking. Costs one indexed query, and only for posts that could qualify.
+    """
+    blocks = cache.get(SIDEBAR_KEY)
+    if blocks is None:
+        return False
+    if 'featured_ranking' not in blocks:
+        # Stored by an older release without the sort keys
+        return True
+    current = {pk: (views, published_at) for pk, views, published_at in blocks['featured_ranking']}
+    threshold = min(views for views, _ in current.values()) if len(current) >= FEATURED_COUNT else -1
+    candidates = {
+        pk: (views, published_at) for pk, views, published_at in
+        Post.objects.filter(pk__in=post_ids, status='published', views__gte=threshold)
+        .values_list('pk', 'views', 'published_at')
+    }
+    if not candidates:
+        return False
+    ranking = {**current, **candidates}
+    # Most views first, then the most recently published, like compute_sidebar()
+    top = sorted(ranking, key=ranking.get, reverse=True)[:FEATURED_COUNT]
+    return top != [pk for pk, _, _ in blocks['featured_ranking']]
@@ -0,0 +1,316 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from admin_panel import analytics
+from admin_panel.models import Comment, Post, Subscriber, Tag, User
+from . import counters, images, page_cache, related, search, sidebar, suggest
+from .images import variants_generated
+from .sidebar import sidebar_refreshed
+from .view_counter import views_flushed
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    """Keep the post's search document in step with its content and status"""
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_retagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Tag names are part of the document, so re-index when tags are (un)linked"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_post(instance)
+    elif pk_set:
+        for post in Post.objects.filter(pk__in=pk_set, status='published'):
+            search.index_post(post)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        for post in instance.posts.filter(status='published'):
+            search.index_post(post)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_posts(sender, instance, **kwargs):
+    instance._tagged_post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_untagged_posts(sender, instance, **kwargs):
+    for post in Post.objects.filter(pk__in=getattr(instance, '_tagged_post_ids', []), status='published'):
+        search.index_post(post)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def refresh_suggestions(sender, raw=False, **kwargs):
+    """Titles, slugs or tags may have changed; have workers rebuild their prefix index"""
+    if not raw:
+        suggest.invalidate()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_suggestions_for_retagged_post(sender, action, **kwargs):
+    """Only tags on a published post are suggested"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        suggest.invalidate()
+
+
+@receiver(post_save, sender=Post)
+def refresh_sidebar_for_post(sender, instance, raw=False, **kwargs):
+    if not raw and sidebar.post_affects_sidebar(instance, instance.status_changed()):
+        sidebar.schedule_refresh()
+
+
+@receiver(post_delete, sender=Post)
+def refresh_sidebar_for_deleted_post(sender, instance, **kwargs):
+    if instance.status == 'published':
+        sidebar.schedule_refresh()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_sidebar_for_retagged_post(sender, action, **kwargs):
+    """Popular tag counts are part of the sidebar"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        sidebar.schedule_refresh()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def refresh_sidebar_for_tag(sender, raw=False, **kwargs):
+    if not raw:
+        sidebar.schedule_refresh()
+
+
+@receiver(views_flushed)
+def refresh_sidebar_ranking(sender, counts, **kwargs):
+    if sidebar.views_reorder_featured(list(counts)):
+        sidebar.schedule_refresh()
+
+
+@receiver(post_save, sender=Post)
+def count_status_change(sender, instance, raw=False, **kwargs):
+    """Publishing or unpublishing moves the post in or out of its tags' counts"""
+    if not raw and instance.status_changed():
+        delta = 1 if instance.status == 'published' else -1
+        counters.adjust_tag_counts(list(instance.tags.values_list('pk', flat=True)), delta)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_tag_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # The cleared rows are gone by post_clear, so note them now
+        if reverse:
+            instance._cleared_published = counters.published_count(
+                list(instance.posts.values_list('pk', flat=True))
+            )
+        elif instance.status == 'published':
+            instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+        return
+
+    if action == 'post_clear':
+        if reverse:
+            counters.adjust_tag_counts([instance.pk], -getattr(instance, '_cleared_published', 0))
+        else:
+            counters.adjust_tag_counts(getattr(instance, '_cleared_tag_ids', []), -1)
+        return
+
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        counters.adjust_tag_counts([instance.pk], delta * counters.published_count(pk_set))
+    elif instance.status == 'published':
+        counters.adjust_tag_counts(pk_set, delta)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_counted_tags(sender, instance, **kwargs):
+    if instance.status == 'published':
+        instance._counted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender, instance, **kwargs):
+    counters.adjust_tag_counts(getattr(instance, '_counted_tag_ids', []), -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_approval_change(sender, instance, created, raw=False, **kwargs):
+    """Covers comment creation and approve/unapprove from the admin panel"""
+    if raw or not instance._approval_changed:
+        return
+    counters.adjust_comment_count(instance.post_id, 1 if instance.approved else -1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    if instance._loaded_approved:
+        counters.adjust_comment_count(instance.post_id, -1)
+
+
+# Page cache. Registered before the related-posts receivers so the pages that
+# listed a post as related are found before the lists are recomputed
+@receiver(post_save, sender=Post)
+def retire_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw and (instance.status == 'published' or instance.status_changed()):
+        page_cache.invalidate(page_cache.post_dependencies(instance))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_pages(sender, instance, **kwargs):
+    if instance.status == 'published':
+        instance._page_dependencies = page_cache.post_dependencies(instance)
+
+
+@receiver(post_delete, sender=Post)
+def retire_deleted_post_pages(sender, instance, **kwargs):
+    page_cache.invalidate(getattr(instance, '_page_dependencies', []))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def retire_retagged_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if reverse:
+        # Cards list each post's tags, so this reaches pages of other tags too
+        page_cache.invalidate(['site'])
+    elif instance.status == 'published':
+        changed = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True) if pk_set else []
+        page_cache.invalidate(page_cache.post_dependencies(instance) + [f'tag:{slug}' for slug in changed])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def retire_tag_pages(sender, instance, created=False, raw=False, **kwargs):
+    # A new tag isn't on any page yet; a renamed or deleted one may be on all of them
+    if not created and not raw:
+        page_cache.invalidate(['site'])
+
+
+@receiver(post_save, sender=User)
+def retire_author_pages(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if created or raw or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    page_cache.invalidate(['site'])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def retire_commented_post_page(sender, instance, raw=False, **kwargs):
+    """Only approved comments are shown"""
+    if not raw and (instance.approved or instance._loaded_approved):
+        page_cache.invalidate(page_cache.post_pages([instance.post_id]))
+
+
+@receiver(sidebar_refreshed)
+def retire_home_pages(sender, **kwargs):
+    page_cache.invalidate(['home'])
+
+
+@receiver(variants_generated)
+def retire_pages_with_new_images(sender, instance, **kwargs):
+    if sender is Post:
+        page_cache.invalidate(page_cache.post_dependencies(instance))
+    else:
+        page_cache.invalidate(['site'])
+
+
+# Related posts: recomputed after the commit, so tag weights read the
+# published_post_count the counters above settled on
+@receiver(post_save, sender=Post)
+def relate_status_change(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status_changed():
+        related.schedule_update(instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def relate_retagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        related.schedule_update(instance.pk)
+    elif pk_set:
+        for post_id in pk_set:
+            related.schedule_update(post_id)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_listing_posts(sender, instance, **kwargs):
+    # The rows pointing at this post are cascaded away before post_delete
+    instance._listing_post_ids = related.listing_posts(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def relate_deleted_post(sender, instance, **kwargs):
+    for post_id in getattr(instance, '_listing_post_ids', []):
+        related.recompute(post_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=User)
+def generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    """A new upload gets its resized copies once the save commits"""
+    if raw:
+        return
+    for field_file in images.field_files(instance):
+        if field_file and images.current_variants(field_file) is None:
+            images.schedule(field_file)
+
+
+@receiver(post_save, sender=Post)
+def optimize_content_images(sender, instance, raw=False, **kwargs):
+    """Images pasted into the body through CKEditor are downscaled after the save commits"""
+    if not raw and images.content_needs_optimizing(instance.content):
+        images.schedule_content(instance)
+
+
+@receiver(variants_generated, sender=Post)
+def refresh_sidebar_images(sender, instance, **kwargs):
+    if sidebar.post_affects_sidebar(instance, status_changed=False):
+        sidebar.schedule_refresh()
+
+
+# Analytics: keep today's rollup row current
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def record_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        analytics.record(**{'total_posts' if sender is Post else 'total_comments': 1})
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def record_deleted(sender, instance, **kwargs):
+    analytics.record(**{'total_posts' if sender is Post else 'total_comments': -1})
+
+
+@receiver(post_save, sender=Subscriber)
+def record_subscribed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        analytics.record(new_subscribers=1)
+
+
+@receiver(post_delete, sender=Subscriber)
+def record_unsubscribed(sender, instance, **kwargs):
+    # Only a sign-up of today is still counted in a row that can change
+    if timezone.localdate(instance.subscribed_at) == timezone.localdate():
+        analytics.record(new_subscribers=-1)
+
+
+@receiver(views_flushed)
+def record_views(sender, counts, **kwargs):
+    analytics.record(total_views=sum(counts.values()))
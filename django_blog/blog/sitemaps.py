@@ -0,0 +1,74 @@
+"""
+XML sitemaps for posts, tags and authors.
+
+``/sitemap.xml`` is a sitemap index pointing at one sitemap per *chunk* of
+each section. Chunks are fixed primary-key ranges of ``SITEMAP_CHUNK_SIZE``
+rows rather than pages of a sorted list, so a post only ever appears in one
+chunk and editing it invalidates just that chunk (``sitemap:posts:<n>``) and
+the index (``sitemap``) in the page cache. Every other chunk keeps being
+served from the cache, which is what keeps this cheap with hundreds of
+thousands of posts.
+"""
+from django.conf import settings
+from django.db.models import F, IntegerField, Max
+from django.db.models.functions import Floor
+
+from admin_panel.models import Post, Tag, User
+
+
+def get_chunk_size():
+    # The sitemap protocol allows at most 50,000 URLs per file
+    return min(getattr(settings, 'SITEMAP_CHUNK_SIZE', 10000), 50000)
+
+
+def chunk_of(pk):
+    return pk // get_chunk_size()
+
+
+def published_posts():
+    return Post.objects.filter(status='published')
+
+
+def listed_tags():
+    return Tag.objects.filter(published_post_count__gt=0)
+
+
+def listed_authors():
+    return User.objects.filter(pk__in=published_posts().values('author_id'))
+
+
+# Section name -> (rows, field for <lastmod> or None, fields get_absolute_url needs)
+SECTIONS = {
+    'posts': (published_posts, 'updated_at', ('slug', 'updated_at')),
+    'tags': (listed_tags, None, ('slug',)),
+    'authors': (listed_authors, None, ('pk',)),
+}
+
+
+def section_dependencies(section, chunk):
+    """Page cache dependencies of one chunk"""
+    if section == 'posts':
+        return [f'sitemap:posts:{chunk}']
+    # Tags and authors come and go with the posts they have published
+    return ['sitemap']
+
+
+def chunks(section):
+    """``(chunk, lastmod)`` of every non-empty chunk of ``section``, in order"""
+    rows, lastmod_field, _fields = SECTIONS[section]
+    chunk = Floor(F('pk') / get_chunk_size(), output_field=IntegerField())
+    queryset = rows().annotate(chunk=chunk).values('chunk').order_by('chunk')
+    if lastmod_field:
+        return [(int(row['chunk']), row['lastmod']) for row in queryset.annotate(lastmod=Max(lastmod_field))]
+    return [(int(value), None) for value in queryset.distinct().values_list('chunk', flat=True)]
+
+
+def chunk_entries(section, chunk):
+    """``(path, lastmod)`` of every URL in one chunk"""
+    rows, lastmod_field, fields = SECTIONS[section]
+    size = get_chunk_size()
+    objects = rows().filter(pk__gte=chunk * size, pk__lt=(chunk + 1) * size).order_by('pk').only(*fields)
+    return [
+        (obj.get_absolute_url(), getattr(obj, lastmod_field) if lastmod_field else None)
+        for obj in objects
+    ]
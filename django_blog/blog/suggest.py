@@ -0,0 +1,154 @@
+"""
+Search-as-you-type suggestions for published post titles and tag names.
+
+Each worker keeps a compact prefix index in memory: a sorted list of the
+(interned) words that appear in every title and tag name, with a parallel
+array pointing back at the entry the word came from. A prefix lookup
+bisects out the range of words sharing the prefix and ranks every entry
+in it before applying the limit.
+
+Whenever a post or tag changes, ``invalidate()`` bumps a version number in
+the shared cache. Workers notice the new version on their next lookup and
+rebuild their index; responses are cached per (version, prefix).
+"""
+import hashlib
+import heapq
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from admin_panel.models import Post, Tag
+
+VERSION_KEY = 'blog:suggest:version'
+RESPONSE_TIMEOUT = 300
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 50
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+class PrefixIndex:
+    """Sorted word list over a fixed set of (kind, label, url) entries"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.labels = [normalize(label) for _, label, _ in entries]
+        pairs = sorted(
+            (sys.intern(word), position)
+            for position, label in enumerate(self.labels)
+            for word in set(label.split())
+        )
+        self.words = [word for word, _ in pairs]
+        self.positions = array('I', (position for _, position in pairs))
+
+    def lookup(self, query, limit=8):
+        terms = normalize(query).split()
+        if not terms:
+            return []
+        *leading, prefix = terms
+
+        # Every word starting with the prefix sorts before the prefix with
+        # its last character bumped
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        matches = set()
+        for position in set(self.positions[start:end]):
+            label_words = self.labels[position].split()
+            if all(any(word.startswith(term) for word in label_words) for term in leading):
+                matches.add(position)
+
+        # Entries that start with what was typed read best, then tags, then
+        # shorter labels, then index order (tags, then newest posts)
+        whole = ' '.join(terms)
+        best = heapq.nsmallest(limit, matches, key=lambda position: (
+            not self.labels[position].startswith(whole),
+            self.entries[position][0] != 'tag',
+            len(self.labels[position]),
+            position,
+        ))
+        return [
+            {'type': kind, 'label': label, 'url': url}
+            for kind, label, url in (self.entries[position] for position in best)
+        ]
+
+
+def build_index():
+    posts = (
+        Post.objects.filter(status='published')
+        .order_by('-published_at')
+        .values_list('title', 'slug')
+    )
+    tags = (
+        Tag.objects.filter(posts__status='published')
+        .distinct()
+        .values_list('name', 'slug')
+    )
+    entries = [('tag', name, Tag(slug=slug).get_absolute_url()) for name, slug in tags]
+    entries += [('post', title, Post(slug=slug).get_absolute_url()) for title, slug in posts]
+    return PrefixIndex(entries)
+
+
+_index = None
+_index_version = None
+_rebuild_lock = threading.Lock()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so an evicted version never repeats an old one
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def get_index(version):
+    """
+    Return this worker's index and the version it was built from, rebuilding
+    it first if ``version`` moved on
+    """
+    global _index, _index_version
+    if _index is not None and _index_version == version:
+        return _index, _index_version
+    # One thread rebuilds; the others keep answering from the old index
+    if _rebuild_lock.acquire(blocking=_index is None):
+        try:
+            if _index is None or _index_version != version:
+                _index = build_index()
+                _index_version = version
+        finally:
+            _rebuild_lock.release()
+    return _index, _index_version
+
+
+def suggest(query, limit=8):
+    """Title and tag suggestions for a partially typed query"""
+    prefix = normalize(query)[:MAX_PREFIX_LENGTH]
+    if len(prefix) < MIN_PREFIX_LENGTH:
+        return []
+    version = current_version()
+    digest = hashlib.md5(prefix.encode()).hexdigest()
+    key = f'blog:suggest:{version}:{limit}:{digest}'
+    suggestions = cache.get(key)
+    if suggestions is None:
+        index, index_version = get_index(version)
+        suggestions = index.lookup(prefix, limit)
+        if index_version == version:
+            cache.set(key, suggestions, RESPONSE_TIMEOUT)
+    return suggestions
+
+
+def invalidate():
+    """Called when a post or tag changes; every worker rebuilds lazily"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
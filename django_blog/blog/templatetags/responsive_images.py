@@ -0,0 +1,43 @@
+from django import template
+from django.utils.html import format_html
+
+from blog import images
+
+register = template.Library()
+
+
+def srcset(entries, storage):
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in entries)
+
+
+@register.simple_tag
+def picture(field_file, sizes='100vw', alt='', css_class='', loading='lazy'):
+    """
+    ``<picture>`` with WebP and JPEG ``srcset``s for an image field, e.g.
+    ``{% picture post.featured_image sizes="(min-width: 768px) 33vw, 100vw" alt=post.title %}``.
+    Falls back to the original upload (and queues its derivatives) until
+    they exist.
+    """
+    if not field_file:
+        return ''
+    manifest = images.current_variants(field_file)
+    if manifest is None:
+        images.schedule(field_file)
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            field_file.url, alt, css_class, loading,
+        )
+
+    storage = field_file.storage
+    webp, jpeg = manifest['variants']['webp'], manifest['variants']['jpeg']
+    # Height/width ratio lets the browser reserve space before the image loads
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        srcset(webp, storage), sizes,
+        storage.url(jpeg[len(jpeg) // 2][1]), srcset(jpeg, storage), sizes,
+        manifest['width'], manifest['height'], alt, css_class, loading,
+    )
+
@@ -10,6 +10,17 @@ urlpatterns = [
     path('author/<int:author_id>/', views.AuthorPostsView.as_view(), name='author_posts'),
     path('tag/<slug:slug>/', views.TagPostsView.as_view(), name='tag_posts'),
     path('search/', views.SearchView.as_view(), name='search'),
+    path('search/suggest/', views.SearchSuggestView.as_view(), name='search_suggest'),
+    
+    # Feeds and sitemaps
+    path('feed.rss', views.latest_posts_feed, name='feed'),
+    path('feed.atom', views.latest_posts_atom_feed, name='feed_atom'),
+    path('tag/<slug:slug>/feed.rss', views.tag_feed, name='tag_feed'),
+    path('tag/<slug:slug>/feed.atom', views.tag_atom_feed, name='tag_feed_atom'),
+    path('author/<int:author_id>/feed.rss', views.author_feed, name='author_feed'),
+    path('author/<int:author_id>/feed.atom', views.author_atom_feed, name='author_feed_atom'),
+    path('sitemap.xml', views.SitemapIndexView.as_view(), name='sitemap'),
+    path('sitemap-<slug:section>-<int:chunk>.xml', views.SitemapSectionView.as_view(), name='sitemap_section'),
     
     # AJAX views
     path('subscribe/', views.SubscribeView.as_view(), name='subscribe'),
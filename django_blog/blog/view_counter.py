@@ -0,0 +1,233 @@
+"""
+Buffered, write-behind view counting for blog posts.
+
+Every post view is appended to a small per-process journal file. A background
+timer periodically rotates the journal and applies the tally to the database
+with one ``F('views') + n`` UPDATE per distinct increment, so a traffic spike
+on a single post no longer turns every read into a row-level write. The same
+flush adds the tally to the post's ``PostViewDaily`` row for the day, which
+``admin_panel.analytics`` reads for traffic over time.
+
+Journals live in ``VIEW_COUNT_BUFFER_DIR`` and go through three states:
+
+* ``<name>.log``      - being appended to by the worker that owns it
+* ``<name>.*.claimed`` - taken by a flusher and being applied
+* ``<name>.pending``  - a flush failed; waiting to be retried
+
+Journals left behind by a worker that was killed before it could flush are
+recovered by the next timer tick of any live worker, or explicitly with
+``python manage.py flush_view_counts``, so counts survive worker restarts.
+Setting ``VIEW_COUNT_FLUSH_INTERVAL`` to 0 disables buffering and writes
+every view straight to the database.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from admin_panel.models import Post, PostViewDaily
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.log'
+PENDING_SUFFIX = '.pending'
+CLAIMED_SUFFIX = '.claimed'
+
+# Sent with ``counts`` ({post_id: increment}) after buffered views reach the database
+views_flushed = Signal()
+
+
+def get_flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30)
+
+
+def get_buffer_dir():
+    return Path(settings.VIEW_COUNT_BUFFER_DIR)
+
+
+def get_orphan_age():
+    """Age after which an unrotated journal is assumed to belong to a dead worker"""
+    return max(get_flush_interval() * 4, 60)
+
+
+def apply_counts(counts):
+    """Apply a ``{post_id: increment}`` mapping to ``Post.views`` and today's ``PostViewDaily`` rows"""
+    by_increment = defaultdict(list)
+    for post_id, increment in counts.items():
+        if increment > 0:
+            by_increment[increment].append(post_id)
+    # Views are dated when they are flushed, at most one interval late
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        existing = set(Post.objects.filter(pk__in=counts).values_list('pk', flat=True))
+        # Views of posts deleted since are dropped, not reported as flushed
+        counts = {post_id: increment for post_id, increment in counts.items() if post_id in existing}
+        PostViewDaily.objects.bulk_create(
+            [PostViewDaily(post_id=post_id, date=today) for post_id in existing],
+            ignore_conflicts=True,
+        )
+        for increment, post_ids in by_increment.items():
+            Post.objects.filter(pk__in=post_ids).update(views=F('views') + increment)
+            PostViewDaily.objects.filter(date=today, post_id__in=post_ids).update(views=F('views') + increment)
+    # Listeners must not make a committed flush look failed (and be re-applied)
+    for receiver, response in views_flushed.send_robust(sender=Post, counts=counts):
+        if isinstance(response, Exception):
+            logger.error('views_flushed receiver %r failed', receiver, exc_info=response)
+    return sum(counts.values())
+
+
+def read_journal(path):
+    """Tally the post ids recorded in a journal file"""
+    counts = Counter()
+    with open(path, encoding='ascii', errors='ignore') as journal:
+        for line in journal:
+            line = line.strip()
+            if line.isdigit():
+                counts[int(line)] += 1
+    return counts
+
+
+def _claim(path, token):
+    """Atomically take ownership of a journal; returns None if someone else won"""
+    claimed = path.with_name(f'{path.name.split(".")[0]}.{token}{CLAIMED_SUFFIX}')
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def _apply_journal(claimed):
+    counts = read_journal(claimed)
+    try:
+        applied = apply_counts(counts) if counts else 0
+    except Exception:
+        logger.exception('Failed to apply view counts from %s', claimed.name)
+        os.replace(claimed, claimed.with_name(claimed.name.split('.')[0] + PENDING_SUFFIX))
+        return 0
+    claimed.unlink()
+    return applied
+
+
+def recover_journals(include_claimed=False):
+    """
+    Apply journals that no live worker is going to flush: failed flushes and
+    journals whose owner died. Claimed journals are only retried when
+    ``include_claimed`` is set, because a slow flusher may still own them.
+    """
+    directory = get_buffer_dir()
+    if not directory.is_dir():
+        return 0
+
+    token = uuid.uuid4().hex[:8]
+    cutoff = time.time() - get_orphan_age()
+    applied = 0
+    for path in directory.iterdir():
+        if path.suffix == PENDING_SUFFIX:
+            eligible = True
+        elif path.suffix == JOURNAL_SUFFIX or (include_claimed and path.suffix == CLAIMED_SUFFIX):
+            try:
+                eligible = path.stat().st_mtime < cutoff
+            except FileNotFoundError:
+                continue
+        else:
+            continue
+
+        if eligible:
+            claimed = _claim(path, token)
+            if claimed is not None:
+                applied += _apply_journal(claimed)
+    return applied
+
+
+class ViewCounter:
+    """Per-process view buffer with a background flush timer"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex[:8]
+        self._generation = 0
+        self._journal = None
+        self._journal_path = None
+        self._timer = None
+
+    def record(self, post_id):
+        """Count one view of ``post_id``"""
+        if get_flush_interval() <= 0:
+            apply_counts({post_id: 1})
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked after the parent recorded views: start with a clean buffer
+                self._reset()
+            if self._journal is None:
+                self._open_journal()
+            self._journal.write(f'{post_id}\n')
+            self._journal.flush()
+            self._start_timer()
+
+    def flush(self):
+        """Apply everything buffered by this process"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return 0
+            journal, path = self._journal, self._journal_path
+            self._journal = self._journal_path = None
+
+        if journal is None:
+            return 0
+        journal.close()
+        claimed = _claim(path, self._token)
+        if claimed is None:
+            return 0
+        return _apply_journal(claimed)
+
+    def _open_journal(self):
+        directory = get_buffer_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._generation += 1
+        name = f'{self._pid}-{self._token}-{self._generation}{JOURNAL_SUFFIX}'
+        self._journal_path = directory / name
+        self._journal = open(self._journal_path, 'a', encoding='ascii')
+
+    def _start_timer(self):
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run, name='view-count-flusher', daemon=True)
+            self._timer.start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(get_flush_interval(), 1))
+            try:
+                self.flush()
+                recover_journals()
+            except Exception:
+                logger.exception('View count flush failed')
+            finally:
+                # This thread owns its own database connection; don't leak it
+                connections.close_all()
+
+
+view_counter = ViewCounter()
+
+
+def record_view(post_id):
+    """Record a view of the given post"""
+    view_counter.record(post_id)
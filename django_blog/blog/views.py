@@ -1,17 +1,34 @@
 from django.shortcuts import render, get_object_or_404
 from django.views.generic import ListView, DetailView
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views import View
+from django.urls import reverse
 from admin_panel.models import Post, Tag, User, Comment, Subscriber
+from django_blog import metrics
+from django_blog.db_router import replica_reads, sticky_writes
+from django_blog.pagination import KeysetPaginationMixin
+from .feeds import AuthorAtomFeed, AuthorFeed, LatestPostsAtomFeed, LatestPostsFeed, TagAtomFeed, TagFeed
 from .forms import CommentForm, SubscribeForm
+from .page_cache import cache_anonymous_page
+from .related import related_posts
+from .search import search_posts
+from .sidebar import get_sidebar
+from .sitemaps import SECTIONS, chunk_entries, chunks, section_dependencies
+from .suggest import suggest
+from .view_counter import record_view
 
 
-class PostListView(ListView):
+def count_cached_view(extra):
+    record_view(extra['post_id'])
+
+
+@method_decorator(cache_anonymous_page(lambda **kwargs: ['home']), name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+class PostListView(KeysetPaginationMixin, ListView):
     """Homepage view showing published posts"""
     model = Post
     template_name = 'blog/home.html'
@@ -23,18 +40,17 @@ class PostListView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['featured_posts'] = Post.objects.filter(
-            status='published'
-        ).order_by('-views')[:3]
-        context['recent_posts'] = Post.objects.filter(
-            status='published'
-        ).order_by('-published_at')[:5]
-        context['popular_tags'] = Tag.objects.annotate(
-            post_count=Count('posts')
-        ).filter(post_count__gt=0).order_by('-post_count')[:10]
+        blocks = get_sidebar()
+        context['featured_posts'] = blocks['featured_posts']
+        context['recent_posts'] = blocks['recent_posts']
+        context['popular_tags'] = blocks['popular_tags']
         return context
 
 
+@method_decorator(
+    cache_anonymous_page(lambda slug: [f'post:{slug}'], on_hit=count_cached_view), name='dispatch',
+)
+@method_decorator(replica_reads, name='dispatch')
 class PostDetailView(DetailView):
     """Individual post detail view"""
     model = Post
@@ -46,24 +62,29 @@ class PostDetailView(DetailView):
     
     def get_object(self):
         post = super().get_object()
-        # Increment view count
-        post.views += 1
-        post.save(update_fields=['views'])
+        # Buffered; applied to the database by the view counter's flusher
+        record_view(post.pk)
         return post
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        post = self.get_object()
-        context['comments'] = post.comments.filter(approved=True).order_by('created_at')
+        post = self.object
+        # Evaluated once here so the template's count and loop share one query
+        context['comments'] = list(post.comments.filter(approved=True).order_by('created_at'))
         context['comment_form'] = CommentForm()
-        context['related_posts'] = Post.objects.filter(
-            tags__in=post.tags.all(),
-            status='published'
-        ).exclude(id=post.id).distinct()[:3]
+        context['related_posts'] = related_posts(post)
         return context
+    
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        # Lets the page cache count views of cached copies
+        response.page_cache_extra = {'post_id': self.object.pk}
+        return response
 
 
-class AuthorPostsView(ListView):
+@method_decorator(cache_anonymous_page(lambda author_id: [f'author:{author_id}']), name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+class AuthorPostsView(KeysetPaginationMixin, ListView):
     """View showing posts by a specific author"""
     model = Post
     template_name = 'blog/author_posts.html'
@@ -83,7 +104,9 @@ class AuthorPostsView(ListView):
         return context
 
 
-class TagPostsView(ListView):
+@method_decorator(cache_anonymous_page(lambda slug: [f'tag:{slug}']), name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+class TagPostsView(KeysetPaginationMixin, ListView):
     """View showing posts with a specific tag"""
     model = Post
     template_name = 'blog/tag_posts.html'
@@ -103,6 +126,7 @@ class TagPostsView(ListView):
         return context
 
 
+@method_decorator(replica_reads, name='dispatch')
 class SearchView(ListView):
     """Search view for posts"""
     model = Post
@@ -113,12 +137,7 @@ class SearchView(ListView):
     def get_queryset(self):
         query = self.request.GET.get('q')
         if query:
-            return Post.objects.filter(
-                Q(title__icontains=query) | 
-                Q(content__icontains=query) | 
-                Q(excerpt__icontains=query),
-                status='published'
-            ).select_related('author').prefetch_related('tags')
+            return search_posts(query)
         return Post.objects.none()
     
     def get_context_data(self, **kwargs):
@@ -127,6 +146,19 @@ class SearchView(ListView):
         return context
 
 
+@method_decorator(replica_reads, name='dispatch')
+class SearchSuggestView(View):
+    """AJAX view returning title and tag suggestions while the user types"""
+    
+    def get(self, request):
+        query = request.GET.get('q', '')
+        return JsonResponse({
+            'query': query,
+            'suggestions': suggest(query),
+        })
+
+
+@method_decorator(sticky_writes, name='dispatch')
 class SubscribeView(View):
     """AJAX view for newsletter subscription"""
     
@@ -155,6 +187,7 @@ class SubscribeView(View):
         })
 
 
+@method_decorator(sticky_writes, name='dispatch')
 class CommentCreateView(View):
     """AJAX view for creating comments"""
     
@@ -169,11 +202,52 @@ class CommentCreateView(View):
             post_id = request.POST.get('post_id')
             comment.post = get_object_or_404(Post, id=post_id)
             comment.save()
+            metrics.COMMENTS_SUBMITTED.inc(result='accepted')
             return JsonResponse({
                 'success': True,
                 'message': 'Your comment has been submitted and is awaiting approval.'
             })
+        metrics.COMMENTS_SUBMITTED.inc(result='invalid')
         return JsonResponse({
             'success': False,
             'message': 'Please fill in all required fields correctly.'
-        })
\ No newline at end of file
+        })
+
+
+# Feeds share the cache dependency of the listing page they mirror
+latest_posts_feed = cache_anonymous_page(lambda **kwargs: ['home'])(LatestPostsFeed())
+latest_posts_atom_feed = cache_anonymous_page(lambda **kwargs: ['home'])(LatestPostsAtomFeed())
+tag_feed = cache_anonymous_page(lambda slug: [f'tag:{slug}'])(TagFeed())
+tag_atom_feed = cache_anonymous_page(lambda slug: [f'tag:{slug}'])(TagAtomFeed())
+author_feed = cache_anonymous_page(lambda author_id: [f'author:{author_id}'])(AuthorFeed())
+author_atom_feed = cache_anonymous_page(lambda author_id: [f'author:{author_id}'])(AuthorAtomFeed())
+
+
+@method_decorator(cache_anonymous_page(lambda **kwargs: ['sitemap']), name='dispatch')
+class SitemapIndexView(View):
+    """Sitemap index listing every chunk of every section"""
+    
+    def get(self, request):
+        sitemaps = [
+            {
+                'location': request.build_absolute_uri(
+                    reverse('blog:sitemap_section', kwargs={'section': section, 'chunk': chunk})
+                ),
+                'lastmod': lastmod,
+            }
+            for section in SECTIONS
+            for chunk, lastmod in chunks(section)
+        ]
+        return render(request, 'blog/sitemap_index.xml', {'sitemaps': sitemaps}, content_type='application/xml')
+
+
+@method_decorator(cache_anonymous_page(section_dependencies), name='dispatch')
+class SitemapSectionView(View):
+    """One chunk of the post, tag or author sitemap"""
+    
+    def get(self, request, section, chunk):
+        entries = chunk_entries(section, chunk) if section in SECTIONS else []
+        if not entries:
+            raise Http404('No such sitemap')
+        urls = [{'location': request.build_absolute_uri(path), 'lastmod': lastmod} for path, lastmod in entries]
+        return render(request, 'blog/sitemap.xml', {'urls': urls}, content_type='application/xml')
@@ -0,0 +1,216 @@
+"""
+Cache configuration helpers.
+
+``CACHE_URL`` selects the shared cache every worker talks to:
+
+* ``locmem://``                   - per-process memory (development only;
+                                    refused when ``DEBUG`` is off)
+* ``file:///var/tmp/django_blog`` - files on local disk, shared by workers on one host
+* ``db://django_blog_cache``      - a table in the default database
+                                    (run ``manage.py createcachetable``)
+* ``redis://host:6379/0``         - Redis (needs the ``redis`` package)
+* ``memcached://host:11211``      - Memcached (needs the ``pymemcache`` package)
+
+Query parameters ``timeout``, ``max_entries`` and ``key_prefix`` are passed
+through, e.g. ``file:///var/tmp/cache?timeout=600``.
+
+Unless the shared cache already lives in process memory, the ``default``
+alias is a ``TieredCache``: a small in-process LRU in front of the shared
+cache so hot keys don't cost a round trip. Local copies live for at most
+``CACHE_LOCAL_TIMEOUT`` seconds, which bounds how stale another worker's
+write can look. The shared cache is also available on its own as the
+``shared`` alias for data that must never be read stale.
+"""
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+
+_MISSING = object()
+
+
+def parse_cache_url(url, timeout=300, max_entries=1000):
+    """Translate a ``CACHE_URL`` into a Django ``CACHES`` entry"""
+    parsed = urlsplit(url)
+    if parsed.scheme not in BACKENDS:
+        raise ImproperlyConfigured(f'Unsupported CACHE_URL scheme: {parsed.scheme!r}')
+
+    query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    config = {
+        'BACKEND': BACKENDS[parsed.scheme],
+        'TIMEOUT': int(query.get('timeout', timeout)),
+        'OPTIONS': {},
+    }
+    if parsed.scheme == 'locmem':
+        config['LOCATION'] = parsed.netloc or 'django-blog'
+    elif parsed.scheme == 'file':
+        if not parsed.path:
+            raise ImproperlyConfigured('file:// CACHE_URL needs an absolute directory path')
+        config['LOCATION'] = parsed.path
+    elif parsed.scheme == 'db':
+        config['LOCATION'] = parsed.netloc or 'django_blog_cache'
+    elif parsed.scheme in ('redis', 'rediss'):
+        config['LOCATION'] = url.split('?', 1)[0]
+    else:
+        config['LOCATION'] = parsed.netloc.split(',')
+
+    if parsed.scheme in ('locmem', 'file', 'db'):
+        config['OPTIONS']['MAX_ENTRIES'] = int(query.get('max_entries', max_entries))
+    if 'key_prefix' in query:
+        config['KEY_PREFIX'] = query['key_prefix']
+    return config
+
+
+def build_caches(url, local_timeout=5, local_max_entries=1000, allow_process_local=True):
+    """
+    ``CACHES`` setting with a tiered ``default`` and a direct ``shared``
+    alias. Without ``allow_process_local`` a ``locmem://`` URL is refused:
+    page cache versions, rate limits and the sidebar must be seen by every
+    worker.
+    """
+    shared = parse_cache_url(url)
+    if shared['BACKEND'] == BACKENDS['locmem'] and not allow_process_local:
+        raise ImproperlyConfigured(
+            'CACHE_URL=locmem:// gives every worker its own cache; use a shared backend '
+            '(file://, db://, redis:// or memcached://) when DEBUG is off.'
+        )
+    if local_timeout <= 0 or shared['BACKEND'] == BACKENDS['locmem']:
+        return {'default': dict(shared), 'shared': shared}
+    return {
+        'default': {
+            'BACKEND': 'django_blog.cache.TieredCache',
+            'TIMEOUT': shared['TIMEOUT'],
+            'OPTIONS': {
+                'SHARED_ALIAS': 'shared',
+                'LOCAL_TIMEOUT': local_timeout,
+                'LOCAL_MAX_ENTRIES': local_max_entries,
+            },
+        },
+        'shared': shared,
+    }
+
+
+def instrument_caches(caches):
+    """
+    ``caches`` with hit and miss counting added to every alias (see
+    ``InstrumentedCache`` in django_blog/instrumentation.py)
+    """
+    return {
+        alias: {
+            'BACKEND': 'django_blog.instrumentation.InstrumentedCache',
+            # Read by Django's checks, e.g. that a file cache's directory is absolute
+            'LOCATION': config.get('LOCATION', ''),
+            'TIMEOUT': config.get('TIMEOUT', 300),
+            'OPTIONS': {'ALIAS': alias, 'CACHE': config},
+        }
+        for alias, config in caches.items()
+    }
+
+
+class TieredCache(BaseCache):
+    """
+    Read-through cache: an in-process LRU (``LocMemCache``) in front of a
+    shared cache alias. Writes go to both tiers; counters (``incr``/``decr``)
+    and ``add`` are always decided by the shared tier.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._local = LocMemCache(f'tiered-{location or self._shared_alias}', {
+            'TIMEOUT': self._local_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def shared(self):
+        from django.core.cache import caches
+        return caches[self._shared_alias]
+
+    def _local_timeout_for(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self._local.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._local.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self._local.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            if fetched:
+                self._local.set_many(fetched, version=version)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local.set(key, value, self._local_timeout_for(timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        self._local.set_many(
+            {key: value for key, value in data.items() if key not in failed},
+            self._local_timeout_for(timeout),
+            version=version,
+        )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local.set(key, value, self._local_timeout_for(timeout), version=version)
+        else:
+            self._local.delete(key, version=version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._local.delete_many(keys, version=version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._local.has_key(key, version=version) or self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local.delete(key, version=version)
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._local.delete(key, version=version)
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Drop this process's copies only; the shared tier keeps its entries"""
+        self._local.clear()
@@ -0,0 +1,35 @@
+"""
+Database configuration helpers.
+
+``database_config()`` turns a ``DATABASE_URL`` into a ``DATABASES`` entry
+with connection reuse switched on:
+
+* ``conn_max_age`` keeps a connection open across requests for that many
+  seconds (``0`` closes it at the end of every request, Django's default,
+  and ``None`` keeps it forever). Each gunicorn worker thread holds at most
+  one connection per alias, so the server needs ``workers x threads``
+  connections plus those of the management commands.
+* ``health_checks`` makes Django ping a reused connection before the first
+  query of a request, so a connection the server dropped in between (a
+  restart, an idle timeout) is replaced instead of failing the request.
+
+``replica_configs()`` does the same for the read replicas in
+``DATABASE_REPLICA_URLS`` (see ``django_blog/db_router.py``).
+"""
+import dj_database_url
+
+
+def database_config(url, conn_max_age=60, health_checks=True):
+    """``DATABASES`` entry for ``url``"""
+    return dj_database_url.parse(url, conn_max_age=conn_max_age, conn_health_checks=health_checks)
+
+
+def replica_configs(urls, **options):
+    """``{alias: DATABASES entry}`` for replica ``urls``, named ``replica_1``, ``replica_2``, ..."""
+    replicas = {}
+    for number, url in enumerate(urls, 1):
+        config = database_config(url, **options)
+        # Tests have no replication: read the test database instead
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{number}'] = config
+    return replicas
@@ -0,0 +1,125 @@
+"""
+Read replicas for public pages.
+
+``DATABASE_REPLICA_URLS`` lists replicas of the primary database as
+``DATABASE_URL``-style URLs, separated by commas; they become the aliases
+``replica_1``, ``replica_2``, ... ``ReplicaRouter`` keeps every query on the
+primary (``default``) except reads made inside a view wrapped in
+``replica_reads``: the public listings, post pages, tag pages and search.
+Those pick one replica per request, so all of a page's rows come from the
+same copy. Writes always go to the primary, and once a request has written,
+the rest of its reads do too.
+
+Replicas lag behind the primary, so a reader falls back to it when:
+
+* they just sent a comment or subscribed: views wrapped in ``sticky_writes``
+  set the ``STICKY_COOKIE`` on POST responses, and for
+  ``DATABASE_REPLICA_STICKY_SECONDS`` that reader's pages are read from the
+  primary (and bypass the page cache);
+* content changed in the last ``DATABASE_REPLICA_MAX_LAG`` seconds: page
+  cache invalidations call ``record_write()``, so a page re-rendered right
+  after one isn't rendered (and cached) from a replica that hasn't caught up.
+
+``DATABASE_REPLICAS`` names the aliases to read from; aliases missing from
+``DATABASES`` are ignored. The database cache table (``CACHE_URL=db://``)
+is always read on the primary: a lagging replica would serve cache entries
+that were already replaced or deleted.
+
+Locally, two SQLite files work: migrate both
+(``manage.py migrate --database replica_1``) and copy the primary file over
+the replica whenever it should catch up. Under ``manage.py test`` replicas
+mirror the test database and the test runner empties ``DATABASE_REPLICAS``,
+so every read stays on it.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'db_primary'
+LAST_WRITE_KEY = 'db:last_write'
+
+# The replica alias the current request reads from, or None for the primary
+_read_alias = ContextVar('read_alias', default=None)
+
+# app_label of the model DatabaseCache reads its table through
+CACHE_APP_LABEL = 'django_cache'
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in settings.DATABASES]
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10)
+
+
+def get_max_lag():
+    return getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 5)
+
+
+def record_write():
+    """Keep every reader on the primary for the next ``DATABASE_REPLICA_MAX_LAG`` seconds"""
+    if get_replicas() and get_max_lag():
+        caches['shared'].set(LAST_WRITE_KEY, time.time(), get_max_lag())
+
+
+def reads_from_primary(request):
+    """Whether ``request`` must not read from a replica"""
+    if STICKY_COOKIE in request.COOKIES:
+        return True
+    last_write = caches['shared'].get(LAST_WRITE_KEY)
+    return last_write is not None and time.time() - last_write < get_max_lag()
+
+
+def replica_reads(view):
+    """Let the reads of ``view`` go to a replica"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = get_replicas()
+        if not replicas or reads_from_primary(request):
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(random.choice(replicas))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+def sticky_writes(view):
+    """Read from the primary for a while after POSTing to ``view``, so the sender sees what they sent"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method == 'POST' and get_replicas():
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=get_sticky_seconds(), httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        if _read_alias.get() is not None:
+            # Later reads of this request must see the write
+            _read_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,220 @@
+"""
+Opt-in per-request instrumentation (``REQUEST_INSTRUMENTATION=True``).
+
+``InstrumentationMiddleware`` measures every request: total time, the number
+and duration of database queries (through ``connection.execute_wrapper`` on
+every alias), time spent rendering templates (through the
+``InstrumentedTemplates`` backend) and cache hits and misses (through
+``InstrumentedCache``, which settings put around each cache alias). Each
+request is logged as one JSON line on the ``django_blog.instrumentation``
+logger and answered with a ``Server-Timing`` header, so the numbers also
+show up in the browser's network panel.
+
+A query shape (its SQL with ``IN`` lists collapsed) that runs more than
+``INSTRUMENTATION_REPEAT_THRESHOLD`` times in one request is reported as a
+likely N+1 pattern, at WARNING level.
+
+The bookkeeping per query or cache call is a counter update on a
+``ContextVar``; SQL is only normalized once per distinct statement at the
+end of the request, so the middleware is cheap enough to leave on.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_MISSING = object()
+
+_current = ContextVar('request_stats', default=None)
+
+
+def get_repeat_threshold():
+    return getattr(settings, 'INSTRUMENTATION_REPEAT_THRESHOLD', 5)
+
+
+def shape(sql):
+    """``sql`` with the length of its ``IN (...)`` lists taken out"""
+    return IN_LIST_RE.sub('IN (%s, ...)', sql)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time', 'statements', 'template_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """``{shape: count}`` of the query shapes run more than ``threshold`` times"""
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[shape(sql)] += count
+        return {sql: count for sql, count in shapes.items() if count > threshold}
+
+
+def current():
+    """Statistics of the request being handled, or None outside one"""
+    return _current.get()
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+            f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        self.log(request, response, stats, total)
+        return response
+
+    def log(self, request, response, stats, total):
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_queries': stats.queries,
+            'db_ms': round(stats.query_time * 1000, 2),
+            'template_ms': round(stats.template_time * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }
+        repeated = stats.repeated(get_repeat_threshold())
+        if repeated:
+            record['repeated_queries'] = [
+                {'sql': sql, 'count': count}
+                for sql, count in sorted(repeated.items(), key=lambda item: -item[1])
+            ]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """``DjangoTemplates`` that adds top-level render time to the request's stats"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class CountingCacheMixin:
+    """Counts the hits and misses of the cache backend it is mixed into"""
+    alias = None
+    # Whether the backend's get_many is its own or BaseCache's loop over get()
+    native_get_many = True
+
+    def count(self, hits, misses):
+        stats = _current.get()
+        if stats is not None:
+            stats.cache_hits += hits
+            stats.cache_misses += misses
+        if hits:
+            metrics.CACHE_LOOKUPS.inc(hits, alias=self.alias, result='hit')
+        if misses:
+            metrics.CACHE_LOOKUPS.inc(misses, alias=self.alias, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self.count(0, 1)
+            return default
+        self.count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        if not self.native_get_many:
+            return super().get_many(keys, version=version)
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        self.count(len(found), len(keys) - len(found))
+        return found
+
+
+_counting_backends = {}
+
+
+def counting_backend(backend):
+    """``backend`` with ``CountingCacheMixin`` mixed in"""
+    if backend not in _counting_backends:
+        _counting_backends[backend] = type(f'Counting{backend.__name__}', (CountingCacheMixin, backend), {
+            'native_get_many': backend.get_many is not BaseCache.get_many,
+        })
+    return _counting_backends[backend]
+
+
+class InstrumentedCache:
+    """
+    Cache ``BACKEND`` that builds the backend configured in
+    ``OPTIONS['CACHE']`` with hit and miss counting mixed in. The result is
+    still an instance of that backend, so e.g. ``createcachetable`` still
+    recognizes a database cache.
+    """
+
+    def __new__(cls, location, params):
+        config = dict(params['OPTIONS']['CACHE'])
+        backend = counting_backend(import_string(config.pop('BACKEND')))
+        cache = backend(config.pop('LOCATION', ''), config)
+        cache.alias = params['OPTIONS']['ALIAS']
+        return cache
@@ -0,0 +1,411 @@
+"""
+Operational metrics in the Prometheus text exposition format, served at
+``/metrics``.
+
+Counters and histograms are defined at the bottom of this module and
+updated in place, e.g. ``COMMENTS_SUBMITTED.inc(result='accepted')``. Each
+thread writes only to its own dictionary of samples, so recording takes no
+lock; a scrape sums the dictionaries of all threads.
+
+With several processes (gunicorn workers, the newsletter worker) set
+``METRICS_DIR`` to a directory they share. Every process then writes its
+totals to ``<METRICS_DIR>/metrics-<pid>.json`` every
+``METRICS_FLUSH_INTERVAL`` seconds and on exit, and a scrape of any worker
+adds up all the files. Files of finished processes are kept so counters
+never go backwards; empty the directory when the service is (re)deployed.
+
+Gauges such as the pending-comment backlog are read from the database at
+scrape time (see ``COLLECTORS``), at most once per
+``METRICS_BACKLOG_TIMEOUT`` seconds across all workers.
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUERY_DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+BACKLOG_KEY = 'metrics:backlogs'
+
+REGISTRY = {}
+
+# Samples are {(sample name, ((label, value), ...)): value}, one dict per thread
+_shards = {}
+_retired = {}
+_local = threading.local()
+_merge_lock = threading.Lock()
+_flusher_started = False
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '')
+
+
+def get_flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def get_backlog_timeout():
+    return getattr(settings, 'METRICS_BACKLOG_TIMEOUT', 30)
+
+
+def _samples():
+    try:
+        return _local.samples
+    except AttributeError:
+        samples = _local.samples = {}
+        _shards[id(samples)] = (threading.current_thread(), samples)
+        if get_metrics_dir():
+            _start_flusher()
+        return samples
+
+
+def _add(key, amount):
+    samples = _samples()
+    samples[key] = samples.get(key, 0) + amount
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY[name] = self
+
+    def label_values(self, labels):
+        return tuple((name, str(labels[name])) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        _add((self.name, self.label_values(labels)), amount)
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        label_values = self.label_values(labels)
+        # One bucket per observation; scrapes make them cumulative
+        bound = next((bound for bound in self.buckets if value <= bound), math.inf)
+        _add((f'{self.name}_bucket', label_values + (('le', format_value(bound)),)), 1)
+        _add((f'{self.name}_sum', label_values), value)
+        _add((f'{self.name}_count', label_values), 1)
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def snapshot():
+    """This process's samples, summed over its threads"""
+    with _merge_lock:
+        totals = dict(_retired)
+        for key, (thread, samples) in list(_shards.items()):
+            target = totals
+            if not thread.is_alive():
+                # Fold finished threads in once instead of keeping their dicts
+                target = _retired
+                del _shards[key]
+            for sample, value in samples.copy().items():
+                target[sample] = target.get(sample, 0) + value
+                if target is _retired:
+                    totals[sample] = totals.get(sample, 0) + value
+    return totals
+
+
+def _reset_after_fork():
+    global _flusher_started, _merge_lock
+    # A forked worker starts from zero; its parent's samples are the parent's
+    _shards.clear()
+    _retired.clear()
+    _merge_lock = threading.Lock()
+    _flusher_started = False
+    if hasattr(_local, 'samples'):
+        del _local.samples
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def process_file(directory, pid=None):
+    return Path(directory) / f'metrics-{pid or os.getpid()}.json'
+
+
+def flush():
+    """Write this process's samples to ``METRICS_DIR``"""
+    directory = get_metrics_dir()
+    if not directory:
+        return
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    path = process_file(directory)
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps([[name, labels, value] for (name, labels), value in snapshot().items()]))
+    # Readers see the old file or the new one, never half of one
+    os.replace(temporary, path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(get_flush_interval())
+        try:
+            flush()
+        except OSError:
+            logger.exception('Writing metrics failed')
+
+
+def _start_flusher():
+    global _flusher_started
+    with _merge_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _flusher_started:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def aggregate():
+    """Samples of every process sharing ``METRICS_DIR`` (or just this one)"""
+    directory = get_metrics_dir()
+    if not directory:
+        return snapshot()
+    flush()
+    totals = {}
+    for path in Path(directory).glob('metrics-*.json'):
+        try:
+            rows = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in rows:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def cumulative_buckets(metric, buckets):
+    """The ``_bucket`` lines of ``metric``, made cumulative per label set"""
+    per_series = {}
+    for labels, value in buckets:
+        series, le = labels[:-1], labels[-1][1]
+        per_series.setdefault(series, {})[le] = value
+    lines = []
+    for series, counts in sorted(per_series.items()):
+        running = 0
+        for bound in (*metric.buckets, math.inf):
+            running += counts.get(format_value(bound), 0)
+            labels = series + (('le', format_value(bound)),)
+            lines.append(f'{metric.name}_bucket{format_labels(labels)} {format_value(running)}')
+    return lines
+
+
+def render(samples=None):
+    """Text exposition of every registered metric and collector"""
+    samples = aggregate() if samples is None else samples
+    by_name = {}
+    for (name, labels), value in sorted(samples.items()):
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'histogram':
+            lines.extend(cumulative_buckets(metric, by_name.get(f'{metric.name}_bucket', [])))
+            names = (f'{metric.name}_sum', f'{metric.name}_count')
+        else:
+            names = (metric.name,)
+        for name in names:
+            for labels, value in by_name.get(name, []):
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+    for collect in COLLECTORS:
+        for name, documentation, values in collect(samples):
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in values:
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Scrapers send ``METRICS_TOKEN`` as a bearer
+    token; without one configured the endpoint only answers under ``DEBUG``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Counts requests and their latency and database queries per URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with queries.installed(connections):
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths share one label so scanners can't blow up cardinality
+        view = match.view_name if match else 'unresolved'
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(elapsed, view=view)
+        REQUEST_QUERIES.observe(queries.count, view=view)
+        return response
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def installed(self, connections):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            QUERY_DURATION.observe(time.perf_counter() - started, alias=context['connection'].alias)
+
+
+def cache_hit_ratio(samples):
+    hits, lookups = {}, {}
+    for (name, labels), value in samples.items():
+        if name == CACHE_LOOKUPS.name:
+            alias, result = dict(labels)['alias'], dict(labels)['result']
+            lookups[alias] = lookups.get(alias, 0) + value
+            if result == 'hit':
+                hits[alias] = hits.get(alias, 0) + value
+    yield (
+        'django_cache_hit_ratio', 'Share of cache lookups that found a value, since the processes started',
+        [((('alias', alias),), hits.get(alias, 0) / total) for alias, total in sorted(lookups.items()) if total],
+    )
+
+
+def count_backlogs():
+    from admin_panel.models import Comment, NewsletterDelivery
+
+    statuses = dict(
+        NewsletterDelivery.objects.filter(status__in=['pending', 'sending'])
+        .values_list('status').annotate(total=Count('pk')).order_by()
+    )
+    return {
+        'comments_pending': Comment.objects.filter(approved=False).count(),
+        'deliveries': {status: statuses.get(status, 0) for status in ('pending', 'sending')},
+    }
+
+
+def backlogs(samples):
+    # Shared, so frequent scrapes of several workers still cost one count per timeout
+    values = caches['shared'].get_or_set(BACKLOG_KEY, count_backlogs, get_backlog_timeout())
+    yield (
+        'blog_comments_pending', 'Comments awaiting moderation',
+        [((), values['comments_pending'])],
+    )
+    yield (
+        'newsletter_deliveries_open', 'Newsletter deliveries not yet sent or given up on, by status',
+        [((('status', status),), count) for status, count in values['deliveries'].items()],
+    )
+
+
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.inc(alias=connection.alias)
+
+
+connection_created.connect(count_connection, dispatch_uid='django_blog.metrics.count_connection')
+
+COLLECTORS = [cache_hit_ratio, backlogs]
+
+REQUESTS = Counter(
+    'django_http_requests_total', 'HTTP requests by URL name, method and status', ('view', 'method', 'status'),
+)
+REQUEST_LATENCY = Histogram(
+    'django_http_request_duration_seconds', 'Time spent handling requests, by URL name', ('view',),
+)
+REQUEST_QUERIES = Histogram(
+    'django_http_request_db_queries', 'Database queries per request, by URL name', ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'django_db_query_duration_seconds', 'Database query execution time, by database alias', ('alias',),
+    buckets=QUERY_DURATION_BUCKETS,
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'django_db_connections_opened_total',
+    'Database connections opened, by alias', ('alias',),
+)
+CACHE_LOOKUPS = Counter(
+    'django_cache_lookups_total', 'Cache lookups by alias and result (hit or miss)', ('alias', 'result'),
+)
+COMMENTS_SUBMITTED = Counter(
+    'blog_comments_submitted_total', 'Comments submitted by readers, by result (accepted or invalid)', ('result',),
+)
+NEWSLETTER_RECIPIENTS_QUEUED = Counter(
+    'newsletter_recipients_queued_total', 'Newsletter deliveries queued from the admin panel',
+)
+NEWSLETTER_SENT = Counter(
+    'newsletter_messages_sent_total', 'Newsletter messages handed to the mail server',
+)
+NEWSLETTER_FAILURES = Counter(
+    'newsletter_send_failures_total',
+    'Newsletter sends that failed, by outcome (retry, or failed after the last attempt)', ('outcome',),
+)
@@ -0,0 +1,251 @@
+"""
+Keyset (cursor) pagination.
+
+``Paginator`` pages with ``OFFSET``, which makes the database walk past every
+earlier row, and runs a ``COUNT(*)`` on every page. ``KeysetPaginator``
+instead remembers where a page ended: its Next and Previous links carry an
+opaque ``cursor`` holding the sort key of the last (or first) row shown, and
+the following page is fetched with ``WHERE (created_at, id) < (…) LIMIT n``,
+an index range scan that costs the same on page 1 and page 5,000.
+
+The page object offers what the templates used from Django's ``Page``
+(``number``, ``has_next``, ``start_index``, ``paginator.num_pages``, ...)
+plus ``next_url``, ``previous_url``, ``first_url`` and ``last_url``. Plain
+``?page=N`` URLs keep working through an ``OFFSET`` query, and links from
+there on are cursors again; ``?page=last`` reads the end of the list in
+reverse order. Cursors and page numbers that don't decode or point past
+the end raise ``Http404``, as ``ListView`` does for ``Paginator``.
+
+Counts are optional: with ``count='approximate'`` the total is cached for
+``PAGINATION_COUNT_TIMEOUT`` seconds, so it may lag behind recent changes,
+and with ``count=None`` no total is known at all.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import math
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_PARAM = 'cursor'
+PAGE_PARAM = 'page'
+
+
+def get_count_timeout():
+    return getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 300)
+
+
+def encode_cursor(values, number, backwards):
+    payload = json.dumps({'v': values, 'n': number, 'b': backwards}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(values, number, backwards)``; raises ValueError for anything malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values, number, backwards = payload['v'], int(payload['n']), bool(payload['b'])
+    except (TypeError, KeyError, json.JSONDecodeError, UnicodeDecodeError, binascii.Error) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(values, list) or number < 1:
+        raise ValueError('Invalid cursor')
+    return values, number, backwards
+
+
+class KeysetPaginator:
+    """
+    Paginates ``queryset`` by ``ordering``, a sequence of field names as in
+    ``order_by()`` that must end in a unique field (normally ``-pk``).
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-pk'), count='approximate'):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_mode = count
+        self._count = None
+
+    @property
+    def fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    @property
+    def count(self):
+        if self.count_mode is None:
+            return None
+        if self._count is None:
+            queryset = self.queryset.order_by()
+            if self.count_mode == 'approximate':
+                sql, params = queryset.query.sql_with_params()
+                key = 'pagination:count:' + hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+                self._count = cache.get_or_set(key, queryset.count, get_count_timeout())
+            else:
+                self._count = queryset.count()
+        return self._count
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    def key_values(self, obj):
+        values = []
+        for field in self.fields:
+            value = getattr(obj, 'pk' if field == 'pk' else field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise ValueError('Invalid cursor')
+        meta = self.queryset.model._meta
+        try:
+            return [
+                (meta.pk if field == 'pk' else meta.get_field(field)).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except ValidationError as exc:
+            raise ValueError('Invalid cursor') from exc
+
+    def after(self, values, backwards):
+        """Rows past ``values`` in reading order, or before them with ``backwards``"""
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-') != backwards
+            condition |= Q(**equal, **{f'{field}__{"lt" if descending else "gt"}': value})
+            equal[field] = value
+        # Redundant, but a plain bound on the leading column is what lets the
+        # database range-scan the index instead of testing every row
+        leading = self.ordering[0]
+        descending = leading.startswith('-') != backwards
+        bound = Q(**{f'{leading.lstrip("-")}__{"lte" if descending else "gte"}': values[0]})
+        return self.queryset.filter(bound & condition)
+
+    def reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def fetch(self, queryset, backwards, size=None):
+        """One page plus a lookahead row, in reading order; returns (rows, more)"""
+        size = size or self.per_page
+        ordering = self.reversed_ordering() if backwards else self.ordering
+        rows = list(queryset.order_by(*ordering)[:size + 1])
+        more = len(rows) > size
+        rows = rows[:size]
+        if backwards:
+            rows.reverse()
+        return rows, more
+
+    def page(self, cursor=None, number=None):
+        if cursor:
+            values, number, backwards = decode_cursor(cursor)
+            rows, more = self.fetch(self.after(self.parse_values(values), backwards), backwards)
+            if not rows:
+                raise InvalidPage('That page contains no results')
+            if backwards:
+                return KeysetPage(self, rows, number, has_previous=more, has_next=True)
+            return KeysetPage(self, rows, number, has_previous=True, has_next=more)
+
+        if number == 'last':
+            # The final rows in reverse key order: right however stale the
+            # count is, which only numbers the page
+            rows, more = self.fetch(self.queryset, backwards=True)
+            number = self.num_pages or (2 if more else 1)
+            return KeysetPage(self, rows, number, has_previous=more, has_next=False)
+
+        number = int(number or 1)
+        if number < 1:
+            raise InvalidPage('That page number is less than 1')
+        # Old-style page number: one OFFSET query, cursors from there on
+        offset = (number - 1) * self.per_page
+        rows = list(self.queryset.order_by(*self.ordering)[offset:offset + self.per_page + 1])
+        if not rows and number > 1:
+            raise InvalidPage('That page contains no results')
+        return KeysetPage(
+            self, rows[:self.per_page], number, has_previous=number > 1, has_next=len(rows) > self.per_page,
+        )
+
+    def get_page(self, params):
+        """The page a request's GET ``params`` ask for; ``Http404`` if there's no such page"""
+        try:
+            return self.page(cursor=params.get(CURSOR_PARAM), number=params.get(PAGE_PARAM))
+        except (ValueError, TypeError, InvalidPage) as exc:
+            raise Http404('Invalid page') from exc
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, number, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def start_index(self):
+        return (self.number - 1) * self.paginator.per_page + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+    def next_url(self):
+        values = self.paginator.key_values(self.object_list[-1])
+        return '?' + urlencode({CURSOR_PARAM: encode_cursor(values, self.number + 1, False)})
+
+    def previous_url(self):
+        if self.number <= 2:
+            return self.first_url()
+        values = self.paginator.key_values(self.object_list[0])
+        return '?' + urlencode({CURSOR_PARAM: encode_cursor(values, self.number - 1, True)})
+
+    def first_url(self):
+        return '?' + urlencode({PAGE_PARAM: 1})
+
+    def last_url(self):
+        return '?' + urlencode({PAGE_PARAM: 'last'})
+
+
+class KeysetPaginationMixin:
+    """
+    For ``ListView``s: paginate ``paginate_by`` rows at a time by
+    ``keyset_ordering`` instead of with ``OFFSET``.
+    """
+    keyset_ordering = ('-created_at', '-pk')
+    keyset_count = 'approximate'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering, self.keyset_count)
+        page = paginator.get_page(self.request.GET)
+        return paginator, page, page.object_list, page.has_other_pages()
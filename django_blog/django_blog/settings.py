@@ -1,8 +1,9 @@
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 from django.contrib import messages
-import dj_database_url
+from .cache import build_caches, instrument_caches
+from .database import database_config, replica_configs
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,6 +24,8 @@ CKEDITOR_CONFIGS = {
         'toolbar': 'full',
         'height': 300,
         'width': '100%',
+        # Keep the responsive attributes blog.images adds to uploaded images
+        'extraAllowedContent': 'img[srcset,sizes,width,height,loading,decoding]',
     },
 }
 
@@ -86,10 +89,42 @@ WSGI_APPLICATION = 'django_blog.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds instead of being
+# reopened on every request (0 restores that), and checked before reuse with
+# DATABASE_CONN_HEALTH_CHECKS (see django_blog/database.py).
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=60, cast=int)
+DATABASE_CONN_HEALTH_CHECKS = config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
 DATABASES = {
-    'default': dj_database_url.config(default=config('DATABASE_URL'))
+    'default': database_config(
+        config('DATABASE_URL'),
+        conn_max_age=DATABASE_CONN_MAX_AGE,
+        health_checks=DATABASE_CONN_HEALTH_CHECKS,
+    )
 }
 
+# Read replicas for the public blog pages (see django_blog/db_router.py):
+# comma-separated DATABASE_URLs, available as replica_1, replica_2, ... After a
+# reader POSTs a comment or subscription they read from the primary for
+# DATABASE_REPLICA_STICKY_SECONDS; after content changes everyone does for
+# DATABASE_REPLICA_MAX_LAG seconds, which should cover the replication lag.
+DATABASE_REPLICA_URLS = [url.strip() for url in config('DATABASE_REPLICA_URLS', default='').split(',') if url.strip()]
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+DATABASE_REPLICA_MAX_LAG = config('DATABASE_REPLICA_MAX_LAG', default=5, cast=int)
+DATABASES.update(replica_configs(
+    DATABASE_REPLICA_URLS,
+    conn_max_age=DATABASE_CONN_MAX_AGE,
+    health_checks=DATABASE_CONN_HEALTH_CHECKS,
+))
+# The aliases public pages read from, all replicas unless DATABASE_REPLICAS
+# names some (an empty value keeps every read on the primary)
+DATABASE_REPLICAS = config(
+    'DATABASE_REPLICAS', default=','.join(alias for alias in DATABASES if alias != 'default'), cast=Csv(),
+)
+DATABASE_ROUTERS = ['django_blog.db_router.ReplicaRouter']
+# Runs the tests with DATABASE_REPLICAS empty (see django_blog/test_runner.py)
+TEST_RUNNER = 'django_blog.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -222,24 +257,94 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'django_blog.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
+# Cache configuration (see django_blog/cache.py for the CACHE_URL schemes).
+# Workers must share the cache, so outside DEBUG the default is a directory on
+# local disk and locmem:// (per process) is refused; web and worker processes
+# on different hosts need db://, redis:// or memcached:// instead.
+CACHE_URL = config('CACHE_URL', default='locmem://' if DEBUG else f'file://{BASE_DIR / "var" / "cache"}')
+CACHE_LOCAL_TIMEOUT = config('CACHE_LOCAL_TIMEOUT', default=5, cast=int)
+CACHES = build_caches(CACHE_URL, local_timeout=CACHE_LOCAL_TIMEOUT, allow_process_local=DEBUG)
+
+# Per-request timing, query, template and cache figures, logged as JSON lines
+# and sent in a Server-Timing header (see django_blog/instrumentation.py).
+# A query shape repeated more than INSTRUMENTATION_REPEAT_THRESHOLD times in
+# one request is logged as a likely N+1 pattern.
+REQUEST_INSTRUMENTATION = config('REQUEST_INSTRUMENTATION', default=False, cast=bool)
+INSTRUMENTATION_REPEAT_THRESHOLD = config('INSTRUMENTATION_REPEAT_THRESHOLD', default=5, cast=int)
+
+# Prometheus metrics at /metrics (see django_blog/metrics.py). With several
+# processes, point METRICS_DIR at a directory they all share (and empty it on
+# deploy) so a scrape of any worker reports totals for all of them.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+# Scrapers must send "Authorization: Bearer <METRICS_TOKEN>"; with no token
+# set, /metrics only answers while DEBUG is on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Seconds the database-backed gauges (comment and newsletter backlogs) are cached
+METRICS_BACKLOG_TIMEOUT = config('METRICS_BACKLOG_TIMEOUT', default=30, cast=int)
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'django_blog.metrics.MetricsMiddleware')
+if REQUEST_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'django_blog.instrumentation.InstrumentationMiddleware')
+    TEMPLATES[0]['BACKEND'] = 'django_blog.instrumentation.InstrumentedTemplates'
+if REQUEST_INSTRUMENTATION or METRICS_ENABLED:
+    CACHES = instrument_caches(CACHES)
+
+# Homepage sidebar blocks (see blog/sidebar.py) are recomputed when their
+# content changes; the cache entry also expires after this many seconds
+SIDEBAR_TIMEOUT = config('SIDEBAR_TIMEOUT', default=300, cast=int)
+
+# Full-page cache for anonymous readers (see blog/page_cache.py); pages are
+# retired as soon as their content changes, this only bounds view-count lag
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=600, cast=int)
+
+# Feeds and sitemaps (see blog/feeds.py and blog/sitemaps.py). Sitemaps are
+# split into primary-key ranges of SITEMAP_CHUNK_SIZE rows.
+FEED_ITEM_COUNT = 20
+SITEMAP_CHUNK_SIZE = config('SITEMAP_CHUNK_SIZE', default=10000, cast=int)
+# Optional static copies written by `manage.py export_syndication`; when set,
+# WhiteNoise serves this directory at the site root ahead of the views
+SYNDICATION_ROOT = config('SYNDICATION_ROOT', default='')
+if SYNDICATION_ROOT:
+    WHITENOISE_ROOT = SYNDICATION_ROOT
+
 # Rate limiting settings (for production use with django-ratelimit)
 RATELIMIT_ENABLE = True
-RATELIMIT_USE_CACHE = 'default'
+# Counters must be exact across workers, so skip the per-process tier
+RATELIMIT_USE_CACHE = 'shared'
+
+# Post view counting: views are buffered per worker and flushed in bulk every
+# VIEW_COUNT_FLUSH_INTERVAL seconds (0 writes every view straight through)
+VIEW_COUNT_FLUSH_INTERVAL = config('VIEW_COUNT_FLUSH_INTERVAL', default=30, cast=int)
+VIEW_COUNT_BUFFER_DIR = config('VIEW_COUNT_BUFFER_DIR', default=str(BASE_DIR / 'var' / 'view_counts'))
+
+# Newsletter delivery queue (python manage.py send_newsletters). Failed
+# addresses are retried after NEWSLETTER_RETRY_DELAY seconds, doubling each time
+NEWSLETTER_WORKERS = config('NEWSLETTER_WORKERS', default=2, cast=int)
+NEWSLETTER_BATCH_SIZE = config('NEWSLETTER_BATCH_SIZE', default=50, cast=int)
+NEWSLETTER_MAX_ATTEMPTS = config('NEWSLETTER_MAX_ATTEMPTS', default=5, cast=int)
+NEWSLETTER_RETRY_DELAY = config('NEWSLETTER_RETRY_DELAY', default=60, cast=int)
+NEWSLETTER_LEASE_SECONDS = config('NEWSLETTER_LEASE_SECONDS', default=300, cast=int)
+
+# Admin dashboard statistics are cached for DASHBOARD_STATS_TTL seconds, then
+# served stale for up to DASHBOARD_STATS_STALE_TTL more while one refresh runs
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=60, cast=int)
+DASHBOARD_STATS_STALE_TTL = config('DASHBOARD_STATS_STALE_TTL', default=600, cast=int)
+
+# Keyset-paginated listings (see django_blog/pagination.py) cache their total
+# row count for this many seconds instead of counting on every page
+PAGINATION_COUNT_TIMEOUT = config('PAGINATION_COUNT_TIMEOUT', default=300, cast=int)
 
-# Cache configuration for better performance
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-        }
-    }
-}
 # Blog settings
 BLOG_NAME = config('BLOG_NAME')
 BLOG_DESCRIPTION = config('BLOG_DESCRIPTION')
@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with no read replicas. Configured replicas mirror the test
+    database, and reading through a second connection would only lock up
+    against each test's transaction; tests of the router name their own.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._replicas_override = override_settings(DATABASE_REPLICAS=[])
+        self._replicas_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._replicas_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -102,10 +102,8 @@ function setupSearchForm() {
         searchInput.addEventListener('input', function() {
             clearTimeout(searchTimeout);
             searchTimeout = setTimeout(() => {
-                if (this.value.length >= 3) {
-                    performSearch(this.value);
-                }
-            }, 500);
+                performSearch(this.value.trim());
+            }, 150);
         });
     }
 }
@@ -151,19 +149,37 @@ function setupImageLazyLoading() {
 }
 
 function performSearch(query) {
-    // This would typically make an AJAX call to search
-    console.log('Searching for:', query);
-    
-    // Show search suggestions or results
+    const searchForm = document.getElementById('searchForm');
     const searchResults = document.getElementById('searchResults');
-    if (searchResults) {
-        searchResults.innerHTML = '<div class="search-loading">Searching...</div>';
-        
-        // Simulate search delay
-        setTimeout(() => {
-            searchResults.innerHTML = '<div class="search-message">Search functionality would be implemented here</div>';
-        }, 500);
+    if (!searchForm || !searchResults) {
+        return;
     }
+    
+    if (query.length < 2) {
+        searchResults.classList.add('hidden');
+        searchResults.innerHTML = '';
+        return;
+    }
+    
+    fetch(searchForm.dataset.suggestUrl + '?q=' + encodeURIComponent(query))
+        .then(response => response.json())
+        .then(data => {
+            searchResults.innerHTML = '';
+            data.suggestions.forEach(suggestion => {
+                const link = document.createElement('a');
+                link.href = suggestion.url;
+                link.className = 'flex items-center px-4 py-2 text-sm text-gray-700 hover:bg-gray-100';
+                const icon = document.createElement('i');
+                icon.className = (suggestion.type === 'tag' ? 'fas fa-tag' : 'fas fa-file-alt') + ' mr-2 text-gray-400';
+                link.appendChild(icon);
+                link.appendChild(document.createTextNode(suggestion.label));
+                searchResults.appendChild(link);
+            });
+            searchResults.classList.toggle('hidden', data.suggestions.length === 0);
+        })
+        .catch(() => {
+            searchResults.classList.add('hidden');
+        });
 }
 
 function showMessage(message, type) {
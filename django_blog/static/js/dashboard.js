@@ -1,23 +1,44 @@
 // Dashboard JavaScript
 document.addEventListener('DOMContentLoaded', function() {
-    // Animate stat numbers on load
-    animateStatNumbers();
-    
-    // Auto-refresh dashboard data every 5 minutes
-    setInterval(refreshDashboardData, 300000);
-    
-    // Add click handlers for quick actions
+    const dashboard = document.getElementById('dashboard');
+    const initial = JSON.parse(document.getElementById('dashboard-stats').textContent);
+
+    // The page is served from the cached snapshot; without one, fetch it now
+    if (initial) {
+        renderDashboard(initial);
+        animateStatNumbers();
+    } else {
+        refreshDashboardData(dashboard, true);
+    }
+
+    // Refresh the widgets every minute
+    setInterval(() => refreshDashboardData(dashboard, false), 60000);
+
+    // Add hover effects to stat cards
     setupQuickActions();
 });
 
+function setupQuickActions() {
+    const statCards = document.querySelectorAll('.stat-card');
+    statCards.forEach(card => {
+        card.addEventListener('mouseenter', function() {
+            this.style.boxShadow = '0 5px 20px rgba(0, 0, 0, 0.15)';
+        });
+
+        card.addEventListener('mouseleave', function() {
+            this.style.boxShadow = '0 2px 10px rgba(0, 0, 0, 0.1)';
+        });
+    });
+}
+
 function animateStatNumbers() {
     const statNumbers = document.querySelectorAll('.stat-number');
-    
+
     statNumbers.forEach(stat => {
         const finalValue = parseInt(stat.textContent);
         let currentValue = 0;
         const increment = finalValue / 50;
-        
+
         const timer = setInterval(() => {
             currentValue += increment;
             if (currentValue >= finalValue) {
@@ -30,41 +51,119 @@ function animateStatNumbers() {
     });
 }
 
-function refreshDashboardData() {
-    // This would typically make an AJAX call to refresh dashboard data
-    console.log('Refreshing dashboard data...');
-    
+function refreshDashboardData(dashboard, animate) {
     // Add a subtle indicator that data is being refreshed
     const header = document.querySelector('.dashboard-header');
     if (header) {
         header.style.opacity = '0.7';
-        setTimeout(() => {
-            header.style.opacity = '1';
-        }, 500);
     }
-}
 
-function setupQuickActions() {
-    // Add hover effects to stat cards
-    const statCards = document.querySelectorAll('.stat-card');
-    statCards.forEach(card => {
-        card.addEventListener('mouseenter', function() {
-            this.style.boxShadow = '0 5px 20px rgba(0, 0, 0, 0.15)';
-        });
-        
-        card.addEventListener('mouseleave', function() {
-            this.style.boxShadow = '0 2px 10px rgba(0, 0, 0, 0.1)';
+    fetch(dashboard.dataset.statsUrl, {headers: {'Accept': 'application/json'}})
+        .then(response => response.json())
+        .then(stats => {
+            renderDashboard(stats);
+            if (animate) {
+                animateStatNumbers();
+            }
+        })
+        .catch(error => console.error('Refreshing dashboard data failed:', error))
+        .finally(() => {
+            if (header) {
+                header.style.opacity = '1';
+            }
         });
-    });
-    
-    // Add click handlers for recent items
-    const recentItems = document.querySelectorAll('.recent-item');
-    recentItems.forEach(item => {
-        item.addEventListener('click', function() {
-            // This would navigate to the item's detail page
-            console.log('Clicked on:', this.querySelector('.item-title').textContent);
+}
+
+function formatDate(value) {
+    return new Date(value).toLocaleDateString('en-US', {month: 'short', day: '2-digit', year: 'numeric'});
+}
+
+function listItem(title, meta, badgeClass, badgeText) {
+    const item = document.createElement('li');
+    item.className = 'recent-item';
+
+    const text = document.createElement('div');
+    const titleElement = document.createElement('div');
+    titleElement.className = 'item-title';
+    titleElement.textContent = title;
+    const metaElement = document.createElement('div');
+    metaElement.className = 'item-meta';
+    metaElement.textContent = meta;
+    text.append(titleElement, metaElement);
+    item.appendChild(text);
+
+    if (badgeText) {
+        const badge = document.createElement('span');
+        badge.className = 'item-badge ' + badgeClass;
+        badge.textContent = badgeText;
+        item.appendChild(badge);
+    }
+    return item;
+}
+
+function renderList(name, items, toItem) {
+    const list = document.querySelector(`[data-widget="${name}"]`);
+    const section = document.querySelector(`[data-section="${name}"]`);
+    if (section) {
+        section.hidden = items.length === 0;
+    }
+    if (items.length === 0 && list.dataset.emptyTitle) {
+        list.replaceChildren(listItem(list.dataset.emptyTitle, list.dataset.emptyMeta));
+    } else {
+        list.replaceChildren(...items.map(toItem));
+    }
+}
+
+function renderTrend(series) {
+    const grid = document.querySelector('[data-widget="trend_series"]');
+    grid.replaceChildren(...series.map(entry => {
+        const chart = document.createElement('div');
+        chart.className = 'trend-chart';
+
+        const header = document.createElement('div');
+        header.className = 'trend-header';
+        const label = document.createElement('span');
+        label.className = 'item-title';
+        label.textContent = entry.label;
+        const total = document.createElement('span');
+        total.className = 'item-meta';
+        total.textContent = entry.total;
+        header.append(label, total);
+
+        const bars = document.createElement('div');
+        bars.className = 'trend-bars';
+        entry.days.forEach(day => {
+            const bar = document.createElement('div');
+            bar.className = 'trend-bar';
+            bar.style.height = Math.round(100 * day.value / entry.peak) + '%';
+            // Plain dates; read them as local days, not UTC midnight
+            bar.title = `${formatDate(day.date + 'T00:00:00')}: ${day.value}`;
+            bars.appendChild(bar);
         });
-        
-        item.style.cursor = 'pointer';
+
+        chart.append(header, bars);
+        return chart;
+    }));
+}
+
+function renderDashboard(stats) {
+    document.querySelectorAll('[data-stat]').forEach(element => {
+        element.textContent = stats[element.dataset.stat];
     });
-}
\ No newline at end of file
+
+    renderTrend(stats.trend_series);
+    renderList('recent_posts', stats.recent_posts, post => listItem(
+        post.title, `by ${post.author} • ${formatDate(post.created_at)}`,
+        'badge-' + post.status, post.status_display,
+    ));
+    renderList('recent_comments', stats.recent_comments, comment => listItem(
+        comment.name, `on "${comment.post_title}" • ${formatDate(comment.created_at)}`,
+        comment.approved ? 'badge-approved' : 'badge-pending', comment.approved ? 'Approved' : 'Pending',
+    ));
+    renderList('trending_posts', stats.trending_posts, post => listItem(
+        post.title, `by ${post.author}`, 'badge-published', `${post.views} views`,
+    ));
+    renderList('most_commented', stats.most_commented, post => listItem(
+        post.title, `by ${post.author}`, 'badge-approved', `${post.comments} comments`,
+    ));
+}